@@ -0,0 +1,384 @@
+"""
+김프봇 리플레이/백테스트
+
+기록된 시세(티커/오더북/펀딩비/환율, JSONL 또는 bot.py 레코더 디렉토리)를 가짜 거래소 객체로 흘려보내
+bot.py 의 레이어 함수(run_spread_arbitrage / run_krw_cross_arb / funding_arbitrage_signals)를
+그대로 실행한다. 시간은 시뮬레이션 시계(bot.now_ts 교체)로 진행하므로 실시간보다 훨씬 빠름.
+결과는 kimchi_bot_trades.csv 와 같은 포맷으로 기록.
+
+입력 (JSONL, ts 오름차순): 한 줄에 이벤트 하나
+  {"ts": 1700000000.0, "venue": "upbit", "kind": "ticker", "symbol": "BTC/KRW",
+   "data": {"bid": ..., "ask": ..., "last": ...}}
+  kind: ticker | orderbook ({"bids": [[p, v]], "asks": [[p, v]]}) | funding ({"fundingRate": x}) | fx ({"rate": x})
+  venue: binance / upbit / bithumb / bybit / okx / binance_fut / bybit_fut / okx_fut
+
+사용 예:
+  python backtest.py md.jsonl --out backtest_trades.csv --set TIER1_THR_MIN=0.7 --set Z_SCORE_THR=1.2
+
+--set / --config: 리플레이 경로에서 쓰이는 CONFIG 키는 모두 반영 (임계값, 비율, z-score 창, 변동성 봉/반감기,
+예측 모델 학습률, 레이어 스케줄 등). 레이트리밋/헬스/웹소켓/워커 프로세스/레코더/메트릭/텔레그램 키는
+리플레이에서 꺼져 있어 효과가 없으므로 거부 (REPLAY_FIXED_KEYS / REPLAY_FIXED_PREFIXES).
+"""
+import os, sys, json, argparse
+from datetime import datetime, timezone
+
+# bot.py 는 import 시 API 키 환경변수를 요구 → 리플레이에서는 실제 거래소에 붙지 않으므로 더미값
+for _k in [
+    "BINANCE_API_KEY", "BINANCE_SECRET", "UPBIT_API_KEY", "UPBIT_SECRET",
+    "BITHUMB_API_KEY", "BITHUMB_SECRET", "BYBIT_API_KEY", "BYBIT_SECRET",
+    "OKX_API_KEY", "OKX_SECRET", "OKX_PASSWORD", "TELEGRAM_TOKEN", "CHAT_ID",
+]:
+    os.environ.setdefault(_k, "replay")
+
+import bot
+
+SPOT_VENUES = ["binance", "upbit", "bithumb", "bybit", "okx"]
+FUT_VENUES = {"binance_fut": "binanceusdm", "bybit_fut": "bybit", "okx_fut": "okx"}
+
+# 시작 잔고 (--balances JSON 으로 덮어쓰기 가능)
+DEFAULT_BALANCES = {
+    "binance": {"USDT": 10000.0, "BTC": 0.1, "ETH": 2.0},
+    "upbit": {"KRW": 15_000_000.0, "BTC": 0.1, "ETH": 2.0},
+    "bithumb": {"KRW": 15_000_000.0, "BTC": 0.1, "ETH": 2.0},
+    "bybit": {"USDT": 5000.0},
+    "okx": {"USDT": 5000.0},
+    "binance_fut": {"USDT": 5000.0},
+    "bybit_fut": {"USDT": 5000.0},
+    "okx_fut": {"USDT": 5000.0},
+}
+
+###############################################################################
+# SIM CLOCK / MARKET STATE
+###############################################################################
+
+
+class SimClock:
+    def __init__(self, t: float = 0.0):
+        self.t = t
+
+    def now(self) -> float:
+        return self.t
+
+
+class ReplayMarket:
+    """venue/kind/symbol 별 최신 시세 + 일봉 생성을 위한 일별 종가"""
+
+    def __init__(self):
+        self.latest = {}
+        self.daily_close = {}  # (venue, symbol) -> {date: close}
+
+    def apply(self, ev: dict):
+        venue, kind, symbol, data = ev["venue"], ev["kind"], ev.get("symbol"), ev["data"]
+        if kind == "fx":
+            # 환율은 USDT/KRW 티커로 취급 (get_usdt_krw 가 upbit/bithumb USDT/KRW 를 읽음)
+            rate = float(data["rate"])
+            kind, symbol, data = "ticker", "USDT/KRW", {"bid": rate, "ask": rate, "last": rate}
+        self.latest[(venue, kind, symbol)] = (ev["ts"], data)
+        if kind == "ticker" and data.get("last"):
+            day = datetime.fromtimestamp(ev["ts"], tz=timezone.utc).strftime("%Y-%m-%d")
+            self.daily_close.setdefault((venue, symbol), {})[day] = float(data["last"])
+
+    def get(self, venue: str, kind: str, symbol: str):
+        ent = self.latest.get((venue, kind, symbol))
+        if ent is None:
+            raise Exception(f"[REPLAY] no {kind} for {venue} {symbol}")
+        return ent
+
+
+###############################################################################
+# STAND-IN EXCHANGE
+###############################################################################
+
+
+class ReplayExchange:
+    """ccxt 인스턴스 대신 쓰는 가짜 거래소. bot.py 가 호출하는 메서드만 구현"""
+
+    def __init__(self, name: str, ex_id: str, market: ReplayMarket, clock: SimClock, balances: dict):
+        self.name = name
+        self.id = ex_id
+        self.market = market
+        self.clock = clock
+        self.balance = {a: float(v) for a, v in balances.items()}
+        self.positions = {}
+        self.has = {"fetchTickers": False, "fetchFundingRates": False}
+
+    # --- public ---
+    def fetch_ticker(self, symbol):
+        ts, data = self.market.get(self.name, "ticker", symbol)
+        return {
+            "symbol": symbol,
+            "bid": data.get("bid"),
+            "ask": data.get("ask"),
+            "last": data.get("last"),
+            "timestamp": int(ts * 1000),
+        }
+
+    def fetch_order_book(self, symbol, limit=None):
+        try:
+            ts, data = self.market.get(self.name, "orderbook", symbol)
+        except Exception:
+            # 오더북이 기록되지 않은 심볼: 티커 최우선호가에 물량 제한 없음으로 가정 (체결도 같은 가정)
+            ts, t = self.market.get(self.name, "ticker", symbol)
+            data = {"bids": [[t["bid"], 1e18]], "asks": [[t["ask"], 1e18]]}
+        n = limit or len(data["bids"])
+        return {
+            "symbol": symbol,
+            "bids": [list(x) for x in data["bids"][:n]],
+            "asks": [list(x) for x in data["asks"][:n]],
+            "timestamp": int(ts * 1000),
+        }
+
+    def fetch_funding_rate(self, symbol):
+        ts, data = self.market.get(self.name, "funding", symbol)
+        return {"symbol": symbol, "fundingRate": float(data["fundingRate"]), "timestamp": int(ts * 1000)}
+
+    def fetch_ohlcv(self, symbol, timeframe="1d", limit=2):
+        closes = self.market.daily_close.get((self.name, symbol), {})
+        days = sorted(closes)[-limit:]
+        out = []
+        for d in days:
+            ts = datetime.strptime(d, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000
+            c = closes[d]
+            out.append([int(ts), c, c, c, c, 0.0])
+        return out
+
+    # --- private ---
+    def fetch_balance(self):
+        free = dict(self.balance)
+        return {"free": free, "total": dict(free)}
+
+    def _fill_price(self, symbol, is_buy, amount):
+        try:
+            ob = self.fetch_order_book(symbol)
+            px = bot.calc_vwap(ob, amount, is_buy)
+            if px:
+                return px
+        except Exception:
+            pass
+        t = self.fetch_ticker(symbol)
+        return float((t["ask"] if is_buy else t["bid"]) or t["last"])
+
+    def _create(self, symbol, side, amount):
+        is_buy = side == "buy"
+        price = self._fill_price(symbol, is_buy, amount)
+        cost = price * amount
+        fee = cost * bot.FEE_RATES.get(self.name.replace("_fut", ""), bot.DEFAULT_FEE_RATE)
+        if ":" in symbol:
+            # 선물: 포지션만 기록, 수수료는 증거금(USDT)에서 차감
+            sign = 1 if is_buy else -1
+            self.positions[symbol] = self.positions.get(symbol, 0.0) + sign * amount
+            self.balance["USDT"] = self.balance.get("USDT", 0.0) - fee
+        else:
+            base, quote = symbol.split("/")
+            if is_buy:
+                self.balance[base] = self.balance.get(base, 0.0) + amount
+                self.balance[quote] = self.balance.get(quote, 0.0) - cost - fee
+            else:
+                self.balance[base] = self.balance.get(base, 0.0) - amount
+                self.balance[quote] = self.balance.get(quote, 0.0) + cost - fee
+        return {"symbol": symbol, "side": side, "amount": amount, "filled": amount,
+                "average": price, "cost": cost, "timestamp": int(self.clock.now() * 1000)}
+
+    def create_market_buy_order(self, symbol, amount):
+        return self._create(symbol, "buy", amount)
+
+    def create_market_sell_order(self, symbol, amount):
+        return self._create(symbol, "sell", amount)
+
+
+###############################################################################
+# EVENTS
+###############################################################################
+
+
+def _recorded_day_events(day_dir: str):
+    """bot.MarketRecorder 하루치 디렉토리 → 이벤트 dict 목록"""
+    events = []
+    for table in bot.RECORDER_TABLES:
+        arr, meta = bot.load_recorded_table(day_dir, table)
+        if arr is None:
+            continue
+        venues, symbols = meta["venues"], meta["symbols"]
+        for r in arr:
+            ts, venue = float(r["ts"]), venues[int(r["venue"])]
+            if table == "fx":
+                events.append({"ts": ts, "venue": venue, "kind": "fx", "symbol": None,
+                               "data": {"rate": float(r["rate"])}})
+                continue
+            symbol = symbols[int(r["symbol"])]
+            if table == "ticker":
+                data = {k: (None if r[k] != r[k] else float(r[k])) for k in ("bid", "ask", "last")}
+            elif table == "book":
+                n = int(r["n"])
+                data = {
+                    "bids": [[float(p), float(v)] for p, v in zip(r["bid_px"][:n], r["bid_qty"][:n])],
+                    "asks": [[float(p), float(v)] for p, v in zip(r["ask_px"][:n], r["ask_qty"][:n])],
+                }
+            else:
+                data = {"fundingRate": float(r["rate"])}
+            events.append({"ts": ts, "venue": venue, "symbol": symbol, "data": data,
+                           "kind": {"ticker": "ticker", "book": "orderbook", "funding": "funding"}[table]})
+    return events
+
+
+def load_events(path: str):
+    """
+    이벤트를 ts 순으로 리턴.
+    path 가 파일이면 JSONL, 디렉토리면 bot.MarketRecorder 기록 (루트 또는 날짜 디렉토리).
+    """
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, "meta.json")):
+            day_dirs = [path]
+        else:
+            day_dirs = [os.path.join(path, d) for d in sorted(os.listdir(path))
+                        if os.path.exists(os.path.join(path, d, "meta.json"))]
+        events = []
+        for d in day_dirs:
+            events += _recorded_day_events(d)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    events.sort(key=lambda ev: ev["ts"])
+    return events
+
+
+###############################################################################
+# SETUP / RUN
+###############################################################################
+
+
+# 리플레이에서 효과가 없는 키 → --set 거부
+# - setup_bot 이 고정하는 스위치 (레이트리밋/헬스/웹소켓은 꺼짐, 주문은 항상 가짜 거래소로)
+# - 실시간 운영에만 쓰이는 설정 (웹소켓, 워커 프로세스, 레코더, 메트릭, 텔레그램, markets 캐시, 자산 갱신 스레드)
+REPLAY_FIXED_KEYS = {"DRY_RUN", "WS_ENABLED", "RATE_LIMIT_ENABLED", "HEALTH_ENABLED", "EQUITY_REFRESH_SEC"}
+REPLAY_FIXED_PREFIXES = (
+    "WS_", "RATE_LIMIT", "HEALTH_", "HEDGE_", "MP_", "RECORDER_", "METRICS_", "TELEGRAM_", "MARKETS_CACHE_",
+)
+
+
+def apply_overrides(overrides: dict):
+    """
+    CONFIG 키를 bot 모듈 전역값에 반영 (임계값 변경 실험용).
+    나머지 키는 모두 반영됨: 호출 시점에 전역값을 읽거나, 아래 rebuild_config_objects 로 다시 만드는 객체.
+    """
+    for k, v in overrides.items():
+        if k not in bot.CONFIG:
+            raise SystemExit(f"[REPLAY] unknown config key {k}")
+        if k in REPLAY_FIXED_KEYS or k.startswith(REPLAY_FIXED_PREFIXES):
+            raise SystemExit(f"[REPLAY] config key {k} has no effect in replay")
+        bot.CONFIG[k] = v
+        setattr(bot, k, v)
+    rebuild_config_objects()
+
+
+def rebuild_config_objects():
+    """
+    설정값을 import / 생성 시점에 잡아 두는 객체를 현재 전역값으로 다시 만듦.
+    - FUNDING_MAX_HOURS_HOLD: 다른 키에서 계산되는 파생값
+    - PREMIUM_MODEL: 학습률/L2 를 생성 시점에 보관
+    - VolEngine / RollingWindow (가격·프리미엄 이력): 봉 길이·창 크기를 생성 시점에 보관 → 비워서 첫 사용 때 새로 생성
+    """
+    bot.FUNDING_MAX_HOURS_HOLD = bot.FUNDING_TARGET_PAYMENTS * bot.FUNDING_INTERVAL_HOURS
+    bot.PREMIUM_MODEL = bot.OnlineLogit(len(bot.PRED_FEATURES))
+    for d in (bot.VOL_ENGINES, bot.price_history, bot.SPREAD_PREM_HISTORY, bot.KRW_PREM_HISTORY):
+        d.clear()
+
+
+def setup_bot(clock: SimClock, market: ReplayMarket, balances: dict, out_csv: str, state_file: str):
+    bot.now_ts = clock.now
+    bot.send_telegram = lambda msg: None
+    bot.DRY_RUN = False  # 주문은 가짜 거래소로만 감 → 체결/잔고 원장까지 실제 경로로 시뮬레이션
+    bot.WS_ENABLED = False
+    bot.RATE_LIMIT_ENABLED = False  # 시뮬레이션 시계와 무관하게 실시간으로 대기하게 되므로 끔
+    bot.HEALTH_ENABLED = False  # 리플레이 호출은 즉시 끝나므로 hedge / 타임아웃 / 가중치 불필요
+    bot.TRADE_LOG_FILE = out_csv
+    bot.TRADE_LOG_COLUMNAR_DIR = os.path.splitext(out_csv)[0] + "_npy"
+    bot.STATE_DB_FILE = state_file
+    bot.STATE_FILE = os.path.splitext(state_file)[0] + ".json"  # 구버전 JSON 이전 방지
+    for path in (state_file, state_file + "-wal", state_file + "-shm", bot.STATE_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+    bot.ex = {
+        name: ReplayExchange(name, name, market, clock, balances.get(name, {}))
+        for name in SPOT_VENUES
+    }
+    bot.ex_fut = {
+        name: ReplayExchange(name, ex_id, market, clock, balances.get(name, {}))
+        for name, ex_id in FUT_VENUES.items()
+    }
+    bot.load_state()
+    bot.init_trade_log()
+
+
+def run_replay(events, clock: SimClock, market: ReplayMarket, layers=("spread", "krw", "funding"), warmup_sec: float = 60.0):
+    """이벤트를 시간순으로 적용하면서 레이어별 cadence 에 맞춰 bot.run_layers 실행"""
+    layers = [n for n in layers if bot.layer_enabled(n)]
+    trade_times = []
+    if not events:
+        return trade_times
+    start = events[0]["ts"] + warmup_sec
+    next_due = {n: start for n in layers}
+    n_runs = 0
+    for ev in events:
+        while next_due and ev["ts"] >= min(next_due.values()):
+            t = min(next_due.values())
+            clock.t = t
+            due = [n for n in layers if next_due[n] <= t]
+            if n_runs == 0:
+                bot.reconcile_balances(force=True)
+            try:
+                bot.run_layers(due, trade_times)
+            except Exception as e:
+                print(f"[REPLAY ERR] {e}")
+            n_runs += 1
+            for n in due:
+                next_due[n] = t + bot.layer_interval(n)
+        clock.t = ev["ts"]
+        market.apply(ev)
+    print(f"[REPLAY] {len(events)} events, {n_runs} layer runs, {len(trade_times)} trades")
+    return trade_times
+
+
+def main():
+    ap = argparse.ArgumentParser(description="kimchi bot market-data replay")
+    ap.add_argument("events", help="recorded market data (JSONL file or recorder directory)")
+    ap.add_argument("--out", default="backtest_trades.csv")
+    ap.add_argument("--state", default="backtest_state.db")
+    ap.add_argument("--balances", help="JSON file: {venue: {asset: amount}}")
+    ap.add_argument("--config", help="JSON file with CONFIG overrides")
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                    help="CONFIG override, VALUE parsed as JSON")
+    ap.add_argument("--layers", default="spread,krw,funding")
+    args = ap.parse_args()
+
+    overrides = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            overrides.update(json.load(f))
+    for kv in args.set:
+        k, v = kv.split("=", 1)
+        try:
+            overrides[k] = json.loads(v)
+        except ValueError:
+            overrides[k] = v
+    apply_overrides(overrides)
+
+    balances = DEFAULT_BALANCES
+    if args.balances:
+        with open(args.balances, "r", encoding="utf-8") as f:
+            balances = {**DEFAULT_BALANCES, **json.load(f)}
+
+    events = load_events(args.events)
+    clock, market = SimClock(events[0]["ts"] if events else 0.0), ReplayMarket()
+    setup_bot(clock, market, balances, args.out, args.state)
+    run_replay(events, clock, market, layers=tuple(args.layers.split(",")))
+    bot.close_trade_log()
+    bot.flush_state()
+    print(
+        f"[REPLAY RESULT] trades={bot.STATE['num_trades']} "
+        f"pnl={bot.STATE['realized_pnl_krw']:.0f} fees={bot.STATE['fees_krw']:.0f} → {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+김프봇 핫패스 마이크로 벤치마크
+
+bot.py 의 순수 계산 함수(calc_vwap / BookIndex / orderbook_imbalance / update_premium_history / VolEngine /
+z_score_filter / auto_tier1_params / can_trade_more / 스프레드 프리미엄 엔진)를
+합성 오더북/히스토리로 반복 실행해서 호출당 시간(ns)을 잰다.
+결과는 JSON 으로 저장하고, 기준 파일(baseline)과 비교해 느려진 항목이 있으면 exit 1.
+bench_baseline.json 은 저장소에 커밋된 기준값 (측정 환경과 허용치 tolerance 포함).
+--ci 에서는 기준 파일이 없거나 params/항목이 안 맞으면 비교 불가로 보고 exit 2.
+
+사용 예:
+  python bench_bot.py                                  # bench_results.json 기록 + bench_baseline.json 과 비교
+  python bench_bot.py --ci                             # CI: 기준 없음/불일치도 실패 처리
+  python bench_bot.py --save-baseline --tolerance 0.5  # 현재 결과를 기준으로 저장 (허용치 같이 기록)
+  python bench_bot.py --depth 20 --symbols 200 --tolerance 0.3
+"""
+import os, sys, io, json, time, random, argparse, platform, statistics, contextlib
+
+# bot.py 는 import 시 API 키 환경변수를 요구 → 벤치에서는 거래소에 붙지 않으므로 더미값
+for _k in [
+    "BINANCE_API_KEY", "BINANCE_SECRET", "UPBIT_API_KEY", "UPBIT_SECRET",
+    "BITHUMB_API_KEY", "BITHUMB_SECRET", "BYBIT_API_KEY", "BYBIT_SECRET",
+    "OKX_API_KEY", "OKX_SECRET", "OKX_PASSWORD", "TELEGRAM_TOKEN", "CHAT_ID",
+]:
+    os.environ.setdefault(_k, "bench")
+
+import bot
+
+BENCH_FORMAT = 1
+DEFAULT_TOLERANCE = 0.25
+
+
+###############################################################################
+# SYNTHETIC DATA
+###############################################################################
+
+
+def synth_book(rng: random.Random, mid: float, depth: int, tick: float = 0.0001) -> dict:
+    bids, asks = [], []
+    for k in range(depth):
+        bids.append([mid * (1 - tick * (k + 1)), rng.uniform(0.05, 2.0)])
+        asks.append([mid * (1 + tick * (k + 1)), rng.uniform(0.05, 2.0)])
+    return {"bids": bids, "asks": asks}
+
+
+def synth_snapshot(rng: random.Random, n_symbols: int, depth: int, usdt_krw: float) -> dict:
+    np = bot.np
+    V = len(bot.SPREAD_VENUES)
+    symbols = [f"S{i}" for i in range(n_symbols)]
+    snap = {
+        "symbols": symbols,
+        "base_usdt": np.array([rng.uniform(0.1, 60000.0) for _ in symbols]),
+        "amount": np.full((n_symbols, V), np.nan),
+        "bids_px": np.full((n_symbols, V, depth), np.nan),
+        "bids_qty": np.zeros((n_symbols, V, depth)),
+        "asks_px": np.full((n_symbols, V, depth), np.nan),
+        "asks_qty": np.zeros((n_symbols, V, depth)),
+    }
+    for i in range(n_symbols):
+        for j in range(V):
+            mid = snap["base_usdt"][i] * usdt_krw * (1 + rng.uniform(-0.01, 0.01))
+            ob = synth_book(rng, mid, depth)
+            snap["amount"][i, j] = bot.SPREAD_TEST_NOTIONAL_KRW / mid
+            for side in ("bids", "asks"):
+                snap[side + "_px"][i, j] = [p for p, _ in ob[side]]
+                snap[side + "_qty"][i, j] = [q * max(1.0, bot.SPREAD_TEST_NOTIONAL_KRW / mid) for _, q in ob[side]]
+    return snap
+
+
+###############################################################################
+# TIMING
+###############################################################################
+
+
+def measure(fn, min_time: float, repeat: int) -> dict:
+    """fn() 을 min_time 초 이상 걸리도록 반복 → repeat 번 측정, 호출당 ns (median / min)"""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time:
+            break
+        n *= 2 if dt <= 0 else max(2, min(10, int(min_time / dt) + 1))
+    samples = [dt / n * 1e9]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        samples.append((time.perf_counter() - t0) / n * 1e9)
+    return {"ns_per_call": statistics.median(samples), "min_ns": min(samples), "loops": n, "repeat": repeat}
+
+
+def build_cases(args) -> dict:
+    rng = random.Random(args.seed)
+    usdt_krw = 1400.0
+    ob = synth_book(rng, 84_000_000.0, args.depth)
+    amount = sum(q for _, q in ob["bids"]) * 0.6
+    bids_idx = bot.BookIndex(ob["bids"], is_ask=False)
+    asks_idx = bot.BookIndex(ob["asks"], is_ask=True)
+    bin_idx = bot.BookIndex(synth_book(rng, 60_000.0, args.depth)["asks"], is_ask=True)
+
+    # 히스토리: 벤치 전용 dict 에 window 만큼 채워둠
+    hist = {}
+    for _ in range(args.history):
+        bot.update_premium_history(hist, "BTC", rng.gauss(0.5, 0.3))
+    prem_stream = [rng.gauss(0.5, 0.3) for _ in range(1024)]
+    pos = [0]
+
+    def update_history():
+        pos[0] = (pos[0] + 1) & 1023
+        bot.update_premium_history(hist, "BTC", prem_stream[pos[0]])
+
+    vol_eng = bot.VolEngine()
+    vol_clock = [bot.now_ts()]
+
+    def vol_update():
+        vol_clock[0] += 1.0
+        vol_eng.update(vol_clock[0], prem_stream[pos[0]] + 60_000.0)
+        pos[0] = (pos[0] + 1) & 1023
+
+    now = bot.now_ts()
+    trade_times = sorted(now - rng.uniform(0, 7200) for _ in range(args.trades))
+
+    cases = {
+        "calc_vwap": lambda: bot.calc_vwap(ob, amount, False),
+        "book_index_build": lambda: bot.BookIndex(ob["bids"], is_ask=False),
+        "book_index_vwap": lambda: bids_idx.vwap(amount),
+        "book_index_size_for_slippage": lambda: asks_idx.size_for_slippage(bot.SLIPPAGE_LIMIT_PCT),
+        "solve_spread_size": lambda: bot.solve_spread_size(bids_idx, bin_idx, usdt_krw, "SELL", bot.EDGE_MIN_NET_PCT, amount),
+        "orderbook_imbalance": lambda: bot.orderbook_imbalance(ob),
+        "update_premium_history": update_history,
+        "vol_engine_update": vol_update,
+        "z_score_filter": lambda: bot.z_score_filter(hist, "BTC", 1.4),
+        "auto_tier1_params": lambda: bot.auto_tier1_params(2.5, trade_times),
+        "can_trade_more": lambda: bot.can_trade_more(trade_times),
+    }
+    if bot.np is not None:
+        snap = synth_snapshot(rng, args.symbols, args.depth, usdt_krw)
+        bot.SPREAD_PREM_HISTORY.clear()
+        cases["book_vwap_matrix"] = lambda: bot._book_vwap(snap["bids_px"], snap["bids_qty"], snap["amount"])
+        cases["spread_premium_engine"] = lambda: bot.spread_premium_engine(snap, usdt_krw, 0.8, 0.4)
+        cases["update_premium_features"] = lambda: bot.update_premium_features(snap, usdt_krw)
+        cases["predict_premium_prob"] = lambda: bot.predict_premium_prob(2.5, snap["symbols"][0])
+    return cases
+
+
+###############################################################################
+# BASELINE
+###############################################################################
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    baseline 대비 ns_per_call 이 (1 + tolerance) 배를 넘는 항목 → (regressions, 비교 못 한 항목/사유)
+    """
+    regressions, unmatched = [], []
+    if baseline.get("params") != results["params"]:
+        print(f"[BENCH] baseline params differ: {baseline.get('params')} vs {results['params']}")
+        unmatched.append("params")
+    for name, cur in results["results"].items():
+        ref = baseline.get("results", {}).get(name)
+        if ref is None:
+            print(f"[BENCH] {name:32s} (no baseline)")
+            unmatched.append(name)
+            continue
+        ratio = cur["ns_per_call"] / ref["ns_per_call"] if ref["ns_per_call"] > 0 else 1.0
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"[BENCH] {name:32s} {ref['ns_per_call']:12.0f} → {cur['ns_per_call']:12.0f} ns  x{ratio:.2f} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions, unmatched
+
+
+def main():
+    ap = argparse.ArgumentParser(description="kimchi bot hot-path micro benchmarks")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", default="bench_baseline.json")
+    ap.add_argument("--save-baseline", action="store_true", help="write results to --baseline instead of comparing")
+    ap.add_argument("--tolerance", type=float,
+                    help=f"allowed slowdown vs baseline (0.25 = +25%%). default: baseline's own, else {DEFAULT_TOLERANCE}")
+    ap.add_argument("--ci", action="store_true", help="exit 2 when the baseline is missing or does not match")
+    ap.add_argument("--depth", type=int, default=15, help="order book levels per side")
+    ap.add_argument("--symbols", type=int, default=120, help="symbols in the premium matrix")
+    ap.add_argument("--history", type=int, default=bot.Z_SCORE_WINDOW, help="premium history samples")
+    ap.add_argument("--trades", type=int, default=200, help="entries in trade_times")
+    ap.add_argument("--only", help="comma separated case names")
+    ap.add_argument("--min-time", type=float, default=0.05, help="seconds per sample")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    bot.send_telegram = lambda msg: None
+    bot.store_put = lambda key, value: None  # 모델 가중치 저장은 측정에서 제외
+    cases = build_cases(args)
+    if args.only:
+        wanted = set(args.only.split(","))
+        cases = {k: v for k, v in cases.items() if k in wanted}
+
+    results = {
+        "format": BENCH_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": getattr(bot.np, "__version__", None),
+        "machine": platform.machine(),
+        "params": {k: getattr(args, k) for k in ("depth", "symbols", "history", "trades")},
+        "results": {},
+    }
+    for name, fn in cases.items():
+        # 레이어 함수의 print 는 측정에서 제외 (버림)
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = measure(fn, args.min_time, args.repeat)
+        results["results"][name] = res
+        print(f"[BENCH] {name:32s} {res['ns_per_call']:12.0f} ns/call (min {res['min_ns']:.0f}, loops={res['loops']})")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] results → {args.out}")
+
+    if args.save_baseline:
+        results["tolerance"] = DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[BENCH] baseline saved → {args.baseline} (tolerance {results['tolerance']})")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"[BENCH] no baseline at {args.baseline} (run with --save-baseline)")
+        return 2 if args.ci else 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    tolerance = args.tolerance
+    if tolerance is None:
+        tolerance = baseline.get("tolerance", DEFAULT_TOLERANCE)
+    print(f"[BENCH] baseline {baseline.get('created')} ({baseline.get('machine')}, python {baseline.get('python')}), "
+          f"tolerance {tolerance}")
+    regressions, unmatched = compare(results, baseline, tolerance)
+    if regressions:
+        print(f"[BENCH] {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    if unmatched and args.ci:
+        print(f"[BENCH] not comparable with baseline: {', '.join(unmatched)}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
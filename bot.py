@@ -1,8 +1,22 @@
-import os, time, json, requests, csv
+import os, time, json, math, requests, csv, asyncio, threading, queue, atexit, sqlite3, functools
+from collections import deque
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, groupby
 from datetime import datetime, timezone, date
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import ccxt
 from ccxt.base.errors import AuthenticationError
 
+try:
+    import websockets
+except ImportError:  # 스트리밍은 선택 기능
+    websockets = None
+
+try:
+    import numpy as np
+except ImportError:  # 레코더 등 선택 기능에서만 사용
+    np = None
+
 ###############################################################################
 # SETTINGS (안정형 성장: 월 3~7% 목표)
 # - 일부 파라미터는 config JSON으로 덮어쓰기 가능 (아래 load_config 참고)
@@ -42,12 +56,26 @@ CONFIG = {
 
     # 프리미엄 예측
     "VOL_THRESHOLD_BORDER": 10.0,
+    # 변동성 엔진: 관측 시세를 봉으로 묶어 EWMA / realized vol (일간 % 단위)
+    "VOL_BAR_SEC": 60,
+    "VOL_EWMA_HALFLIFE_BARS": 30,
+    "VOL_RV_BARS": 240,          # realized vol 창 (봉 수)
+    "VOL_MAX_GAP_BARS": 30,      # 이보다 긴 공백은 수익률로 안 씀
+    "VOL_SEED_DAYS": 20,         # 시작 시 1d OHLCV 로 EWMA seed
     "PREMIUM_PRED_WEIGHTS": {
         "upbit_speed": 0.3,
         "bithumb_speed": 0.3,
         "volatility": 0.2,
         "orderbook_imbalance": 0.2,
     },
+    # 온라인 로지스틱 회귀: PRED_HORIZON_SEC 뒤 |프리미엄| 이 PRED_LABEL_MOVE_PCT 이상 커졌는지 학습
+    # 학습 샘플이 PRED_MIN_UPDATES 개 모이기 전에는 위 고정 가중치 점수 사용
+    "PRED_HORIZON_SEC": 60,
+    "PRED_LABEL_MOVE_PCT": 0.05,
+    "PRED_LEARNING_RATE": 0.05,
+    "PRED_L2": 1e-4,
+    "PRED_MIN_UPDATES": 200,
+    "PRED_SAVE_SEC": 300,
 
     # 순엣지 제한
     "EDGE_BUFFER_FEE_PCT": 0.12,
@@ -71,6 +99,136 @@ CONFIG = {
 
     # 환율 fallback
     "FX_FALLBACK_USDT_KRW": 1450.0,
+
+    # 마켓 데이터 동시 fetch (루프 시작 시 prefetch)
+    "FETCH_WORKERS": 16,
+
+    # 웹소켓 시세 스트림 (업비트/빗썸/바이낸스 오더북 + 티커)
+    "WS_ENABLED": False,
+    "WS_MAX_AGE_SEC": 5.0,         # 이보다 오래된 스트림 데이터는 무시 → REST
+    "WS_IDLE_TIMEOUT_SEC": 30.0,   # 이 시간 동안 메시지 없으면 재연결(재동기화)
+    "WS_RECONNECT_MAX_SEC": 30.0,
+    "WS_DEPTH": 15,
+    "WS_URLS": {
+        "upbit": "wss://api.upbit.com/websocket/v1",
+        "bithumb": "wss://ws-api.bithumb.com/websocket/v1",
+        "binance": "wss://stream.binance.com:9443/stream",
+    },
+
+    # 마켓 데이터 캐시 TTL (초). 같은 (거래소, endpoint, 심볼)은 TTL 안에서 1회만 fetch
+    "CACHE_TTL_SEC": {
+        "ticker": 5.0,
+        "orderbook": 3.0,
+        "funding": 60.0,
+        "ohlcv": 900.0,
+    },
+    # 거래소별 fetch_tickers / fetch_funding_rates 1회로 여러 심볼을 받아 위 캐시에 분배
+    "BULK_FETCH_ENABLED": True,
+    "BULK_MIN_SYMBOLS": 2,  # 한 거래소에서 이 개수 이상 필요할 때만 bulk 호출
+
+    # 잔고 원장: 시작 시 1회 seed, 이후 자체 체결로 갱신. 거래소 잔고와는 주기적으로만 대조
+    "BALANCE_RECONCILE_SEC": 300,
+    "BALANCE_DRIFT_PCT": 0.01,     # 대조 시 이 비율 이상 차이나면 drift 로그
+
+    # 텔레그램 알림 (백그라운드 전송)
+    "TELEGRAM_QUEUE_MAX": 500,
+    "TELEGRAM_BATCH_WINDOW_SEC": 1.0,  # 이 시간 안에 쌓인 메시지는 한 번에 전송
+    "TELEGRAM_DEDUP_SEC": 300,         # 같은 에러/리스크 알림은 이 시간 동안 1회만
+    # 중복 억제 대상 접두어 (체결 / 손익 / 리포트 메시지는 같은 내용이어도 전부 전송)
+    "TELEGRAM_DEDUP_PREFIXES": ["[RISK]", "[MAIN ERR]", "[ARB ERR]", "[FUND ARB ERR]"],
+
+    # 2-레그 동시 주문
+    "ORDER_WORKERS": 4,
+    "LEG_MISMATCH_TOL": 0.001,  # 두 레그 체결 수량 차이가 이 비율 이하면 무시
+
+    # 레이어 스케줄: interval(초, null 이면 MAIN_LOOP_INTERVAL) + 오더북 변화 트리거(%)
+    "LAYER_SCHEDULE": {
+        "spread": {"interval": None, "trigger_pct": 0.05},
+        "krw": {"interval": None, "trigger_pct": 0.05},
+        "funding": {"interval": 300},
+        "tri": {"interval": 120},
+    },
+    "SCHEDULER_MIN_GAP_SEC": 2.0,  # 트리거로 인한 같은 레이어 재평가 최소 간격
+
+    # 마켓 데이터 레코더 (오더북/티커/펀딩비/환율 → 일자별 청크 파일)
+    "RECORDER_ENABLED": False,
+    "RECORDER_DIR": "market_data",
+    "RECORDER_CHUNK_ROWS": 4096,
+    "RECORDER_BOOK_DEPTH": 10,
+    "RECORDER_FLUSH_SEC": 60,     # 청크가 덜 찼어도 이 시간 지나면 디스크로
+    "RECORDER_COMPRESS": True,    # 날짜가 바뀌면 지난 날짜 청크를 테이블별 .npz 로 압축
+
+    # 트레이드 로그 (파일 핸들 유지 + 버퍼링)
+    "TRADE_LOG_FLUSH_ROWS": 20,
+    "TRADE_LOG_FLUSH_SEC": 5.0,
+    "TRADE_LOG_MAX_BYTES": 50_000_000,  # 이 크기를 넘거나 UTC 날짜가 바뀌면 rotate
+    "TRADE_LOG_COLUMNAR": True,         # 분석용 .npy 사본도 기록 (numpy 필요)
+    "TRADE_LOG_NPY_CHUNK_ROWS": 1024,   # .npy 청크 행 수 (다 차거나 날짜가 바뀌거나 종료할 때만 파일로)
+
+    # 상태 저장 (SQLite WAL, write-behind)
+    "STATE_WRITE_BEHIND_SEC": 0.5,  # 이 시간 동안 들어온 save_state 는 한 트랜잭션으로 묶음
+
+    # 스프레드 심볼 유니버스 (국내 X/KRW ∩ 바이낸스 X/USDT)
+    "UNIVERSE_AUTO": True,
+    "UNIVERSE_MIN_VOL_KRW": 3_000_000_000,   # 국내 24h 거래대금 하한 (거래소 중 최대값 기준)
+    "UNIVERSE_MIN_VOL_USDT": 2_000_000,      # 바이낸스 24h 거래대금 하한
+    "UNIVERSE_MAX_SYMBOLS": 120,
+    "UNIVERSE_REFRESH_SEC": 3600,
+    "UNIVERSE_REST_BATCH": 20,               # 스트림 없는 심볼은 틱당 이만큼씩 라운드로빈
+    "SPREAD_TEST_NOTIONAL_KRW": 500_000,     # 알트 VWAP 계산용 기준 수량 = 이 금액 / 현재가
+
+    # 지연 메트릭 (Prometheus text, 로컬 전용)
+    "METRICS_ENABLED": True,
+    "METRICS_HOST": "127.0.0.1",
+    "METRICS_PORT": 9108,
+
+    # 레이트리밋 (False 면 제한 없음, ccxt enableRateLimit 도 끈 상태)
+    "RATE_LIMIT_ENABLED": True,
+    # 버킷: (초당 토큰, 버스트). 거래소 공개 한도 기준 (IP 당)
+    "RATE_LIMITS": {
+        "binance": (20, 60),        # spot 1200 weight/min
+        "binance_fut": (40, 120),   # usdm 2400 weight/min
+        "upbit": (8, 8),            # 시세 10/s, 주문 8/s
+        "bithumb": (15, 15),
+        "bybit": (10, 20),          # bybit_fut 와 공유
+        "okx": (10, 20),            # okx_fut 와 공유 (public 20 req / 2s)
+    },
+    # 호출 종류별 가중치 (없으면 default)
+    "RATE_LIMIT_WEIGHTS": {
+        "default": {"ticker": 1, "tickers": 1, "orderbook": 1, "balance": 1, "order": 1, "funding": 1, "ohlcv": 1, "markets": 1, "fundings": 1},
+        "binance": {"ticker": 2, "tickers": 80, "orderbook": 5, "balance": 20, "order": 1, "ohlcv": 2, "markets": 20},
+        "binance_fut": {"ticker": 1, "tickers": 40, "orderbook": 2, "balance": 5, "order": 1, "funding": 1, "ohlcv": 1, "markets": 1, "fundings": 10},
+    },
+    "RATE_LIMIT_RESERVE": 0.2,  # 버스트 중 market 등급이 못 쓰는 비율 (equity 는 2배)
+    "RATE_LIMIT_AGING_SEC": 1.0,  # 이만큼 기다릴 때마다 한 등급 승격
+
+    # 거래소 상태: 최근 지연 분위수 → public 조회 타임아웃 / hedged 재요청 / 점진적 가중치
+    "HEALTH_ENABLED": True,
+    "HEALTH_WINDOW": 200,             # (거래소, 호출 종류)별 최근 지연 샘플 수
+    "HEALTH_MIN_SAMPLES": 20,         # 이보다 적으면 기본값 (타임아웃 최대, hedge 없음)
+    "HEALTH_TIMEOUT_MULT": 3.0,       # 타임아웃 = p99 × 배수
+    "HEALTH_TIMEOUT_MIN_SEC": 0.5,
+    "HEALTH_TIMEOUT_MAX_SEC": 10.0,
+    "HEDGE_MIN_DELAY_SEC": 0.05,      # p95 가 이보다 짧아도 이만큼은 기다린 뒤 재요청
+    "HEDGE_MAX_RATIO": 0.1,           # 재요청은 호출 수의 10% 이내
+    "HEDGE_VENUE_WORKERS": 4,         # 거래소별 조회 스레드 (= 동시 진행 상한, 한 거래소가 멈춰도 다른 거래소는 영향 없음)
+    "HEALTH_SLOW_SEC": 1.0,           # p95 가 이보다 느리면 비례해서 가중치 감소
+    "HEALTH_MIN_WEIGHT": 0.2,
+    "HEALTH_ERR_ALPHA": 0.05,         # 실패율 EWMA
+
+    # 거래소 markets 디스크 캐시 (부팅 시 load_markets 생략)
+    "MARKETS_CACHE_DIR": "markets_cache",
+    "MARKETS_CACHE_TTL_SEC": 6 * 3600,
+
+    # 거래소별 시세 워커 프로세스 (shared_memory 로 전달, numpy 필요)
+    "MP_WORKERS_ENABLED": False,
+    "MP_POLL_SEC": 1.0,        # 워커 한 바퀴 최소 간격
+    "MP_BOOK_DEPTH": 10,
+    "MP_MAX_AGE_SEC": 5,       # 이보다 오래된 레코드는 무시 (REST 로 fallback)
+
+    # 자본 추정: 백그라운드 주기 갱신 + 시세/체결로 증분 평가. update_pnl 은 O(1) 조회
+    "EQUITY_REFRESH_SEC": 60,
+    "EQUITY_MAX_STALE_SEC": 300,  # 이보다 오래된 값이면 update_pnl 에서 동기 재계산
 }
 
 CONFIG_FILE = "kimchi_bot_config.json"
@@ -123,7 +281,18 @@ FUNDING_INTERVAL_HOURS = CONFIG["FUNDING_INTERVAL_HOURS"]
 FUNDING_MAX_HOURS_HOLD = FUNDING_TARGET_PAYMENTS * FUNDING_INTERVAL_HOURS
 
 VOL_THRESHOLD_BORDER = CONFIG["VOL_THRESHOLD_BORDER"]
+VOL_BAR_SEC = CONFIG["VOL_BAR_SEC"]
+VOL_EWMA_HALFLIFE_BARS = CONFIG["VOL_EWMA_HALFLIFE_BARS"]
+VOL_RV_BARS = CONFIG["VOL_RV_BARS"]
+VOL_MAX_GAP_BARS = CONFIG["VOL_MAX_GAP_BARS"]
+VOL_SEED_DAYS = CONFIG["VOL_SEED_DAYS"]
 PREMIUM_PRED_WEIGHTS = CONFIG["PREMIUM_PRED_WEIGHTS"]
+PRED_HORIZON_SEC = CONFIG["PRED_HORIZON_SEC"]
+PRED_LABEL_MOVE_PCT = CONFIG["PRED_LABEL_MOVE_PCT"]
+PRED_LEARNING_RATE = CONFIG["PRED_LEARNING_RATE"]
+PRED_L2 = CONFIG["PRED_L2"]
+PRED_MIN_UPDATES = CONFIG["PRED_MIN_UPDATES"]
+PRED_SAVE_SEC = CONFIG["PRED_SAVE_SEC"]
 
 EDGE_BUFFER_FEE_PCT = CONFIG["EDGE_BUFFER_FEE_PCT"]
 EDGE_BUFFER_SLIPPAGE_PCT = CONFIG["EDGE_BUFFER_SLIPPAGE_PCT"]
@@ -142,12 +311,117 @@ ERROR_COOLDOWN_SEC = CONFIG["ERROR_COOLDOWN_SEC"]
 
 FX_FALLBACK_USDT_KRW = CONFIG["FX_FALLBACK_USDT_KRW"]
 
+FETCH_WORKERS = CONFIG["FETCH_WORKERS"]
+
+WS_ENABLED = CONFIG["WS_ENABLED"]
+WS_MAX_AGE_SEC = CONFIG["WS_MAX_AGE_SEC"]
+WS_IDLE_TIMEOUT_SEC = CONFIG["WS_IDLE_TIMEOUT_SEC"]
+WS_RECONNECT_MAX_SEC = CONFIG["WS_RECONNECT_MAX_SEC"]
+WS_DEPTH = CONFIG["WS_DEPTH"]
+WS_URLS = CONFIG["WS_URLS"]
+
+CACHE_TTL_SEC = CONFIG["CACHE_TTL_SEC"]
+BULK_FETCH_ENABLED = CONFIG["BULK_FETCH_ENABLED"]
+BULK_MIN_SYMBOLS = CONFIG["BULK_MIN_SYMBOLS"]
+
+BALANCE_RECONCILE_SEC = CONFIG["BALANCE_RECONCILE_SEC"]
+BALANCE_DRIFT_PCT = CONFIG["BALANCE_DRIFT_PCT"]
+
+TELEGRAM_QUEUE_MAX = CONFIG["TELEGRAM_QUEUE_MAX"]
+TELEGRAM_BATCH_WINDOW_SEC = CONFIG["TELEGRAM_BATCH_WINDOW_SEC"]
+TELEGRAM_DEDUP_SEC = CONFIG["TELEGRAM_DEDUP_SEC"]
+TELEGRAM_DEDUP_PREFIXES = tuple(CONFIG["TELEGRAM_DEDUP_PREFIXES"])
+
+ORDER_WORKERS = CONFIG["ORDER_WORKERS"]
+LEG_MISMATCH_TOL = CONFIG["LEG_MISMATCH_TOL"]
+
+LAYER_SCHEDULE = CONFIG["LAYER_SCHEDULE"]
+SCHEDULER_MIN_GAP_SEC = CONFIG["SCHEDULER_MIN_GAP_SEC"]
+
+RECORDER_ENABLED = CONFIG["RECORDER_ENABLED"]
+RECORDER_DIR = CONFIG["RECORDER_DIR"]
+RECORDER_CHUNK_ROWS = CONFIG["RECORDER_CHUNK_ROWS"]
+RECORDER_BOOK_DEPTH = CONFIG["RECORDER_BOOK_DEPTH"]
+RECORDER_FLUSH_SEC = CONFIG["RECORDER_FLUSH_SEC"]
+RECORDER_COMPRESS = CONFIG["RECORDER_COMPRESS"]
+
+TRADE_LOG_FLUSH_ROWS = CONFIG["TRADE_LOG_FLUSH_ROWS"]
+TRADE_LOG_FLUSH_SEC = CONFIG["TRADE_LOG_FLUSH_SEC"]
+TRADE_LOG_MAX_BYTES = CONFIG["TRADE_LOG_MAX_BYTES"]
+TRADE_LOG_COLUMNAR = CONFIG["TRADE_LOG_COLUMNAR"]
+TRADE_LOG_NPY_CHUNK_ROWS = CONFIG["TRADE_LOG_NPY_CHUNK_ROWS"]
+
+STATE_WRITE_BEHIND_SEC = CONFIG["STATE_WRITE_BEHIND_SEC"]
+
+UNIVERSE_AUTO = CONFIG["UNIVERSE_AUTO"]
+UNIVERSE_MIN_VOL_KRW = CONFIG["UNIVERSE_MIN_VOL_KRW"]
+UNIVERSE_MIN_VOL_USDT = CONFIG["UNIVERSE_MIN_VOL_USDT"]
+UNIVERSE_MAX_SYMBOLS = CONFIG["UNIVERSE_MAX_SYMBOLS"]
+UNIVERSE_REFRESH_SEC = CONFIG["UNIVERSE_REFRESH_SEC"]
+UNIVERSE_REST_BATCH = CONFIG["UNIVERSE_REST_BATCH"]
+SPREAD_TEST_NOTIONAL_KRW = CONFIG["SPREAD_TEST_NOTIONAL_KRW"]
+
+METRICS_ENABLED = CONFIG["METRICS_ENABLED"]
+METRICS_HOST = CONFIG["METRICS_HOST"]
+METRICS_PORT = CONFIG["METRICS_PORT"]
+
+RATE_LIMIT_ENABLED = CONFIG["RATE_LIMIT_ENABLED"]
+RATE_LIMITS = CONFIG["RATE_LIMITS"]
+RATE_LIMIT_WEIGHTS = CONFIG["RATE_LIMIT_WEIGHTS"]
+RATE_LIMIT_RESERVE = CONFIG["RATE_LIMIT_RESERVE"]
+RATE_LIMIT_AGING_SEC = CONFIG["RATE_LIMIT_AGING_SEC"]
+
+HEALTH_ENABLED = CONFIG["HEALTH_ENABLED"]
+HEALTH_WINDOW = CONFIG["HEALTH_WINDOW"]
+HEALTH_MIN_SAMPLES = CONFIG["HEALTH_MIN_SAMPLES"]
+HEALTH_TIMEOUT_MULT = CONFIG["HEALTH_TIMEOUT_MULT"]
+HEALTH_TIMEOUT_MIN_SEC = CONFIG["HEALTH_TIMEOUT_MIN_SEC"]
+HEALTH_TIMEOUT_MAX_SEC = CONFIG["HEALTH_TIMEOUT_MAX_SEC"]
+HEDGE_MIN_DELAY_SEC = CONFIG["HEDGE_MIN_DELAY_SEC"]
+HEDGE_MAX_RATIO = CONFIG["HEDGE_MAX_RATIO"]
+HEDGE_VENUE_WORKERS = CONFIG["HEDGE_VENUE_WORKERS"]
+HEALTH_SLOW_SEC = CONFIG["HEALTH_SLOW_SEC"]
+HEALTH_MIN_WEIGHT = CONFIG["HEALTH_MIN_WEIGHT"]
+HEALTH_ERR_ALPHA = CONFIG["HEALTH_ERR_ALPHA"]
+
+MARKETS_CACHE_DIR = CONFIG["MARKETS_CACHE_DIR"]
+MARKETS_CACHE_TTL_SEC = CONFIG["MARKETS_CACHE_TTL_SEC"]
+
+MP_WORKERS_ENABLED = CONFIG["MP_WORKERS_ENABLED"]
+MP_POLL_SEC = CONFIG["MP_POLL_SEC"]
+MP_BOOK_DEPTH = CONFIG["MP_BOOK_DEPTH"]
+MP_MAX_AGE_SEC = CONFIG["MP_MAX_AGE_SEC"]
+
+EQUITY_REFRESH_SEC = CONFIG["EQUITY_REFRESH_SEC"]
+EQUITY_MAX_STALE_SEC = CONFIG["EQUITY_MAX_STALE_SEC"]
+
 # 레이어 ON/OFF
 ENABLE_LAYER_SPREAD_ARB = True
 ENABLE_LAYER_KRW_CROSS = True
 ENABLE_LAYER_FUNDING_SIG = True
 ENABLE_LAYER_TRI_MONITOR = True
 
+# 스프레드/KRW 크로스 대상 심볼 (스프레드는 여기에 자동 유니버스가 더해짐, 이 심볼들은 매 틱 평가)
+ARB_SYMBOLS = ["BTC", "ETH"]
+
+# 스프레드 VWAP 계산용 고정 수량 (나머지는 SPREAD_TEST_NOTIONAL_KRW 기준)
+SPREAD_TEST_AMOUNT = {"BTC": 0.01, "ETH": 0.05}
+
+# 삼각 모니터 대상 거래소
+TRI_MONITOR_VENUES = ["bybit", "okx"]
+
+# 같은 IP 한도를 쓰는 거래소 → 레이트리밋 버킷 공유
+RATE_LIMIT_GROUP = {"bybit_fut": "bybit", "okx_fut": "okx"}
+
+# 스케줄러 레이어 이름 (LAYER_SCHEDULE 키)
+LAYER_NAMES = ("spread", "krw", "funding", "tri")
+
+# 오더북 변화 트리거: 어떤 거래소 오더북이 어떤 레이어를 깨우는지
+TRIGGER_VENUES = {
+    "spread": ("upbit", "bithumb", "binance"),
+    "krw": ("upbit", "bithumb"),
+}
+
 # 수수료율
 FEE_RATES = {
     "binance": 0.0004,
@@ -159,8 +433,10 @@ FEE_RATES = {
 DEFAULT_FEE_RATE = 0.0005
 
 # 로그 파일
-STATE_FILE = "kimchi_bot_state.json"
+STATE_FILE = "kimchi_bot_state.json"   # 구버전 JSON (있으면 최초 1회 DB로 이전)
+STATE_DB_FILE = "kimchi_bot_state.db"
 TRADE_LOG_FILE = "kimchi_bot_trades.csv"
+TRADE_LOG_COLUMNAR_DIR = "kimchi_bot_trades_npy"
 
 ###############################################################################
 # ENV
@@ -192,23 +468,51 @@ CHAT_ID = env("CHAT_ID")
 
 ex, ex_fut = {}, {}
 TRADE_TIMES = []
-price_history = {"upbit": [], "bithumb": []}
+PRICE_HISTORY_LEN = 50
 disable_trading = False
 LAST_EQUITY_KRW = 21500000.0
 
 # 거래소 에러 카운터 및 쿨다운 (1순위)
 ERROR_COUNT = {}
 DISABLED_UNTIL = {}
-
-# 프리미엄 히스토리 (3순위: z-score)
-SPREAD_PREM_HISTORY = {
-    "BTC": [],
-    "ETH": [],
-}
-KRW_PREM_HISTORY = {
-    "BTC": [],
-    "ETH": [],
-}
+DEADLINE_COUNT = {}  # 자체 타임아웃 (hedged_read) 횟수 — 비활성화 대상 아님
+
+# 마켓 데이터 캐시: (ex_id, endpoint, symbol) -> (fetch 시각, 결과 또는 Exception)
+MARKET_CACHE = {}
+_CACHE_INFLIGHT = {}
+_CACHE_LOCK = threading.Lock()
+CACHE_STATS = {}  # endpoint -> {"hit", "miss", "coalesced"}
+_FETCH_POOL = None
+_ORDER_POOL = None
+
+# 스케줄러: 오더북 변화 트리거 → 해당 레이어 즉시 재평가
+MARKET_EVENT = threading.Event()
+PENDING_TRIGGERS = set()
+LAST_EVAL_MID = {}  # (layer, venue, symbol) -> 마지막 평가 시점 mid
+LAST_MID = {}  # (venue, symbol) -> 최근 관측 mid (REST / 웹소켓 / 워커 어느 경로든)
+_TRIGGER_LOCK = threading.Lock()  # 위 셋은 스트림 / md-watch / fetch 스레드와 메인 루프가 같이 씀
+
+# 마켓 데이터 레코더 (start_recorder 로 생성)
+RECORDER = None
+
+# 레그별 주문 submit→ack 지연: name -> {"n", "sum", "max", "last"}
+ORDER_LATENCY = {}
+
+# 잔고 원장: name -> {asset: {"free", "total"}} (ccxt balance 와 같은 접근 방식)
+BALANCE_LEDGER = {}
+LEDGER_SYNC_TS = {}
+LEDGER_DIRTY = set()
+_LEDGER_LOCK = threading.Lock()
+
+# 웹소켓 스트림 상태: (venue, symbol) -> 오더북/티커 dict (수신 시각 "recv_ts" 포함)
+STREAM_BOOKS = {}
+STREAM_TICKERS = {}
+STREAM_STATUS = {}
+_STREAM_THREAD = None
+
+# 프리미엄 히스토리 (3순위: z-score). symbol -> RollingWindow (처음 쓸 때 생성)
+SPREAD_PREM_HISTORY = {}
+KRW_PREM_HISTORY = {}
 
 STATE = {
     "date": None,  # "YYYY-MM-DD" UTC
@@ -246,21 +550,195 @@ FUNDING_POS = {
 # TELEGRAM / STATE / TRADE LOG
 ###############################################################################
 
+TELEGRAM_MAX_LEN = 4000  # API 한도 4096 보다 약간 작게
+
+_TG_QUEUE = queue.Queue(maxsize=TELEGRAM_QUEUE_MAX)
+_TG_LOCK = threading.Lock()
+_TG_LAST_SENT = {}      # msg -> 마지막 enqueue 시각 (중복 억제)
+_TG_SUPPRESSED = {}     # msg -> 억제된 횟수
+_TG_THREAD = None
+
+
 def send_telegram(msg: str):
+    """
+    논블로킹 전송: 큐에 넣기만 하고 바로 리턴. 실제 전송은 백그라운드 워커.
+    TELEGRAM_DEDUP_PREFIXES 로 시작하는 에러/리스크 알림만, TELEGRAM_DEDUP_SEC 안에 같은 내용이 다시 오면
+    건너뛰고 횟수를 로그로 남긴다 (다음 전송에 생략 건수 표시).
+    """
+    global _TG_THREAD
+    now = time.time()
+    with _TG_LOCK:
+        if msg.startswith(TELEGRAM_DEDUP_PREFIXES):
+            last = _TG_LAST_SENT.get(msg)
+            if last is not None and now - last < TELEGRAM_DEDUP_SEC:
+                n = _TG_SUPPRESSED[msg] = _TG_SUPPRESSED.get(msg, 0) + 1
+                print(f"[TELEGRAM] duplicate suppressed (x{n}): {msg[:60]}")
+                return
+            _TG_LAST_SENT[msg] = now
+        if len(_TG_LAST_SENT) > 1000:
+            for k in [k for k, t in _TG_LAST_SENT.items() if now - t >= TELEGRAM_DEDUP_SEC]:
+                _TG_LAST_SENT.pop(k, None)
+        if _TG_THREAD is None or not _TG_THREAD.is_alive():
+            _TG_THREAD = threading.Thread(target=_telegram_worker, name="telegram", daemon=True)
+            _TG_THREAD.start()
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        requests.post(url, data={"chat_id": CHAT_ID, "text": msg}, timeout=5)
-    except Exception as e:
-        print(f"[TELEGRAM] ERR {e}")
+        _TG_QUEUE.put_nowait(msg)
+    except queue.Full:
+        print(f"[TELEGRAM] queue full, drop: {msg[:60]}")
+
+
+def _telegram_post(session, text: str):
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+    for i in range(0, len(text), TELEGRAM_MAX_LEN):
+        try:
+            session.post(url, data={"chat_id": CHAT_ID, "text": text[i:i + TELEGRAM_MAX_LEN]}, timeout=5)
+        except Exception as e:
+            print(f"[TELEGRAM] ERR {e}")
+
+
+def _telegram_worker():
+    """큐에서 꺼낸 메시지를 TELEGRAM_BATCH_WINDOW_SEC 동안 모아 한 메시지로 전송"""
+    session = requests.Session()
+    while True:
+        batch = [_TG_QUEUE.get()]
+        deadline = time.time() + TELEGRAM_BATCH_WINDOW_SEC
+        size = len(batch[0])
+        while size < TELEGRAM_MAX_LEN:
+            remain = deadline - time.time()
+            if remain <= 0:
+                break
+            try:
+                m = _TG_QUEUE.get(timeout=remain)
+            except queue.Empty:
+                break
+            batch.append(m)
+            size += len(m) + 2
+        with _TG_LOCK:
+            suppressed = dict(_TG_SUPPRESSED)
+            _TG_SUPPRESSED.clear()
+        text = "\n\n".join(batch)
+        if suppressed:
+            text += f"\n\n(중복 알림 {sum(suppressed.values())}건 생략)"
+        _telegram_post(session, text)
+        for _ in batch:
+            _TG_QUEUE.task_done()
+
+
+def flush_telegram(timeout: float = 5.0):
+    """종료 시 큐에 남은 메시지 전송 대기 (최대 timeout 초)"""
+    deadline = time.time() + timeout
+    while _TG_QUEUE.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.05)
+
+
+atexit.register(flush_telegram)
 
 
 DEFAULT_STATE = STATE.copy()
 
 
+###############################################################################
+# STATE STORE (SQLite WAL + write-behind)
+# - kv 테이블에 key -> JSON. 한 번의 flush 는 한 트랜잭션 (원자적, 중간 크래시에도 이전 값 유지)
+# - store_put 은 최신 값만 pending 에 넣고 리턴, 백그라운드 스레드가 모아서 commit
+###############################################################################
+
+_STORE_LOCK = threading.Lock()
+_STORE_PENDING = {}       # key -> JSON 문자열 (같은 key 는 최신 값만)
+_STORE_VERSION = 0        # store_put 호출 횟수
+_STORE_WRITTEN = 0        # 디스크에 반영된 version
+_STORE_EVENT = threading.Event()
+_STORE_THREAD = None
+
+
+def _store_connect():
+    conn = sqlite3.connect(STATE_DB_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)")
+    return conn
+
+
+def _store_write(conn, items: dict):
+    with conn:  # 하나의 트랜잭션
+        conn.executemany(
+            "INSERT INTO kv(key, value, updated) VALUES(?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated=excluded.updated",
+            [(k, v, time.time()) for k, v in items.items()],
+        )
+
+
+def _store_worker():
+    global _STORE_WRITTEN
+    conn = _store_connect()
+    while True:
+        _STORE_EVENT.wait()
+        time.sleep(STATE_WRITE_BEHIND_SEC)
+        with _STORE_LOCK:
+            _STORE_EVENT.clear()
+            items = dict(_STORE_PENDING)
+            _STORE_PENDING.clear()
+            version = _STORE_VERSION
+        if not items:
+            continue
+        try:
+            _store_write(conn, items)
+        except Exception as e:
+            print(f"[STATE] save ERR {e}")
+            with _STORE_LOCK:
+                for k, v in items.items():
+                    _STORE_PENDING.setdefault(k, v)
+            time.sleep(1.0)
+            _STORE_EVENT.set()
+            continue
+        _STORE_WRITTEN = version
+
+
+def store_put(key: str, value):
+    """값을 JSON 으로 직렬화해 pending 에 넣고 즉시 리턴 (디스크 쓰기는 백그라운드)"""
+    global _STORE_VERSION, _STORE_THREAD
+    data = json.dumps(value, ensure_ascii=False)
+    with _STORE_LOCK:
+        _STORE_PENDING[key] = data
+        _STORE_VERSION += 1
+        if _STORE_THREAD is None or not _STORE_THREAD.is_alive():
+            _STORE_THREAD = threading.Thread(target=_store_worker, name="state-store", daemon=True)
+            _STORE_THREAD.start()
+    _STORE_EVENT.set()
+
+
+def store_get(key: str, default=None):
+    try:
+        conn = _store_connect()
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key=?", (key,)).fetchone()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[STATE] read ERR {key} {e}")
+        return default
+    return json.loads(row[0]) if row else default
+
+
+def flush_state(timeout: float = 5.0):
+    """pending 값이 디스크에 반영될 때까지 대기 (종료 시)"""
+    with _STORE_LOCK:
+        target = _STORE_VERSION
+    deadline = time.time() + timeout
+    while _STORE_WRITTEN < target and time.time() < deadline:
+        _STORE_EVENT.set()
+        time.sleep(0.05)
+
+
+atexit.register(flush_state)
+
+
 def save_state():
+    """STATE + FUNDING_POS 저장 (write-behind, hot path 에서는 직렬화만)"""
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump(STATE, f, ensure_ascii=False, indent=2)
+        store_put("state", STATE)
+        store_put("funding_pos", FUNDING_POS)
+        store_put("premium_model", PREMIUM_MODEL.to_dict())
     except Exception as e:
         print(f"[STATE] save ERR {e}")
 
@@ -268,53 +746,201 @@ def save_state():
 def load_state():
     global STATE
     try:
-        if os.path.exists(STATE_FILE):
+        data = store_get("state")
+        if data is None and os.path.exists(STATE_FILE):
+            # 구버전 JSON 상태 → DB 로 이전
             with open(STATE_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
+            print(f"[STATE] migrated {STATE_FILE} → {STATE_DB_FILE}")
+        if data is not None:
             STATE = DEFAULT_STATE.copy()
             STATE.update(data)
+            pos = store_get("funding_pos")
+            if pos:
+                FUNDING_POS.update(pos)
+            load_premium_model()
             print(f"[STATE] Loaded: {STATE}")
+            if FUNDING_POS["active"]:
+                print(f"[STATE] FUNDING_POS 복구: {FUNDING_POS}")
+            save_state()
         else:
-            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            today = datetime.fromtimestamp(now_ts(), tz=timezone.utc).strftime("%Y-%m-%d")
             STATE["date"] = today
             STATE["weekly_start_date"] = today
             save_state()
     except Exception as e:
         print(f"[STATE] load ERR {e}")
 
+###############################################################################
+# TRADE LOG
+###############################################################################
+
+
+TRADE_LOG_HEADER = [
+    "ts",
+    "date_utc",
+    "layer",
+    "symbol",
+    "venue",
+    "side",
+    "tier",
+    "prem_pct",
+    "notional_krw",
+    "amount",
+    "gross_pnl_krw",
+    "fee_krw",
+    "net_pnl_krw",
+    "dry_run",
+]
+
+
+def trade_log_dtype():
+    return np.dtype([
+        ("ts", "f8"), ("date_utc", "U19"), ("layer", "U16"), ("symbol", "U24"),
+        ("venue", "U24"), ("side", "U20"), ("tier", "U8"), ("prem_pct", "f8"),
+        ("notional_krw", "f8"), ("amount", "f8"), ("gross_pnl_krw", "f8"),
+        ("fee_krw", "f8"), ("net_pnl_krw", "f8"), ("dry_run", "?"),
+    ])
+
+
+class TradeJournal:
+    """
+    트레이드 로그 writer.
+    - CSV 파일 핸들을 열어둔 채 행을 버퍼링, TRADE_LOG_FLUSH_ROWS 행 / TRADE_LOG_FLUSH_SEC 초마다 flush
+    - UTC 날짜가 바뀌거나 TRADE_LOG_MAX_BYTES 를 넘으면 {이름}.YYYY-MM-DD[.N].csv 로 rotate
+      (자정을 걸친 배치는 행의 날짜별로 나눠서 기록)
+    - TRADE_LOG_COLUMNAR 면 같은 행들을 날짜별 청크에 모아 {날짜}/trades.NNNNNN.npy 로 저장 (분석용).
+      청크는 TRADE_LOG_NPY_CHUNK_ROWS 행이 차거나 날짜가 바뀌거나 close 때만 파일로 씀
+    """
+
+    def __init__(self, path: str, columnar_dir: str = None):
+        self.path = path
+        self.columnar_dir = columnar_dir if (columnar_dir and np is not None) else None
+        self.lock = threading.Lock()
+        self.rows, self.raw = [], []
+        self.f = None
+        self.writer = None
+        self.day = None
+        self.last_flush = now_ts()
+        self.npy = {}  # day -> 아직 파일로 안 쓴 raw 행
+        self._open()
+
+    def _open(self):
+        exists = os.path.exists(self.path)
+        if exists:
+            self.day = datetime.fromtimestamp(os.path.getmtime(self.path), tz=timezone.utc).strftime("%Y-%m-%d")
+        self.f = open(self.path, "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.f)
+        if not exists:
+            self.writer.writerow(TRADE_LOG_HEADER)
+            self.f.flush()
+            print(f"[TRADE LOG] Created {self.path}")
+
+    def _rotate(self):
+        self.f.close()
+        root, ext = os.path.splitext(self.path)
+        dst = f"{root}.{self.day}{ext}"
+        n = 1
+        while os.path.exists(dst):
+            dst = f"{root}.{self.day}.{n}{ext}"
+            n += 1
+        os.replace(self.path, dst)
+        print(f"[TRADE LOG] rotated → {dst}")
+        self.day = None
+        self._open()
+
+    def write(self, row, raw):
+        with self.lock:
+            self.rows.append(row)
+            self.raw.append(raw)
+            if len(self.rows) >= TRADE_LOG_FLUSH_ROWS or now_ts() - self.last_flush >= TRADE_LOG_FLUSH_SEC:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = now_ts()
+        if not self.rows:
+            return
+        for day, group in groupby(zip(self.rows, self.raw), key=lambda r: r[0][1][:10]):
+            group = list(group)
+            if self.day is not None and (day != self.day or self.f.tell() >= TRADE_LOG_MAX_BYTES):
+                self._rotate()
+            self.day = day
+            self.writer.writerows(row for row, _ in group)
+            if self.columnar_dir:
+                self._npy_append(day, [raw for _, raw in group])
+        self.f.flush()
+        self.rows, self.raw = [], []
+
+    def _npy_append(self, day: str, raws):
+        chunk = self.npy.setdefault(day, [])
+        chunk.extend(raws)
+        # 지난 날짜 청크는 더 늘지 않음 → 바로 저장
+        for d in [d for d in self.npy if d < day]:
+            self._npy_save(d)
+        if len(chunk) >= TRADE_LOG_NPY_CHUNK_ROWS:
+            self._npy_save(day)
+
+    def _npy_save(self, day: str):
+        raws = self.npy.pop(day, None)
+        if not raws:
+            return
+        try:
+            d = os.path.join(self.columnar_dir, day)
+            os.makedirs(d, exist_ok=True)
+            seq = sum(1 for f in os.listdir(d) if f.startswith("trades.") and f.endswith(".npy"))
+            np.save(os.path.join(d, f"trades.{seq:06d}.npy"), np.array(raws, dtype=trade_log_dtype()))
+        except Exception as e:
+            print(f"[TRADE LOG] columnar ERR {e}")
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            for day in list(self.npy):
+                self._npy_save(day)
+            if self.f:
+                self.f.close()
+                self.f = None
+
+
+TRADE_JOURNAL = None
+
 
 def init_trade_log():
-    """트레이드 로그 CSV가 없으면 헤더 생성"""
-    if not os.path.exists(TRADE_LOG_FILE):
+    """트레이드 로그 writer 생성 (CSV가 없으면 헤더 생성)"""
+    global TRADE_JOURNAL
+    try:
+        if TRADE_JOURNAL is not None:
+            TRADE_JOURNAL.close()
+        TRADE_JOURNAL = TradeJournal(TRADE_LOG_FILE, TRADE_LOG_COLUMNAR_DIR if TRADE_LOG_COLUMNAR else None)
+    except Exception as e:
+        print(f"[TRADE LOG INIT ERR] {e}")
+
+
+def flush_trade_log():
+    if TRADE_JOURNAL is not None:
         try:
-            with open(TRADE_LOG_FILE, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                w.writerow([
-                    "ts",
-                    "date_utc",
-                    "layer",
-                    "symbol",
-                    "venue",
-                    "side",
-                    "tier",
-                    "prem_pct",
-                    "notional_krw",
-                    "amount",
-                    "gross_pnl_krw",
-                    "fee_krw",
-                    "net_pnl_krw",
-                    "dry_run",
-                ])
-            print(f"[TRADE LOG] Created {TRADE_LOG_FILE}")
+            TRADE_JOURNAL.flush()
         except Exception as e:
-            print(f"[TRADE LOG INIT ERR] {e}")
+            print(f"[TRADE LOG ERR] {e}")
+
+
+def close_trade_log():
+    if TRADE_JOURNAL is not None:
+        TRADE_JOURNAL.close()
+
+
+atexit.register(close_trade_log)
 
 
 def log_trade(layer, symbol, venue, side, tier,
               prem_pct, notional_krw, amount,
               gross_pnl_krw, fee_krw, net_pnl_krw):
-    """각 트레이드를 CSV로 한 줄씩 기록"""
-    ts = time.time()
+    """각 트레이드를 CSV로 한 줄씩 기록 (버퍼링, 실제 쓰기는 TradeJournal flush 정책)"""
+    ts = now_ts()
     dt = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
     row = [
         f"{ts:.3f}",
@@ -332,10 +958,15 @@ def log_trade(layer, symbol, venue, side, tier,
         f"{net_pnl_krw:.0f}" if net_pnl_krw is not None else "",
         str(DRY_RUN),
     ]
+    raw = (
+        ts, dt, layer, symbol, venue, side, tier or "",
+        _nan(prem_pct), _nan(notional_krw), _nan(amount),
+        _nan(gross_pnl_krw), _nan(fee_krw), _nan(net_pnl_krw), bool(DRY_RUN),
+    )
     try:
-        with open(TRADE_LOG_FILE, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(row)
+        if TRADE_JOURNAL is None:
+            init_trade_log()
+        TRADE_JOURNAL.write(row, raw)
     except Exception as e:
         print(f"[TRADE LOG ERR] {e}")
 
@@ -344,8 +975,12 @@ def log_trade(layer, symbol, venue, side, tier,
 ###############################################################################
 
 
-def record_exchange_error(ex_id: str):
-    now = time.time()
+def record_exchange_error(ex_id: str, err: Exception = None):
+    """err 가 자체 조회 타임아웃(ReadDeadlineExceeded)이면 별도 카운트만 (비활성화 안 함)"""
+    if isinstance(err, ReadDeadlineExceeded):
+        DEADLINE_COUNT[ex_id] = DEADLINE_COUNT.get(ex_id, 0) + 1
+        return
+    now = now_ts()
     cnt = ERROR_COUNT.get(ex_id, 0) + 1
     ERROR_COUNT[ex_id] = cnt
     if cnt >= ERROR_THRESHOLD:
@@ -360,11 +995,526 @@ def is_exchange_disabled(ex_id: str) -> bool:
     until = DISABLED_UNTIL.get(ex_id)
     if until is None:
         return False
-    if time.time() >= until:
+    if now_ts() >= until:
         DISABLED_UNTIL.pop(ex_id, None)
         return False
     return True
 
+###############################################################################
+# METRICS (지연 히스토그램 → 로컬 /metrics 엔드포인트, 일일 리포트 요약)
+# - exchange_call: 거래소 × 호출 종류(ticker/orderbook/balance/order/funding/ohlcv) 왕복 시간
+# - layer: 레이어 평가 시간 / quote_age: 판단 시점에 쓴 시세의 나이
+# - 누적 히스토그램은 Prometheus 용, 일일 히스토그램은 send_daily_report 에서 요약 후 리셋
+###############################################################################
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_HELP = {
+    "exchange_call": "exchange REST/order round trip seconds",
+    "layer": "layer evaluation seconds",
+    "quote_age": "age of the quote used at decision time, seconds",
+    "ratelimit_wait": "time spent waiting for rate limit tokens, seconds",
+    "hedge": "hedged duplicate public reads (value = delay before the duplicate), seconds",
+}
+METRICS = {}        # (metric, labels) -> [bucket counts..., +Inf count, sum]
+METRICS_DAILY = {}
+METRIC_ERRORS = {}  # (exchange, call) -> 실패 횟수
+_METRICS_LOCK = threading.Lock()
+_METRICS_SERVER = None
+
+
+def _hist_observe(table: dict, key, value: float):
+    h = table.get(key)
+    if h is None:
+        h = table[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    h[bisect_left(LATENCY_BUCKETS, value)] += 1
+    h[-1] += value
+
+
+def observe(metric: str, value: float, **labels):
+    key = (metric, tuple(labels.items()))  # 호출부마다 라벨 순서 고정
+    with _METRICS_LOCK:
+        _hist_observe(METRICS, key, value)
+        _hist_observe(METRICS_DAILY, key, value)
+
+
+class timed_call:
+    """with timed_call(name, "ticker"): ... → exchange_call 히스토그램 (+ 실패 카운트)"""
+
+    __slots__ = ("exchange", "call", "t0")
+
+    def __init__(self, exchange: str, call: str):
+        self.exchange, self.call = exchange, call
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self.t0
+        observe("exchange_call", dt, exchange=self.exchange, call=self.call)
+        health_observe(self.exchange, self.call, dt, exc_type is None)
+        if exc_type is not None:
+            with _METRICS_LOCK:
+                key = (self.exchange, self.call)
+                METRIC_ERRORS[key] = METRIC_ERRORS.get(key, 0) + 1
+        return False
+
+
+def observe_quote_age(exchange: str, kind: str, quote):
+    """quote 의 recv_ts (스트림/REST 수신 시각) 기준 나이"""
+    ts = quote.get("recv_ts") if quote else None
+    if ts is not None:
+        observe("quote_age", max(0.0, now_ts() - ts), exchange=exchange, kind=kind)
+
+
+def hist_quantile(h, q: float) -> float:
+    """버킷 상한 기준 분위수 (관측치가 없으면 0)"""
+    n = sum(h[:-1])
+    if n == 0:
+        return 0.0
+    rank, acc = q * n, 0
+    for i, c in enumerate(h[:-1]):
+        acc += c
+        if acc >= rank:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+    return float("inf")
+
+
+def metrics_text() -> str:
+    """Prometheus text exposition format"""
+    def fmt_labels(labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+    with _METRICS_LOCK:
+        hists = {k: list(v) for k, v in METRICS.items()}
+        errors = dict(METRIC_ERRORS)
+    lines = []
+    for metric in sorted({m for m, _ in hists}):
+        name = f"kimchi_{metric}_seconds"
+        lines.append(f"# HELP {name} {METRIC_HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (m, labels), h in sorted(hists.items()):
+            if m != metric:
+                continue
+            acc = 0
+            for i, le in enumerate(LATENCY_BUCKETS):
+                acc += h[i]
+                lines.append(f"{name}_bucket{fmt_labels(labels, ('le', le))} {acc}")
+            acc += h[len(LATENCY_BUCKETS)]
+            lines.append(f"{name}_bucket{fmt_labels(labels, ('le', '+Inf'))} {acc}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {acc}")
+    lines.append("# HELP kimchi_exchange_call_errors_total failed exchange calls")
+    lines.append("# TYPE kimchi_exchange_call_errors_total counter")
+    for (exch, call), n in sorted(errors.items()):
+        lines.append(f'kimchi_exchange_call_errors_total{{exchange="{exch}",call="{call}"}} {n}')
+    lines.append("# HELP kimchi_read_deadline_total public reads abandoned by our own deadline (not exchange errors)")
+    lines.append("# TYPE kimchi_read_deadline_total counter")
+    for exch, n in sorted(DEADLINE_COUNT.items()):
+        lines.append(f'kimchi_read_deadline_total{{exchange="{exch}"}} {n}')
+    lines.append("# HELP kimchi_cache_requests_total market data cache lookups")
+    lines.append("# TYPE kimchi_cache_requests_total counter")
+    for result, n in sorted(cache_stats_totals().items()):
+        lines.append(f'kimchi_cache_requests_total{{result="{result}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def daily_latency_summary(reset: bool = True) -> str:
+    """일일 리포트용: 호출/레이어/시세나이별 p50/p95/건수"""
+    with _METRICS_LOCK:
+        hists = sorted(METRICS_DAILY.items())
+        if reset:
+            METRICS_DAILY.clear()
+    rows = []
+    for (metric, labels), h in hists:
+        n = sum(h[:-1])
+        if n == 0:
+            continue
+        label = "/".join(str(v) for _, v in labels)
+        rows.append(
+            f"  {metric} {label}: p50≤{hist_quantile(h, 0.5) * 1000:.0f}ms "
+            f"p95≤{hist_quantile(h, 0.95) * 1000:.0f}ms n={n}"
+        )
+    return "\n".join(rows)
+
+
+def start_metrics_server(port: int = None, host: str = None):
+    """GET /metrics → metrics_text() (백그라운드 스레드)"""
+    global _METRICS_SERVER
+    if _METRICS_SERVER is not None:
+        return _METRICS_SERVER
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    try:
+        _METRICS_SERVER = ThreadingHTTPServer((host or METRICS_HOST, METRICS_PORT if port is None else port), Handler)
+    except OSError as e:
+        print(f"[METRICS] bind ERR {e}")
+        return None
+    threading.Thread(target=_METRICS_SERVER.serve_forever, name="metrics", daemon=True).start()
+    print(f"[METRICS] http://{_METRICS_SERVER.server_address[0]}:{_METRICS_SERVER.server_address[1]}/metrics")
+    return _METRICS_SERVER
+
+###############################################################################
+# RATE LIMIT SCHEDULER (거래소별 토큰 버킷 + 우선순위)
+# - ccxt 자체 enableRateLimit(인스턴스별 blocking sleep) 대신 모든 REST 호출이 여기서 토큰을 받음
+# - 호출 종류별 가중치(RATE_LIMIT_WEIGHTS), 거래소 공개 한도 기준 초당 토큰/버스트(RATE_LIMITS)
+# - 우선순위: order > hedge > market > equity. 낮은 등급일수록 남겨둬야 하는 토큰(floor)이 커서
+#   시세 폴링이 한도 가까이 가도 주문은 기다리지 않음 (order 는 버스트만큼 마이너스까지 허용)
+###############################################################################
+
+RATE_PRIORITIES = ("order", "hedge", "market", "equity")  # 앞쪽이 우선
+_RL_LOCAL = threading.local()
+_RL_BUCKETS = {}
+_RL_LOCK = threading.Lock()
+
+
+class VenueBucket:
+    def __init__(self, rate: float, burst: float, reserve: float):
+        self.rate, self.burst = float(rate), float(burst)
+        r = self.burst * reserve
+        self.floors = (-self.burst, 0.0, r, 2 * r)  # RATE_PRIORITIES 순서
+        self.tokens = self.burst
+        self.ts = time.monotonic()
+        self.waiting = [0] * len(RATE_PRIORITIES)
+        self.cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def try_acquire(self, weight: float, priority: str) -> bool:
+        """기다리지 않고 지금 토큰이 있으면 가져감 (hedge 재요청용). 대기 중인 요청이 있으면 양보"""
+        rank = RATE_PRIORITIES.index(priority)
+        with self.cond:
+            self._refill()
+            floor = self.floors[rank]
+            w = min(weight, self.burst - floor)
+            if any(self.waiting[:rank + 1]) or self.tokens - w < floor:
+                return False
+            self.tokens -= w
+            return True
+
+    def acquire(self, weight: float, priority: str) -> float:
+        """
+        토큰을 받을 때까지 대기 → 대기 시간(초). 상위 우선순위가 기다리는 중이면 양보.
+        오래 기다린 요청은 RATE_LIMIT_AGING_SEC 마다 한 등급씩 올라감 (hedge 까지) → 기아 방지
+        """
+        base = RATE_PRIORITIES.index(priority)
+        rank = base
+        t0 = time.monotonic()
+        with self.cond:
+            self.waiting[rank] += 1
+            try:
+                while True:
+                    self._refill()
+                    aged = max(min(base, 1), base - int((time.monotonic() - t0) / RATE_LIMIT_AGING_SEC))
+                    if aged != rank:
+                        self.waiting[rank] -= 1
+                        self.waiting[aged] += 1
+                        rank = aged
+                    floor = self.floors[rank]
+                    # 버스트보다 무거운 호출(bulk)은 이 등급이 쓸 수 있는 버킷 전체를 비우는 것으로 처리
+                    w = min(weight, self.burst - floor)
+                    blocked = any(self.waiting[:rank])
+                    if not blocked and self.tokens - w >= floor:
+                        self.tokens -= w
+                        break
+                    need = (w + floor - self.tokens) / self.rate
+                    self.cond.wait(timeout=0.05 if blocked else min(max(need, 0.001), RATE_LIMIT_AGING_SEC))
+            finally:
+                self.waiting[rank] -= 1
+                self.cond.notify_all()
+        return time.monotonic() - t0
+
+
+def _venue_bucket(name: str):
+    key = RATE_LIMIT_GROUP.get(name, name)
+    bucket = _RL_BUCKETS.get(key)
+    if bucket is None:
+        cfg = RATE_LIMITS.get(key)
+        if cfg is None:
+            return None
+        with _RL_LOCK:
+            bucket = _RL_BUCKETS.setdefault(key, VenueBucket(cfg[0], cfg[1], RATE_LIMIT_RESERVE))
+    return bucket
+
+
+def _call_weight(name: str, call: str) -> float:
+    return RATE_LIMIT_WEIGHTS.get(name, {}).get(call) or RATE_LIMIT_WEIGHTS["default"].get(call, 1)
+
+
+def try_rate_limit(name: str, call: str, priority: str = None) -> bool:
+    """토큰을 바로 얻을 수 있을 때만 True (대기 없음)"""
+    if not RATE_LIMIT_ENABLED:
+        return True
+    bucket = _venue_bucket(name)
+    if bucket is None:
+        return True
+    priority = priority or getattr(_RL_LOCAL, "priority", None) or "market"
+    return bucket.try_acquire(_call_weight(name, call), priority)
+
+
+def rate_limit(name: str, call: str, priority: str = None):
+    if not RATE_LIMIT_ENABLED:
+        return
+    bucket = _venue_bucket(name)
+    if bucket is None:
+        return
+    priority = priority or getattr(_RL_LOCAL, "priority", None) or "market"
+    waited = bucket.acquire(_call_weight(name, call), priority)
+    if waited > 0.001:
+        observe("ratelimit_wait", waited, exchange=name, priority=priority)
+
+
+class request_priority:
+    """
+    with request_priority("equity"): ... 또는 @request_priority("equity")
+    → 이 스레드에서 priority 를 따로 주지 않은 거래소 호출의 기본 등급
+    """
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.prev = None
+
+    def __enter__(self):
+        self.prev = getattr(_RL_LOCAL, "priority", None)
+        _RL_LOCAL.priority = self.priority
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _RL_LOCAL.priority = self.prev
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with request_priority(self.priority):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+class venue_call(timed_call):
+    """레이트리밋 토큰 확보 → 호출 시간 측정 (대기 시간은 exchange_call 에 포함 안 됨)"""
+
+    __slots__ = ("priority",)
+
+    def __init__(self, exchange: str, call: str, priority: str = None):
+        super().__init__(exchange, call)
+        self.priority = priority
+
+    def __enter__(self):
+        rate_limit(self.exchange, self.call, self.priority)
+        return super().__enter__()
+
+###############################################################################
+# VENUE HEALTH (지연 기반 타임아웃 / hedged read / 점진적 가중치)
+# - timed_call 이 (거래소, 호출 종류)별 최근 HEALTH_WINDOW 개 지연과 실패율(EWMA)을 기록
+# - 멱등 public 조회는 hedged_read 로: p95 를 넘기면 같은 요청을 한 번 더 보내 먼저 성공한 응답 사용,
+#   p99 × HEALTH_TIMEOUT_MULT 가 지나면 기다리지 않고 TimeoutError (느린 거래소가 루프 전체를 막지 않음)
+# - 주문/잔고는 중복 요청하면 안 되므로 대상 아님 (ccxt 인스턴스 timeout 그대로)
+# - venue_weight(): (1 - 실패율) × min(1, HEALTH_SLOW_SEC / p95) → 스프레드/KRW 레이어 수량과 순위에 곱함.
+#   record_exchange_error 의 쿨다운(완전 차단)은 연속 에러에만 그대로 사용
+###############################################################################
+
+# 가중치 계산에 쓰는 지연: public 조회만 (주문 지연은 거래소 매칭 상태에 좌우됨)
+HEALTH_READ_CALLS = ("ticker", "tickers", "orderbook", "funding", "fundings", "ohlcv")
+HEALTH_RESORT_EVERY = 10  # 샘플 이만큼 쌓일 때마다 분위수용 정렬 갱신
+
+
+class LatencyTracker:
+    __slots__ = ("samples", "sorted", "dirty", "err", "calls", "hedges")
+
+    def __init__(self, window: int = None):
+        self.samples = deque(maxlen=HEALTH_WINDOW if window is None else window)
+        self.sorted = []
+        self.dirty = 0
+        self.err = 0.0
+        self.calls = 0
+        self.hedges = 0
+
+    def add(self, dt: float, ok: bool):
+        self.samples.append(dt)
+        self.dirty += 1
+        self.err += HEALTH_ERR_ALPHA * ((0.0 if ok else 1.0) - self.err)
+
+    def quantile(self, q: float):
+        """샘플이 HEALTH_MIN_SAMPLES 미만이면 None"""
+        if len(self.samples) < HEALTH_MIN_SAMPLES:
+            return None
+        if self.dirty >= HEALTH_RESORT_EVERY or len(self.sorted) < HEALTH_MIN_SAMPLES:
+            self.sorted = sorted(self.samples)
+            self.dirty = 0
+        return self.sorted[min(len(self.sorted) - 1, int(q * len(self.sorted)))]
+
+
+HEALTH = {}  # venue -> {call: LatencyTracker}
+_HEALTH_LOCK = threading.Lock()
+_HEDGE_POOLS = {}  # venue -> VenuePool
+
+
+def _tracker(venue: str, call: str) -> LatencyTracker:
+    calls = HEALTH.get(venue)
+    tr = calls.get(call) if calls is not None else None
+    if tr is None:
+        with _HEALTH_LOCK:
+            tr = HEALTH.setdefault(venue, {}).setdefault(call, LatencyTracker())
+    return tr
+
+
+def health_observe(venue: str, call: str, dt: float, ok: bool):
+    tr = _tracker(venue, call)
+    with _HEALTH_LOCK:
+        tr.add(dt, ok)
+
+
+def call_timeout(venue: str, call: str) -> float:
+    with _HEALTH_LOCK:
+        p99 = _tracker(venue, call).quantile(0.99)
+    if p99 is None:
+        return HEALTH_TIMEOUT_MAX_SEC
+    return min(HEALTH_TIMEOUT_MAX_SEC, max(HEALTH_TIMEOUT_MIN_SEC, p99 * HEALTH_TIMEOUT_MULT))
+
+
+def venue_weight(venue: str) -> float:
+    """0~1 (하한 HEALTH_MIN_WEIGHT). 기록이 없으면 1"""
+    if not HEALTH_ENABLED:
+        return 1.0
+    err, p95 = 0.0, None
+    with _HEALTH_LOCK:
+        for call, tr in HEALTH.get(venue, {}).items():
+            err = max(err, tr.err)
+            q = tr.quantile(0.95) if call in HEALTH_READ_CALLS else None
+            if q is not None and (p95 is None or q > p95):
+                p95 = q
+    w = 1.0 - err
+    if p95 is not None and p95 > HEALTH_SLOW_SEC:
+        w *= HEALTH_SLOW_SEC / p95
+    return max(HEALTH_MIN_WEIGHT, min(1.0, w))
+
+
+def health_weight(*venues) -> float:
+    return min(venue_weight(v) for v in venues)
+
+
+class VenuePool:
+    """거래소별 조회 스레드 풀 (HEDGE_VENUE_WORKERS 개) + 풀에 들어간 (대기 + 실행 중) 조회 수"""
+
+    def __init__(self, venue: str):
+        self.pool = ThreadPoolExecutor(max_workers=HEDGE_VENUE_WORKERS, thread_name_prefix=f"hedge-{venue}")
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn):
+        with self.lock:
+            self.inflight += 1
+        fut = self.pool.submit(fn)
+        fut.add_done_callback(self._done)  # 취소돼도 호출됨
+        return fut
+
+    def _done(self, fut):
+        with self.lock:
+            self.inflight -= 1
+
+    def free(self) -> bool:
+        """바로 시작할 수 있는 스레드가 남았는지"""
+        with self.lock:
+            return self.inflight < HEDGE_VENUE_WORKERS
+
+
+def _hedge_pool(venue: str) -> VenuePool:
+    pool = _HEDGE_POOLS.get(venue)
+    if pool is None:
+        with _HEALTH_LOCK:
+            pool = _HEDGE_POOLS.get(venue)
+            if pool is None:
+                pool = _HEDGE_POOLS[venue] = VenuePool(venue)
+    return pool
+
+
+class ReadDeadlineExceeded(TimeoutError):
+    """hedged_read 가 스스로 포기한 조회 (거래소 에러 아님 → 비활성화 카운트에 안 넣음)"""
+
+
+def hedged_read(venue: str, call: str, fn):
+    """
+    멱등 public 조회 fn() 실행.
+    레이트리밋 토큰은 호출 스레드에서 먼저 받고 (토큰 대기는 타임아웃에 안 들어감),
+    거래소별 풀에 넣은 시점부터 call_timeout 을 잰다 (풀 스레드 대기는 들어감).
+    p95 (최소 HEDGE_MIN_DELAY_SEC) 안에 안 끝나면 토큰과 풀 스레드가 바로 있을 때만 같은 요청을 한 번 더 보내
+    먼저 성공한 결과를 쓰고, call_timeout 이 지나면 ReadDeadlineExceeded.
+    """
+    priority = getattr(_RL_LOCAL, "priority", None)  # 풀 스레드로 넘어가도 같은 등급 유지
+    if not HEALTH_ENABLED:
+        with venue_call(venue, call, priority):
+            return fn()
+
+    rate_limit(venue, call, priority)
+    started = threading.Event()
+
+    def attempt():
+        started.set()
+        with timed_call(venue, call):
+            return fn()
+
+    tr = _tracker(venue, call)
+    with _HEALTH_LOCK:
+        tr.calls += 1
+        p95 = tr.quantile(0.95)
+    timeout = call_timeout(venue, call)
+    deadline = time.monotonic() + timeout
+    pool = _hedge_pool(venue)
+    first = pool.submit(attempt)
+    # 이 거래소 요청들이 멈춰 풀이 꽉 찼으면 스레드를 기다리다 마감 → 시작 전이면 취소하고 포기
+    if not started.wait(timeout) and first.cancel():
+        raise ReadDeadlineExceeded(f"{venue} {call} no free worker in {timeout:.2f}s")
+    pending = {first}
+    if p95 is not None:
+        done, pending = wait(pending, timeout=max(p95, HEDGE_MIN_DELAY_SEC))
+        if not done:
+            with _HEALTH_LOCK:
+                hedge = tr.hedges < HEDGE_MAX_RATIO * tr.calls
+            # 버킷이 모자라면 hedge 하지 않음 (부족한 토큰을 중복 요청에 쓰지 않기)
+            if hedge and pool.free() and try_rate_limit(venue, call, priority):
+                with _HEALTH_LOCK:
+                    tr.hedges += 1
+                observe("hedge", max(p95, HEDGE_MIN_DELAY_SEC), exchange=venue, call=call)
+                pending.add(pool.submit(attempt))
+        else:
+            pending = done
+    err = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for fut in done:
+            if fut.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return fut.result()
+            err = fut.exception()
+    if not pending and err is not None:
+        raise err
+    for fut in pending:
+        fut.cancel()
+    raise ReadDeadlineExceeded(f"{venue} {call} no response in {timeout:.2f}s")
+
 ###############################################################################
 # FX / EQUITY
 ###############################################################################
@@ -374,19 +1524,165 @@ def now_ts() -> float:
     return time.time()
 
 
+def cached_fetch(ex_id: str, endpoint: str, symbol, fetcher):
+    """
+    (ex_id, endpoint, symbol) 단위 TTL 캐시.
+    - TTL 안이면 저장된 값 재사용 (실패도 저장해서 같은 예외를 다시 raise → 에러 카운트 중복 방지)
+    - 같은 키를 다른 스레드가 가져오는 중이면 새로 요청하지 않고 그 결과를 기다림
+    """
+    key = (ex_id, endpoint, symbol)
+    ttl = CACHE_TTL_SEC.get(endpoint, 0.0)
+    owner = False
+    with _CACHE_LOCK:
+        stats = CACHE_STATS.setdefault(endpoint, {"hit": 0, "miss": 0, "coalesced": 0})
+        ent = MARKET_CACHE.get(key)
+        if ent is not None and now_ts() - ent[0] <= ttl:
+            stats["hit"] += 1
+            fut = None
+        else:
+            fut = _CACHE_INFLIGHT.get(key)
+            if fut is not None:
+                stats["coalesced"] += 1
+            else:
+                stats["miss"] += 1
+                fut = Future()
+                _CACHE_INFLIGHT[key] = fut
+                owner = True
+
+    if fut is None:
+        if isinstance(ent[1], Exception):
+            raise ent[1]
+        return ent[1]
+    if not owner:
+        return fut.result()
+
+    try:
+        value = fetcher()
+    except Exception as e:
+        with _CACHE_LOCK:
+            MARKET_CACHE[key] = (now_ts(), e)
+            _CACHE_INFLIGHT.pop(key, None)
+        fut.set_exception(e)
+        raise
+    with _CACHE_LOCK:
+        MARKET_CACHE[key] = (now_ts(), value)
+        _CACHE_INFLIGHT.pop(key, None)
+    fut.set_result(value)
+    return value
+
+
+def cache_fresh(ex_id: str, endpoint: str, symbol) -> bool:
+    with _CACHE_LOCK:
+        ent = MARKET_CACHE.get((ex_id, endpoint, symbol))
+    return ent is not None and now_ts() - ent[0] <= CACHE_TTL_SEC.get(endpoint, 0.0)
+
+
+def cache_put(ex_id: str, endpoint: str, symbol, value):
+    """bulk 응답을 심볼 단위 캐시에 분배 (실패도 예외 그대로 저장)"""
+    with _CACHE_LOCK:
+        MARKET_CACHE[(ex_id, endpoint, symbol)] = (now_ts(), value)
+        stats = CACHE_STATS.setdefault(endpoint, {"hit": 0, "miss": 0, "coalesced": 0})
+        stats["miss"] += 1
+
+
+def cache_stats_totals() -> dict:
+    tot = {"hit": 0, "miss": 0, "coalesced": 0}
+    with _CACHE_LOCK:
+        for st in CACHE_STATS.values():
+            for k in tot:
+                tot[k] += st[k]
+    return tot
+
+
+def observe_ticker(venue: str, symbol: str, bid, ask, last):
+    """
+    시세 관측 콜백. REST 티커 / 웹소켓 체결 / 워커 shm 레코드가 모두 여기를 거침
+    → 시세가 어느 경로로 들어오든 같은 관측자가 샘플을 받음
+    """
+    equity_mark(venue, symbol, last or bid, bid)
+    vol_observe(venue, symbol, last or bid)
+    if RECORDER is not None:
+        RECORDER.ticker(venue, symbol, bid, ask, last)
+        if symbol == "USDT/KRW":
+            RECORDER.fx(venue, bid)
+    if bid and ask:
+        check_book_trigger(venue, symbol, (bid + ask) / 2)
+
+
+def observe_book(venue: str, symbol: str, bids, asks):
+    """오더북 관측 콜백 (REST 조회 / 웹소켓 스냅샷 / 워커 shm 레코드): 레코더 + 오더북 변화 트리거"""
+    if RECORDER is not None:
+        RECORDER.book(venue, symbol, bids, asks)
+    if bids and asks:
+        check_book_trigger(venue, symbol, (bids[0][0] + asks[0][0]) / 2)
+
+
+def _parse_ticker(e, symbol: str, t: dict, recv_ts: float) -> dict:
+    t["recv_ts"] = recv_ts
+    bid = t.get("bid") or t.get("last")
+    ask = t.get("ask") or t.get("last")
+    if not bid or not ask:
+        raise Exception(f"invalid ticker {e.id} {symbol} {t}")
+    t["bid"], t["ask"] = bid, ask
+    observe_ticker(exchange_name(e), symbol, bid, ask, t.get("last"))
+    return t
+
+
+def _fetch_ticker_raw(e, symbol: str):
+    try:
+        t = hedged_read(exchange_name(e), "ticker", lambda: e.fetch_ticker(symbol))
+        return _parse_ticker(e, symbol, t, now_ts())
+    except Exception as e2:
+        record_exchange_error(e.id, e2)
+        raise
+
+
+def _fetch_tickers_bulk(e, symbols) -> list:
+    """
+    fetch_tickers 1회 → 심볼별 "ticker" 캐시에 분배. 응답에 빠진 심볼 목록을 돌려줌 (개별 조회 대상).
+    호출 자체가 실패하면 모든 심볼에 같은 예외를 저장 → 소비자는 추가 요청 없이 기존처럼 예외 처리
+    """
+    try:
+        raw = hedged_read(exchange_name(e), "tickers", lambda: e.fetch_tickers(list(symbols)))
+    except Exception as e2:
+        record_exchange_error(e.id, e2)
+        for sym in symbols:
+            cache_put(e.id, "ticker", sym, e2)
+        raise
+    recv_ts = now_ts()
+    missing = []
+    for sym in symbols:
+        t = raw.get(sym)
+        if not t:
+            missing.append(sym)
+            continue
+        try:
+            cache_put(e.id, "ticker", sym, _parse_ticker(e, sym, t, recv_ts))
+        except Exception:
+            missing.append(sym)
+    return missing
+
+
 def safe_ticker(e, symbol: str):
     if is_exchange_disabled(e.id):
         raise Exception(f"exchange {e.id} disabled")
-    try:
-        t = e.fetch_ticker(symbol)
-        bid = t.get("bid") or t.get("last")
-        ask = t.get("ask") or t.get("last")
-        if not bid or not ask:
-            raise Exception(f"invalid ticker {e.id} {symbol} {t}")
-        t["bid"], t["ask"] = bid, ask
+    t = stream_ticker(e.id, symbol) or shm_ticker(e.id, symbol)
+    if t is not None:
         return t
+    return dict(cached_fetch(e.id, "ticker", symbol, lambda: _fetch_ticker_raw(e, symbol)))
+
+
+def _fetch_orderbook_raw(e, symbol: str, depth: int):
+    try:
+        ob = hedged_read(exchange_name(e), "orderbook", lambda: e.fetch_order_book(symbol, depth))
+        ob["recv_ts"] = now_ts()
+        if not ob["bids"] or not ob["asks"]:
+            raise Exception("empty ob")
+        observe_book(exchange_name(e), symbol, ob["bids"], ob["asks"])
+        return ob
     except Exception as e2:
-        record_exchange_error(e.id)
+        print(f"[OB] {e.id} {symbol} ERR {str(e2)[:80]}")
+        record_exchange_error(e.id, e2)
         raise
 
 
@@ -394,15 +1690,55 @@ def safe_orderbook(e, symbol: str, depth: int = 10):
     if is_exchange_disabled(e.id):
         print(f"[OB] {e.id} disabled")
         return None
-    try:
-        ob = e.fetch_order_book(symbol, depth)
-        if not ob["bids"] or not ob["asks"]:
-            raise Exception("empty ob")
+    ob = stream_orderbook(e.id, symbol, depth) or shm_orderbook(e.id, symbol, depth)
+    if ob is not None:
         return ob
-    except Exception as e2:
-        print(f"[OB] {e.id} {symbol} ERR {str(e2)[:80]}")
-        record_exchange_error(e.id)
+    # depth 10 이하 요청은 모두 depth 10 캐시 하나를 공유
+    fetch_depth = max(depth, 10)
+    key_sym = symbol if fetch_depth == 10 else f"{symbol}@{fetch_depth}"
+    try:
+        ob = cached_fetch(e.id, "orderbook", key_sym, lambda: _fetch_orderbook_raw(e, symbol, fetch_depth))
+    except Exception:
         return None
+    return {**ob, "bids": ob["bids"][:depth], "asks": ob["asks"][:depth]}
+
+
+def _fetch_funding_rate_raw(e, symbol: str):
+    fr = hedged_read(exchange_name(e), "funding", lambda: e.fetch_funding_rate(symbol))
+    fr["recv_ts"] = now_ts()
+    if RECORDER is not None:
+        RECORDER.funding(exchange_name(e), symbol, fr["fundingRate"])
+    return fr
+
+
+def _fetch_funding_rates_bulk(e, symbols) -> list:
+    """fetch_funding_rates 1회 → 심볼별 "funding" 캐시에 분배 (_fetch_tickers_bulk 와 같은 규칙)"""
+    try:
+        raw = hedged_read(exchange_name(e), "fundings", lambda: e.fetch_funding_rates(list(symbols)))
+    except Exception as e2:
+        for sym in symbols:
+            cache_put(e.id, "funding", sym, e2)
+        raise
+    recv_ts = now_ts()
+    missing = []
+    for sym in symbols:
+        fr = raw.get(sym)
+        if not fr or fr.get("fundingRate") is None:
+            missing.append(sym)
+            continue
+        fr["recv_ts"] = recv_ts
+        if RECORDER is not None:
+            RECORDER.funding(exchange_name(e), sym, fr["fundingRate"])
+        cache_put(e.id, "funding", sym, fr)
+    return missing
+
+
+def _fetch_ohlcv_raw(e, symbol: str, timeframe: str, limit: int):
+    return hedged_read(exchange_name(e), "ohlcv", lambda: e.fetch_ohlcv(symbol, timeframe, limit=limit))
+
+
+def cached_funding_rate(e, symbol: str):
+    return cached_fetch(e.id, "funding", symbol, lambda: _fetch_funding_rate_raw(e, symbol))
 
 
 def get_usdt_krw() -> float:
@@ -419,6 +1755,7 @@ def get_usdt_krw() -> float:
     return FX_FALLBACK_USDT_KRW
 
 
+@request_priority("equity")
 def estimate_total_equity_krw() -> float:
     global LAST_EQUITY_KRW
     try:
@@ -428,103 +1765,242 @@ def estimate_total_equity_krw() -> float:
             return LAST_EQUITY_KRW
         t_btc = safe_ticker(b, "BTC/USDT")
         t_eth = safe_ticker(b, "ETH/USDT")
-        btc_usdt = float(t_btc["last"])
-        eth_usdt = float(t_eth["last"])
-        total_krw = 0.0
-
-        # 업비트/빗썸
-        for name in ["upbit", "bithumb"]:
-            inst = ex.get(name)
-            if not inst or is_exchange_disabled(name):
-                continue
-            try:
-                bal = inst.fetch_balance()
-            except Exception as e:
-                print(f"[EQ] {name} balance ERR {e}")
-                record_exchange_error(name)
-                continue
-            krw = float(bal.get("KRW", {}).get("total", 0) or 0)
-            btc = float(bal.get("BTC", {}).get("total", 0) or 0)
-            eth = float(bal.get("ETH", {}).get("total", 0) or 0)
-            total_krw += krw + btc * btc_usdt * usdt_krw + eth * eth_usdt * usdt_krw
-
-        # 바이낸스
-        if b and not is_exchange_disabled("binance"):
-            try:
-                bal = b.fetch_balance()
-                usdt = float(bal.get("USDT", {}).get("total", 0) or 0)
-                btc = float(bal.get("BTC", {}).get("total", 0) or 0)
-                eth = float(bal.get("ETH", {}).get("total", 0) or 0)
-                total_krw += usdt * usdt_krw + btc * btc_usdt * usdt_krw + eth * eth_usdt * usdt_krw
-            except Exception as e:
-                print(f"[EQ] binance balance ERR {e}")
-                record_exchange_error("binance")
-
-        # OKX
-        inst = ex.get("okx")
-        if inst and not is_exchange_disabled("okx"):
-            try:
-                bal = inst.fetch_balance()
-                usdt = float(bal.get("USDT", {}).get("total", 0) or 0)
-                total_krw += usdt * usdt_krw
-            except Exception as e:
-                print(f"[EQ] okx balance ERR {e}")
-                record_exchange_error("okx")
-
-        # Bybit
-        inst = ex.get("bybit")
-        if inst and not is_exchange_disabled("bybit"):
-            try:
-                bal = inst.fetch_balance()
-                usdt = float(bal.get("USDT", {}).get("total", 0) or 0)
-                usd = float(bal.get("USD", {}).get("total", 0) or 0)
-                total_krw += (usdt + usd) * usdt_krw
-            except Exception as e:
-                print(f"[EQ] bybit balance ERR {e}")
-                record_exchange_error("bybit")
-
+        marks = {"USDT": usdt_krw, "BTC": float(t_btc["last"]), "ETH": float(t_eth["last"])}
+        units = equity_units()
+        total_krw = equity_value(units, marks)
         if total_krw <= 0:
             return LAST_EQUITY_KRW
         LAST_EQUITY_KRW = total_krw
+        equity_reset(units, marks)
         return total_krw
     except Exception as e:
         print(f"[EQ] estimate ERR {e}")
         return LAST_EQUITY_KRW
 
 
-def get_daily_volatility() -> float:
-    try:
-        b = ex["binance"]
-        if is_exchange_disabled("binance"):
-            return 0.0
-        ohlcv = b.fetch_ohlcv("BTC/USDT", "1d", limit=2)
-        if len(ohlcv) < 2:
+###############################################################################
+# ROLLING WINDOW (O(1) 평균/분산)
+###############################################################################
+
+
+class RollingWindow:
+    """
+    고정 길이 rolling window. append / mean / std / zscore 모두 O(1).
+    합계는 첫 값 기준으로 shift 해서 누적 (가격처럼 큰 값에서도 분산 계산 오차 최소화),
+    maxlen 번 갱신마다 한 번 전체 재합산해서 부동소수 누적 오차를 리셋.
+    """
+    __slots__ = ("maxlen", "buf", "shift", "total", "total_sq", "_updates")
+
+    def __init__(self, maxlen: int):
+        self.maxlen = max(1, int(maxlen))
+        self.buf = deque(maxlen=self.maxlen)
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._updates = 0
+
+    def __len__(self):
+        return len(self.buf)
+
+    def append(self, x: float):
+        if self.shift is None:
+            self.shift = x
+        if len(self.buf) == self.maxlen:
+            old = self.buf[0] - self.shift
+            self.total -= old
+            self.total_sq -= old * old
+        self.buf.append(x)
+        d = x - self.shift
+        self.total += d
+        self.total_sq += d * d
+        self._updates += 1
+        if self._updates >= self.maxlen:
+            self._resum()
+
+    def _resum(self):
+        self.shift = self.buf[-1]
+        ds = [v - self.shift for v in self.buf]
+        self.total = sum(ds)
+        self.total_sq = sum(d * d for d in ds)
+        self._updates = 0
+
+    def first(self) -> float:
+        return self.buf[0]
+
+    def last(self) -> float:
+        return self.buf[-1]
+
+    def mean(self) -> float:
+        n = len(self.buf)
+        return self.shift + self.total / n if n else 0.0
+
+    def var(self) -> float:
+        """모분산 (기존 z_score_filter 와 동일하게 n 으로 나눔)"""
+        n = len(self.buf)
+        if not n:
             return 0.0
-        p0 = ohlcv[0][4]
-        p1 = ohlcv[1][4]
-        return abs((p1 - p0) / p0 * 100)
+        m = self.total / n
+        return max(0.0, self.total_sq / n - m * m)
+
+    def std(self) -> float:
+        return self.var() ** 0.5
+
+    def zscore(self, x: float):
+        """표준편차가 0 이면 None"""
+        std = self.std()
+        if std <= 1e-9:
+            return None
+        return (x - self.mean()) / std
+
+
+###############################################################################
+# VOLATILITY ENGINE (관측 시세 → EWMA / 일중 realized vol)
+# - 이미 받는 바이낸스 티커/웹소켓 체결가를 VOL_BAR_SEC 봉 종가로 묶어 로그수익률 계산
+# - EWMA 분산 + 최근 VOL_RV_BARS 봉 realized 분산. 봉 분산 × 하루 봉 수 → 기존과 같은 "일간 %" 단위
+# - EWMA 는 1d OHLCV (캐시) 로 한 번 seed → 이후 틱마다 REST 없음
+###############################################################################
+
+VOL_VENUE = "binance"
+
+
+class VolEngine:
+    __slots__ = ("bar_sec", "decay", "bar_ts", "bar_close", "prev_close", "ewma_var", "rv", "last_ts")
+
+    def __init__(self, bar_sec: float = None, halflife_bars: float = None, rv_bars: int = None):
+        # 기본값은 생성 시점의 전역값 (import 시점에 묶으면 backtest --set 이 반영 안 됨)
+        self.bar_sec = float(VOL_BAR_SEC if bar_sec is None else bar_sec)
+        halflife_bars = VOL_EWMA_HALFLIFE_BARS if halflife_bars is None else halflife_bars
+        self.decay = 0.5 ** (1.0 / halflife_bars)  # 봉 1개당 EWMA 가중치 감소
+        self.bar_ts = None       # 진행 중인 봉 시작 시각
+        self.bar_close = None    # 진행 중인 봉의 마지막 가격
+        self.prev_close = None   # 직전 봉 종가
+        self.ewma_var = None     # 봉 1개당 분산
+        self.rv = RollingWindow(VOL_RV_BARS if rv_bars is None else rv_bars)  # 봉 1개 기준으로 환산한 수익률
+        self.last_ts = 0.0
+
+    def seed(self, daily_var: float):
+        self.ewma_var = daily_var * self.bar_sec / 86400.0
+
+    def update(self, ts: float, price: float):
+        if not price or price <= 0:
+            return
+        b = ts - ts % self.bar_sec
+        if self.bar_ts is not None and b > self.bar_ts:
+            self._close_bar(int(round((b - self.bar_ts) / self.bar_sec)))
+        if self.bar_ts is None or b >= self.bar_ts:
+            self.bar_ts = b
+            self.bar_close = price
+            self.last_ts = ts
+
+    def _close_bar(self, k: int):
+        """진행 중인 봉 마감. k = 다음 봉까지 지난 봉 수 (빈 봉 포함)"""
+        if self.prev_close is not None and k <= VOL_MAX_GAP_BARS:
+            r = math.log(self.bar_close / self.prev_close)
+            span = max(1, k)
+            per_bar = r * r / span
+            w = self.decay ** span
+            self.ewma_var = per_bar if self.ewma_var is None else w * self.ewma_var + (1 - w) * per_bar
+            self.rv.append(r / math.sqrt(span))
+        # 긴 공백 뒤 첫 봉은 기준가 없이 시작 (공백 구간 수익률은 버림)
+        self.prev_close = self.bar_close if k <= VOL_MAX_GAP_BARS else None
+
+    def _daily_pct(self, bar_var) -> float:
+        return math.sqrt(max(bar_var, 0.0) * 86400.0 / self.bar_sec) * 100
+
+    def ewma_vol(self):
+        return None if self.ewma_var is None else self._daily_pct(self.ewma_var)
+
+    def realized_vol(self):
+        """최근 VOL_RV_BARS 봉 realized vol (수익률 제곱 평균 기준)"""
+        if len(self.rv) < 2:
+            return None
+        m = self.rv.mean()
+        return self._daily_pct(self.rv.var() + m * m)
+
+
+VOL_ENGINES = {}
+_VOL_LOCK = threading.Lock()
+
+
+def vol_observe(venue: str, symbol: str, price):
+    """observe_ticker 에서 호출. VOL_VENUE 가 아니면 바로 리턴"""
+    if venue != VOL_VENUE or not price:
+        return
+    with _VOL_LOCK:
+        eng = VOL_ENGINES.get(symbol)
+        if eng is None:
+            eng = VOL_ENGINES[symbol] = VolEngine()
+        eng.update(now_ts(), float(price))
+
+
+def vol_needs_seed(symbol: str = "BTC/USDT") -> bool:
+    eng = VOL_ENGINES.get(symbol)
+    return eng is None or eng.ewma_var is None
+
+
+def _fetch_vol_seed(symbol: str):
+    b = ex[VOL_VENUE]
+    return cached_fetch(VOL_VENUE, "ohlcv", symbol,
+                        lambda: _fetch_ohlcv_raw(b, symbol, "1d", VOL_SEED_DAYS + 1))
+
+
+def seed_volatility(symbol: str = "BTC/USDT"):
+    """최근 VOL_SEED_DAYS 일 종가 로그수익률 제곱 평균 → 일간 분산 seed"""
+    if VOL_VENUE not in ex or is_exchange_disabled(VOL_VENUE):
+        return
+    try:
+        ohlcv = _fetch_vol_seed(symbol)
     except Exception as e:
-        print(f"[VOL] ERR {e}")
-        record_exchange_error("binance")
-        return 0.0
+        print(f"[VOL] seed ERR {e}")
+        record_exchange_error(VOL_VENUE, e)
+        return
+    closes = [c[4] for c in ohlcv if c[4]]
+    if len(closes) < 2:
+        return
+    var = sum(math.log(p1 / p0) ** 2 for p0, p1 in zip(closes, closes[1:])) / (len(closes) - 1)
+    with _VOL_LOCK:
+        eng = VOL_ENGINES.get(symbol)
+        if eng is None:
+            eng = VOL_ENGINES[symbol] = VolEngine()
+        if eng.ewma_var is None:
+            eng.seed(var)
+
+
+def get_daily_volatility(symbol: str = "BTC/USDT") -> float:
+    """EWMA 변동성 (일간 %). seed 전이면 OHLCV 캐시로 한 번 seed"""
+    if vol_needs_seed(symbol):
+        seed_volatility(symbol)
+    eng = VOL_ENGINES.get(symbol)
+    v = eng.ewma_vol() if eng is not None else None
+    return 0.0 if v is None else v
+
+
+def get_realized_volatility(symbol: str = "BTC/USDT") -> float:
+    eng = VOL_ENGINES.get(symbol)
+    v = eng.realized_vol() if eng is not None else None
+    return 0.0 if v is None else v
+
+
+# 국내 거래소 최근 체결가 (price_speed 용). (venue, symbol) -> RollingWindow (처음 쓸 때 생성)
+price_history = {}
 
 ###############################################################################
 # PRICE SPEED / IMBALANCE
 ###############################################################################
 
 
-def record_price(source: str, price: float):
-    ph = price_history[source]
+def record_price(source, price: float):
+    ph = price_history.get(source)
+    if ph is None:
+        ph = price_history[source] = RollingWindow(PRICE_HISTORY_LEN)
     ph.append(price)
-    if len(ph) > 50:
-        ph.pop(0)
 
 
-def price_speed(source: str) -> float:
-    ph = price_history[source]
-    if len(ph) < 3:
+def price_speed(source) -> float:
+    ph = price_history.get(source)
+    if ph is None or len(ph) < 3:
         return 0.0
-    return (ph[-1] - ph[0]) / (abs(ph[0]) + 1e-9)
+    return (ph.last() - ph.first()) / (abs(ph.first()) + 1e-9)
 
 
 def orderbook_imbalance(ob) -> float:
@@ -538,18 +2014,136 @@ def orderbook_imbalance(ob) -> float:
     return (bid_vol - ask_vol) / tot
 
 
-def predict_premium_prob(vol: float) -> float:
-    up_speed = price_speed("upbit")
-    bt_speed = price_speed("bithumb")
-    if "upbit" not in ex or is_exchange_disabled("upbit"):
-        return 0.0
-    ob = safe_orderbook(ex["upbit"], "BTC/KRW", depth=5)
-    imbal = orderbook_imbalance(ob)
+###############################################################################
+# PREMIUM FEATURES / ONLINE MODEL
+# - update_premium_features(): 스프레드 스냅샷(이미 받은 시세)으로 심볼별 특징을 증분 갱신 (추가 I/O 없음)
+# - 특징: 업비트/빗썸 가격 속도, 오더북 불균형(상위 5호가), 변동성, 프리미엄 모멘텀
+# - PRED_HORIZON_SEC 뒤 결과로 라벨을 붙여 OnlineLogit 을 SGD 1스텝씩 학습, 가중치는 state DB 에 저장
+###############################################################################
+
+PRED_FEATURES = ("upbit_speed", "bithumb_speed", "volatility", "orderbook_imbalance", "premium_momentum")
+PRED_IMBALANCE_DEPTH = 5
+PRED_MOMENTUM_ALPHA = 0.1  # 프리미엄 EWMA (모멘텀 = 현재 - EWMA)
+
+
+class OnlineLogit:
+    """가중치 list 로 된 로지스틱 회귀. predict / update 모두 특징 수에 비례 (수 μs)"""
+    __slots__ = ("w", "b", "n", "lr", "l2")
+
+    def __init__(self, n_features: int, lr: float = None, l2: float = None):
+        self.w = [0.0] * n_features
+        self.b = 0.0
+        self.n = 0
+        self.lr = PRED_LEARNING_RATE if lr is None else lr
+        self.l2 = PRED_L2 if l2 is None else l2
+
+    def predict(self, x) -> float:
+        z = self.b + sum(wi * xi for wi, xi in zip(self.w, x))
+        if z < -30:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def update(self, x, y: float):
+        g = y - self.predict(x)
+        self.w = [wi + self.lr * (g * xi - self.l2 * wi) for wi, xi in zip(self.w, x)]
+        self.b += self.lr * g
+        self.n += 1
+
+    def to_dict(self) -> dict:
+        return {"features": list(PRED_FEATURES), "w": self.w, "b": self.b, "n": self.n}
+
+    def load(self, data):
+        if not data or data.get("features") != list(PRED_FEATURES):
+            return False
+        self.w = [float(v) for v in data["w"]]
+        self.b = float(data["b"])
+        self.n = int(data["n"])
+        return True
+
+
+PREMIUM_MODEL = OnlineLogit(len(PRED_FEATURES))
+PREMIUM_FEATURES = {}  # symbol -> {"x": 특징 list, "prem": 프리미엄, "prem_ewma": ..., "pending": deque}
+_PRED_SAVE_TS = 0.0
+
+
+def feature_vector(symbol: str, vol: float = None):
+    """저장된 특징 (volatility 는 주어지면 교체). 아직 없으면 None"""
+    ent = PREMIUM_FEATURES.get(symbol)
+    if ent is None:
+        return None
+    x = list(ent["x"])
+    if vol is not None:
+        x[2] = vol / 15.0
+    return x
+
+
+def _learn_premium(ent: dict, now: float, prem: float):
+    """horizon 이 지난 과거 샘플에 라벨을 붙여 한 스텝씩 학습"""
+    pending = ent["pending"]
+    while pending and now - pending[0][0] >= PRED_HORIZON_SEC:
+        _, x, p0 = pending.popleft()
+        PREMIUM_MODEL.update(x, 1.0 if abs(prem) >= abs(p0) + PRED_LABEL_MOVE_PCT else 0.0)
+
+
+def update_premium_features(snap: dict, usdt_krw: float):
+    """스프레드 스냅샷 → 심볼별 특징 갱신 + 라벨 도착한 샘플 학습"""
+    global _PRED_SAVE_TS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mid = (snap["bids_px"][..., 0] + snap["asks_px"][..., 0]) / 2
+        prem = (mid / usdt_krw / snap["base_usdt"][:, None] - 1) * 100
+        bq = snap["bids_qty"][..., :PRED_IMBALANCE_DEPTH].sum(axis=-1)
+        aq = snap["asks_qty"][..., :PRED_IMBALANCE_DEPTH].sum(axis=-1)
+        imbal = np.where(bq + aq > 0, (bq - aq) / (bq + aq), np.nan)
+    # 업비트 우선, 없으면 빗썸
+    prem = np.where(np.isnan(prem[:, 0]), prem[:, -1], prem[:, 0])
+    imbal = np.where(np.isnan(imbal[:, 0]), imbal[:, -1], imbal[:, 0])
+
+    now = now_ts()
+    for i, symbol in enumerate(snap["symbols"]):
+        p = float(prem[i])
+        if not math.isfinite(p):
+            continue
+        ent = PREMIUM_FEATURES.get(symbol)
+        if ent is None:
+            ent = PREMIUM_FEATURES[symbol] = {"x": None, "prem": p, "prem_ewma": p, "pending": deque()}
+        _learn_premium(ent, now, p)
+        ent["prem_ewma"] += PRED_MOMENTUM_ALPHA * (p - ent["prem_ewma"])
+        eng = VOL_ENGINES.get(f"{symbol}/USDT")
+        vol = (eng.ewma_vol() if eng is not None else None) or 0.0
+        ib = float(imbal[i])
+        ent["x"] = [
+            price_speed(("upbit", symbol)) * 100,
+            price_speed(("bithumb", symbol)) * 100,
+            vol / 15.0,
+            ib if math.isfinite(ib) else 0.0,
+            p - ent["prem_ewma"],
+        ]
+        ent["prem"] = p
+        ent["pending"].append((now, ent["x"], p))
+
+    if now - _PRED_SAVE_TS >= PRED_SAVE_SEC:
+        _PRED_SAVE_TS = now
+        store_put("premium_model", PREMIUM_MODEL.to_dict())
+
+
+def load_premium_model():
+    if PREMIUM_MODEL.load(store_get("premium_model")):
+        print(f"[PRED] model loaded (n={PREMIUM_MODEL.n})")
+
+
+def predict_premium_prob(vol: float, symbol: str = "BTC") -> float:
+    """저장된 특징으로 예측 (I/O 없음). 학습 샘플이 적으면 PREMIUM_PRED_WEIGHTS 고정 점수"""
+    x = feature_vector(symbol, vol)
+    if x is None:
+        x = [0.0, 0.0, vol / 15.0, 0.0, 0.0]
+    if PREMIUM_MODEL.n >= PRED_MIN_UPDATES:
+        return PREMIUM_MODEL.predict(x)
+    # 기존 점수: 가격 속도는 비율 단위였으므로 특징(%)에서 되돌림
     score = (
-        PREMIUM_PRED_WEIGHTS["upbit_speed"] * up_speed +
-        PREMIUM_PRED_WEIGHTS["bithumb_speed"] * bt_speed +
-        PREMIUM_PRED_WEIGHTS["volatility"] * (vol / 15.0) +
-        PREMIUM_PRED_WEIGHTS["orderbook_imbalance"] * imbal
+        PREMIUM_PRED_WEIGHTS["upbit_speed"] * x[0] / 100 +
+        PREMIUM_PRED_WEIGHTS["bithumb_speed"] * x[1] / 100 +
+        PREMIUM_PRED_WEIGHTS["volatility"] * x[2] +
+        PREMIUM_PRED_WEIGHTS["orderbook_imbalance"] * x[3]
     )
     return max(0.0, min(1.0, score))
 
@@ -558,7 +2152,68 @@ def predict_premium_prob(vol: float) -> float:
 ###############################################################################
 
 
+class BookIndex:
+    """
+    한쪽 호가(asks 또는 bids)의 누적 수량/누적 금액 인덱스.
+    VWAP(수량), 수량(VWAP 한도), 수량(슬리피지 한도) 질의를 bisect 로 O(log depth) 에 답함.
+    """
+
+    __slots__ = ("sign", "px", "cum_qty", "cum_cost", "_keys")
+
+    def __init__(self, levels, is_ask: bool):
+        self.sign = 1.0 if is_ask else -1.0  # VWAP 가 불리해지는 방향
+        lv = [(float(x[0]), float(x[1])) for x in levels if float(x[1]) > 0]
+        self.px = [p for p, _ in lv]
+        self.cum_qty = list(accumulate(q for _, q in lv))
+        self.cum_cost = list(accumulate(p * q for p, q in lv))
+        # 각 호가를 다 먹었을 때 VWAP (부호 맞춰서 단조 증가)
+        self._keys = [self.sign * c / q for c, q in zip(self.cum_cost, self.cum_qty)]
+        if self._keys:
+            self._keys[0] = self.sign * self.px[0]  # p*q/q 반올림 오차로 최우선호가보다 불리하게 잡히지 않게
+
+    @property
+    def depth(self) -> float:
+        return self.cum_qty[-1] if self.cum_qty else 0.0
+
+    def top(self):
+        return self.px[0] if self.px else None
+
+    def cost(self, amount: float):
+        """amount 를 채우는 총 금액 (깊이 부족이면 None)"""
+        k = bisect_left(self.cum_qty, amount)
+        if k >= len(self.px):
+            return None
+        q0 = self.cum_qty[k - 1] if k else 0.0
+        c0 = self.cum_cost[k - 1] if k else 0.0
+        return c0 + (amount - q0) * self.px[k]
+
+    def vwap(self, amount: float):
+        if amount <= 0:
+            return self.top()
+        c = self.cost(amount)
+        return None if c is None else c / amount
+
+    def size_for_vwap(self, limit: float) -> float:
+        """VWAP 가 limit 보다 불리해지지 않는 최대 수량"""
+        k = bisect_right(self._keys, self.sign * limit)
+        if k >= len(self.px):
+            return self.depth
+        if k == 0:
+            return 0.0
+        q0, c0, p = self.cum_qty[k - 1], self.cum_cost[k - 1], self.px[k]
+        # (c0 + p*x) / (q0 + x) = limit 을 x 에 대해 풂
+        return q0 + (limit * q0 - c0) / (p - limit)
+
+    def size_for_slippage(self, max_slip: float) -> float:
+        """VWAP 가 최우선호가 대비 max_slip(비율) 이내인 최대 수량"""
+        top = self.top()
+        if top is None:
+            return 0.0
+        return self.size_for_vwap(top * (1 + self.sign * max_slip))
+
+
 def calc_vwap(ob, amount: float, is_buy: bool):
+    """한 번만 묻는 경우 (인덱스를 만드는 것보다 한 번 훑는 게 빠름)"""
     if not ob:
         return None
     side = ob["asks"] if is_buy else ob["bids"]
@@ -574,28 +2229,53 @@ def calc_vwap(ob, amount: float, is_buy: bool):
     return cost / amount
 
 
+def solve_spread_size(dom: BookIndex, bin_: BookIndex, usdt_krw: float, side: str, min_net_pct: float, max_amount: float) -> float:
+    """
+    국내/바이낸스 양쪽 VWAP 로 계산한 순엣지(프리미엄 - 수수료 버퍼)가 min_net_pct 이상인 최대 수량.
+    SELL: dom=국내 bids, bin_=바이낸스 asks / BUY: dom=국내 asks, bin_=바이낸스 bids.
+    수량이 늘수록 순엣지는 단조 감소 → 이분탐색.
+    """
+    hi = min(dom.depth, bin_.depth, max_amount)
+    if hi <= 0:
+        return 0.0
+
+    def net(a):
+        prem = (dom.vwap(a) / usdt_krw / bin_.vwap(a) - 1) * 100
+        return (prem if side == "SELL" else -prem) - EDGE_BUFFER_FEE_PCT
+
+    if net(0.0) < min_net_pct:
+        return 0.0
+    if net(hi) >= min_net_pct:
+        return hi
+    lo = 0.0
+    for _ in range(40):
+        mid = (lo + hi) / 2
+        if net(mid) >= min_net_pct:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
 def update_premium_history(history_dict, symbol: str, prem: float):
-    arr = history_dict[symbol]
+    arr = history_dict.get(symbol)
+    if arr is None:
+        arr = history_dict[symbol] = RollingWindow(Z_SCORE_WINDOW)
     arr.append(prem)
-    if len(arr) > Z_SCORE_WINDOW:
-        arr.pop(0)
 
 
 def z_score_filter(history_dict, symbol: str, prem: float) -> bool:
     """z-score 기준 필터: True면 통과, False면 스킵"""
     if not Z_SCORE_ENABLED:
         return True
-    arr = history_dict[symbol]
-    if len(arr) < 10:
+    arr = history_dict.get(symbol)
+    if arr is None or len(arr) < 10:
         # 데이터가 충분치 않으면 필터 적용 안함
         return True
-    mean = sum(arr) / len(arr)
-    var = sum((x - mean) ** 2 for x in arr) / len(arr)
-    std = var ** 0.5
-    if std <= 1e-9:
+    z = arr.zscore(prem)
+    if z is None:
         return False
-    z = abs((prem - mean) / std)
-    return z >= Z_SCORE_THR
+    return abs(z) >= Z_SCORE_THR
 
 
 def auto_tier1_params(vol: float, trade_times):
@@ -615,16 +2295,261 @@ def auto_tier1_params(vol: float, trade_times):
     base_ratio = max(BASE_RATIO_MIN, min(BASE_RATIO_MAX, base_ratio))
     return thr, base_ratio
 
+###############################################################################
+# BALANCE LEDGER (잔고 원장)
+# - reconcile_balances(): 거래소 잔고 조회 → 원장 교체 (주기적 / drift 감지 시에만)
+# - ledger_apply_fill(): place_market_order 체결 결과로 원장 증분 갱신
+# - 의사결정 경로는 ledger_balance() 만 사용 → private 잔고 요청 없음
+###############################################################################
+
+
+def exchange_name(inst) -> str:
+    """ex / ex_fut 에 등록된 이름 (binance_fut 등). 못 찾으면 inst.id"""
+    for pool in (ex, ex_fut):
+        for name, e in pool.items():
+            if e is inst:
+                return name
+    return inst.id
+
+
+def _ledger_from_balance(bal) -> dict:
+    out = {}
+    free, total = bal.get("free") or {}, bal.get("total") or {}
+    for asset in set(free) | set(total):
+        f = float(free.get(asset) or 0)
+        t = float(total.get(asset) or 0)
+        if f or t:
+            out[asset] = {"free": f, "total": t}
+    return out
+
+
+def ledger_balance(name: str) -> dict:
+    """원장 잔고. seed 전이면 예외 (호출부는 기존 잔고 에러처럼 스킵)"""
+    with _LEDGER_LOCK:
+        bal = BALANCE_LEDGER.get(name)
+        if bal is None:
+            LEDGER_DIRTY.add(name)
+            raise Exception(f"no ledger balance for {name}")
+        return {a: dict(v) for a, v in bal.items()}
+
+
+def _ledger_add(bal: dict, asset: str, delta: float) -> bool:
+    ent = bal.setdefault(asset, {"free": 0.0, "total": 0.0})
+    ent["free"] += delta
+    ent["total"] += delta
+    return ent["free"] >= -1e-9
+
+
+def ledger_apply_fill(inst, symbol: str, side: str, filled: float, price: float):
+    """자체 체결을 원장에 반영. 가격을 모르거나 선물/음수 잔고면 drift 로 보고 다음 대조 대상"""
+    name = exchange_name(inst)
+    with _LEDGER_LOCK:
+        bal = BALANCE_LEDGER.get(name)
+        if bal is None or ":" in symbol or not price or filled <= 0:
+            LEDGER_DIRTY.add(name)
+            return
+        base, quote = symbol.split("/")
+        cost = filled * float(price)
+        fee = cost * FEE_RATES.get(inst.id, DEFAULT_FEE_RATE)
+        if side.lower() == "buy":
+            d_base, d_quote = filled, -(cost + fee)
+        else:
+            d_base, d_quote = -filled, cost - fee
+        ok = _ledger_add(bal, base, d_base) & _ledger_add(bal, quote, d_quote)
+        equity_apply_fill(name, base, d_base)
+        equity_apply_fill(name, quote, d_quote)
+        if not ok:
+            print(f"[LEDGER] {name} 음수 잔고 → drift, 다음 루프에 대조")
+            LEDGER_DIRTY.add(name)
+
+
+def ledger_names():
+    return list(ex) + list(ex_fut)
+
+
+def reconcile_balances(force: bool = False):
+    """
+    주기(BALANCE_RECONCILE_SEC)가 지났거나 drift 표시된 거래소만 잔고를 다시 조회해 원장 교체.
+    조회는 스레드풀로 동시에 수행.
+    """
+    now = now_ts()
+    due = []
+    for name in ledger_names():
+        if is_exchange_disabled(name):
+            continue
+        if force or name in LEDGER_DIRTY or now - LEDGER_SYNC_TS.get(name, 0.0) >= BALANCE_RECONCILE_SEC:
+            due.append(name)
+    if not due:
+        return
+    pool = get_fetch_pool()
+    insts = {**ex, **ex_fut}
+    def fetch_balance(name):
+        with venue_call(name, "balance", "equity"):
+            return insts[name].fetch_balance()
+
+    futures = [(name, pool.submit(fetch_balance, name)) for name in due]
+    for name, fut in futures:
+        try:
+            fresh = _ledger_from_balance(fut.result())
+        except AuthenticationError as ae:
+            print(f"[LEDGER] {name} balance auth ERR {ae}")
+            record_exchange_error(name)
+            continue
+        except Exception as e:
+            print(f"[LEDGER] {name} balance ERR {e}")
+            record_exchange_error(name)
+            continue
+        with _LEDGER_LOCK:
+            old = BALANCE_LEDGER.get(name)
+            if old is not None:
+                for asset in set(old) | set(fresh):
+                    a = old.get(asset, {}).get("total", 0.0)
+                    b = fresh.get(asset, {}).get("total", 0.0)
+                    if abs(a - b) > max(abs(b), 1e-9) * BALANCE_DRIFT_PCT:
+                        print(f"[LEDGER] {name} {asset} drift ledger={a:.8f} exchange={b:.8f}")
+            BALANCE_LEDGER[name] = fresh
+            LEDGER_SYNC_TS[name] = now
+            LEDGER_DIRTY.discard(name)
+    print(f"[LEDGER] reconciled {', '.join(due)}")
+    refresh_equity_soon()
+
+###############################################################################
+# EQUITY SERVICE
+# - 자산별 수량(원장 합계) × 시세 마크. 전체 재계산은 백그라운드 스레드가 EQUITY_REFRESH_SEC 마다
+# - 그 사이 티커/웹소켓 시세와 자체 체결로 증분 갱신 → equity_snapshot() 은 O(1)
+# - 값의 나이 = 가장 오래된 마크의 나이 (update_pnl 이 EQUITY_MAX_STALE_SEC 로 상한)
+###############################################################################
+
+# 거래소별로 자본에 넣는 자산 (USD 는 USDT 와 같은 취급)
+EQUITY_ASSETS = {
+    "upbit": ("KRW", "BTC", "ETH"),
+    "bithumb": ("KRW", "BTC", "ETH"),
+    "binance": ("USDT", "BTC", "ETH"),
+    "okx": ("USDT",),
+    "bybit": ("USDT", "USD"),
+}
+EQUITY_ALIAS = {"USD": "USDT"}
+# 마크 소스: (거래소, 심볼) → 자산. USDT 는 KRW 가격, BTC/ETH 는 USDT 가격
+EQUITY_MARKS = {
+    ("upbit", "USDT/KRW"): "USDT",
+    ("bithumb", "USDT/KRW"): "USDT",
+    ("binance", "BTC/USDT"): "BTC",
+    ("binance", "ETH/USDT"): "ETH",
+}
+EQUITY = {"units": None, "marks": {}, "mark_ts": {}, "usd": 0.0, "value": 0.0}
+_EQUITY_LOCK = threading.Lock()
+_EQUITY_WAKE = threading.Event()
+_EQUITY_THREAD = None
+
+
+def equity_units() -> dict:
+    """원장 기준 자산별 수량 합계"""
+    units = {"KRW": 0.0, "USDT": 0.0, "BTC": 0.0, "ETH": 0.0}
+    for name, assets in EQUITY_ASSETS.items():
+        if not ex.get(name) or is_exchange_disabled(name):
+            continue
+        try:
+            bal = ledger_balance(name)
+        except Exception as e:
+            print(f"[EQ] {name} balance ERR {e}")
+            continue
+        for asset in assets:
+            units[EQUITY_ALIAS.get(asset, asset)] += float(bal.get(asset, {}).get("total", 0) or 0)
+    return units
+
+
+def _usd_value(units: dict, marks: dict) -> float:
+    return units["USDT"] + units["BTC"] * marks["BTC"] + units["ETH"] * marks["ETH"]
+
+
+def equity_value(units: dict, marks: dict) -> float:
+    return units["KRW"] + marks["USDT"] * _usd_value(units, marks)
+
+
+def equity_reset(units: dict, marks: dict):
+    """전체 재계산 결과로 증분 상태 교체"""
+    now = now_ts()
+    with _EQUITY_LOCK:
+        EQUITY["units"] = dict(units)
+        EQUITY["marks"] = dict(marks)
+        EQUITY["mark_ts"] = {a: now for a in marks}
+        EQUITY["usd"] = _usd_value(units, marks)
+        EQUITY["value"] = units["KRW"] + marks["USDT"] * EQUITY["usd"]
+
+
+def equity_mark(venue: str, symbol: str, price, bid=None):
+    """observe_ticker 에서 호출. 마크 소스가 아니면 dict 조회 1번으로 끝"""
+    asset = EQUITY_MARKS.get((venue, symbol))
+    if asset is None or not price or EQUITY["units"] is None:
+        return
+    price = float(bid if asset == "USDT" and bid else price)  # 환율은 get_usdt_krw 처럼 bid
+    with _EQUITY_LOCK:
+        old = EQUITY["marks"][asset]
+        EQUITY["marks"][asset] = price
+        EQUITY["mark_ts"][asset] = now_ts()
+        if asset != "USDT":
+            EQUITY["usd"] += EQUITY["units"][asset] * (price - old)
+        EQUITY["value"] = EQUITY["units"]["KRW"] + EQUITY["marks"]["USDT"] * EQUITY["usd"]
+
+
+def equity_apply_fill(name: str, asset: str, delta: float):
+    """원장 증분 (ledger_apply_fill) 을 자본 수량에도 반영"""
+    if asset not in EQUITY_ASSETS.get(name, ()) or EQUITY["units"] is None:
+        return
+    asset = EQUITY_ALIAS.get(asset, asset)
+    with _EQUITY_LOCK:
+        EQUITY["units"][asset] += delta
+        if asset == "KRW":
+            EQUITY["value"] += delta
+            return
+        usd = delta * (EQUITY["marks"][asset] if asset != "USDT" else 1.0)
+        EQUITY["usd"] += usd
+        EQUITY["value"] += EQUITY["marks"]["USDT"] * usd
+
+
+def equity_snapshot():
+    """(자본 KRW, 나이 초). 아직 계산 전이면 (LAST_EQUITY_KRW, inf)"""
+    with _EQUITY_LOCK:
+        if EQUITY["units"] is None or EQUITY["value"] <= 0:
+            return LAST_EQUITY_KRW, float("inf")
+        return EQUITY["value"], now_ts() - min(EQUITY["mark_ts"].values())
+
+
+def refresh_equity_soon():
+    """잔고 원장이 교체되면 다음 주기를 기다리지 않고 재계산"""
+    _EQUITY_WAKE.set()
+
+
+def start_equity_service():
+    """EQUITY_REFRESH_SEC 마다 (또는 refresh_equity_soon 시) estimate_total_equity_krw 로 전체 재계산"""
+    global _EQUITY_THREAD
+    if _EQUITY_THREAD is not None:
+        return
+
+    def loop():
+        while True:
+            _EQUITY_WAKE.wait(EQUITY_REFRESH_SEC)
+            _EQUITY_WAKE.clear()
+            try:
+                estimate_total_equity_krw()
+            except Exception as e:
+                print(f"[EQ] refresh ERR {e}")
+
+    _EQUITY_THREAD = threading.Thread(target=loop, name="equity", daemon=True)
+    _EQUITY_THREAD.start()
+
 ###############################################################################
 # CORE HELPERS / PnL
 ###############################################################################
 
 
-def place_market_order(inst, symbol, side, amount) -> float:
+def place_market_order(inst, symbol, side, amount, price: float = None, priority: str = "order") -> float:
     """
     부분체결 대응을 위한 wrapper.
     return: 실제 filled amount (best-effort).
     DRY_RUN=True면 요청 수량 그대로 리턴.
+    price: 체결가를 응답에서 못 얻을 때 잔고 원장 갱신에 쓸 추정가.
+    priority: 레이트리밋 등급 (top-up/unwind 는 "hedge")
     """
     print(f"[ORDER] {inst.id} {side.upper()} {symbol} {amount} DRY_RUN={DRY_RUN}")
     if DRY_RUN:
@@ -633,18 +2558,100 @@ def place_market_order(inst, symbol, side, amount) -> float:
         raise Exception(f"exchange {inst.id} disabled")
 
     try:
-        if side.lower() == "buy":
-            order = inst.create_market_buy_order(symbol, amount)
-        else:
-            order = inst.create_market_sell_order(symbol, amount)
-        filled = order.get("filled") or order.get("amount") or amount
-        return float(filled)
+        with venue_call(exchange_name(inst), "order", priority):
+            if side.lower() == "buy":
+                order = inst.create_market_buy_order(symbol, amount)
+            else:
+                order = inst.create_market_sell_order(symbol, amount)
+        filled = float(order.get("filled") or order.get("amount") or amount)
+        fill_price = order.get("average") or price
+        if not fill_price and order.get("cost") and filled > 0:
+            fill_price = float(order["cost"]) / filled
+        ledger_apply_fill(inst, symbol, side, filled, fill_price)
+        return filled
     except Exception as e:
         print(f"[ORDER ERR] {inst.id} {symbol} {side} {e}")
         record_exchange_error(inst.id)
         raise
 
 
+def _order_pool() -> ThreadPoolExecutor:
+    """주문 전용 풀 (마켓 데이터 fetch 뒤에 줄 서지 않도록 분리)"""
+    global _ORDER_POOL
+    if _ORDER_POOL is None:
+        _ORDER_POOL = ThreadPoolExecutor(max_workers=ORDER_WORKERS, thread_name_prefix="order")
+    return _ORDER_POOL
+
+
+def _record_order_latency(name: str, dt: float):
+    st = ORDER_LATENCY.setdefault(name, {"n": 0, "sum": 0.0, "max": 0.0, "last": 0.0})
+    st["n"] += 1
+    st["sum"] += dt
+    st["max"] = max(st["max"], dt)
+    st["last"] = dt
+
+
+def _submit_leg(inst, symbol, side, amount, price, priority="order"):
+    """한 레그 주문 → (체결 수량, 지연초). 실패하면 체결 0 (에러 로그/카운트는 place_market_order 에서)"""
+    t0 = time.perf_counter()
+    try:
+        filled = place_market_order(inst, symbol, side, amount, price=price, priority=priority)
+    except Exception:
+        filled = 0.0
+    dt = time.perf_counter() - t0
+    _record_order_latency(exchange_name(inst), dt)
+    return filled, dt
+
+
+def _legs_mismatch(fa: float, fb: float) -> bool:
+    return abs(fa - fb) > LEG_MISMATCH_TOL * max(fa, fb, 1e-12)
+
+
+def execute_two_legs(leg_a, leg_b):
+    """
+    두 레그를 동시에 주문하고 체결 수량 (filled_a, filled_b) 리턴.
+    leg = (inst, symbol, side, amount, price)
+    체결 수량이 다르면 1) 부족한 레그를 차이만큼 top-up, 2) 그래도 다르면 초과 레그를 unwind.
+    호출부는 기존대로 effective_amt = min(...) 적용.
+    """
+    pool = _order_pool()
+    fut_a = pool.submit(_submit_leg, *leg_a)
+    fut_b = pool.submit(_submit_leg, *leg_b)
+    (fa, dt_a), (fb, dt_b) = fut_a.result(), fut_b.result()
+    print(
+        f"[LEG] {exchange_name(leg_a[0])} {leg_a[2]}={fa} ({dt_a * 1000:.0f}ms) "
+        f"{exchange_name(leg_b[0])} {leg_b[2]}={fb} ({dt_b * 1000:.0f}ms)"
+    )
+    if not _legs_mismatch(fa, fb):
+        return fa, fb
+
+    # 1) top-up: 덜 체결된 레그를 차이만큼 추가 주문
+    short_is_a = fa < fb
+    inst, symbol, side, _, price = leg_a if short_is_a else leg_b
+    extra, _ = _submit_leg(inst, symbol, side, abs(fa - fb), price, "hedge")
+    if short_is_a:
+        fa += extra
+    else:
+        fb += extra
+    print(f"[LEG] top-up {exchange_name(inst)} {side} +{extra}")
+    if not _legs_mismatch(fa, fb):
+        return fa, fb
+
+    # 2) unwind: 초과 체결된 레그를 반대 방향으로 정리
+    long_is_a = fa > fb
+    inst, symbol, side, _, price = leg_a if long_is_a else leg_b
+    back_side = "sell" if side.lower() == "buy" else "buy"
+    undone, _ = _submit_leg(inst, symbol, back_side, abs(fa - fb), price, "hedge")
+    if long_is_a:
+        fa -= undone
+    else:
+        fb -= undone
+    msg = f"[LEG] unwind {exchange_name(inst)} {back_side} {undone} → fills {fa}/{fb}"
+    print(msg)
+    send_telegram(msg)
+    return fa, fb
+
+
 def can_trade_more(trade_times):
     now = now_ts()
     recent = [t for t in trade_times if now - t <= 3600]
@@ -664,6 +2671,9 @@ def send_daily_report(prev_date: str, pnl: float, trades: int, fees: float):
         f"- 수수료: {int(fees)} KRW\n"
         f"- 누적 손익: {int(STATE['realized_pnl_krw'])} KRW"
     )
+    latency = daily_latency_summary()
+    if latency:
+        msg += f"\n- 지연 (버킷 상한 기준):\n{latency}"
     print(msg)
     send_telegram(msg)
 
@@ -681,7 +2691,7 @@ def send_weekly_report(start_date: str, end_date: str, pnl: float, trades: int,
 
 
 def rollover_daily_pnl():
-    today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    today_str = datetime.fromtimestamp(now_ts(), tz=timezone.utc).strftime("%Y-%m-%d")
     prev_date = STATE["date"]
     if prev_date is None:
         STATE["date"] = today_str
@@ -768,8 +2778,10 @@ def update_pnl(trade_name: str, pnl_krw: float, fee_krw: float, layer: str = Non
         f"total={STATE['realized_pnl_krw']:.0f}"
     )
 
-    # 전체 일일 손실 한도
-    equity_krw = estimate_total_equity_krw()
+    # 전체 일일 손실 한도: 백그라운드 자본 추정값 (너무 오래됐을 때만 동기 재계산)
+    equity_krw, age = equity_snapshot()
+    if age > EQUITY_MAX_STALE_SEC:
+        equity_krw = estimate_total_equity_krw()
     loss_limit = equity_krw * MAX_DAILY_LOSS_RATIO
     if STATE["realized_pnl_krw_daily"] <= -loss_limit and not disable_trading:
         disable_trading = True
@@ -798,289 +2810,1328 @@ def update_pnl(trade_name: str, pnl_krw: float, fee_krw: float, layer: str = Non
 
 ###############################################################################
 # EXCHANGE INIT
+# - 8개 인스턴스를 스레드로 동시에 생성
+# - markets 는 MARKETS_CACHE_DIR/{name}.json 에서 바로 로드 (set_markets, 네트워크 없음)
+#   TTL 지난 캐시도 일단 사용하고 백그라운드에서 load_markets → 캐시 갱신. 캐시가 없을 때만 부팅 중 load_markets
 ###############################################################################
 
+_MARKETS_REFRESH_THREAD = None
+
+
+def exchange_specs() -> list:
+    """(name, 풀("spot"/"fut"), 생성 함수) 목록"""
+    return [
+        ("binance", "spot", lambda: ccxt.binance({"apiKey": BINANCE_API, "secret": BINANCE_SECRET, "enableRateLimit": False})),
+        ("upbit", "spot", lambda: ccxt.upbit({"apiKey": UPBIT_API, "secret": UPBIT_SECRET, "enableRateLimit": False})),
+        ("bithumb", "spot", lambda: ccxt.bithumb({"apiKey": BITHUMB_API, "secret": BITHUMB_SECRET, "enableRateLimit": False})),
+        ("bybit", "spot", lambda: ccxt.bybit({"apiKey": BYBIT_API, "secret": BYBIT_SECRET, "enableRateLimit": False})),
+        ("okx", "spot", lambda: ccxt.okx({
+            "apiKey": OKX_API, "secret": OKX_SECRET, "password": OKX_PASSWORD, "enableRateLimit": False,
+        })),
+        ("binance_fut", "fut", lambda: ccxt.binanceusdm({
+            "apiKey": BINANCE_API, "secret": BINANCE_SECRET, "enableRateLimit": False,
+        })),
+        ("bybit_fut", "fut", lambda: ccxt.bybit({
+            "apiKey": BYBIT_API, "secret": BYBIT_SECRET, "enableRateLimit": False,
+            "options": {"defaultType": "swap"},
+        })),
+        ("okx_fut", "fut", lambda: ccxt.okx({
+            "apiKey": OKX_API, "secret": OKX_SECRET, "password": OKX_PASSWORD, "enableRateLimit": False,
+            "options": {"defaultType": "swap"},
+        })),
+    ]
+
+
+def _markets_cache_path(name: str) -> str:
+    return os.path.join(MARKETS_CACHE_DIR, f"{name}.json")
+
+
+def load_markets_cache(name: str):
+    """(저장 시각, markets, currencies) 또는 None"""
+    try:
+        with open(_markets_cache_path(name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["ts"], data["markets"], data.get("currencies")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[INIT] {name} markets cache ERR {e}")
+        return None
+
+
+def save_markets_cache(name: str, inst):
+    try:
+        os.makedirs(MARKETS_CACHE_DIR, exist_ok=True)
+        path = _markets_cache_path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "markets": inst.markets, "currencies": inst.currencies}, f, default=str)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[INIT] {name} markets cache save ERR {e}")
+
+
+def _fetch_markets(name: str, inst):
+    with venue_call(name, "markets", "equity"):
+        inst.load_markets(reload=True)
+    save_markets_cache(name, inst)
+
+
+def _init_exchange(name: str, factory):
+    """인스턴스 생성 + markets 준비 → (inst, 캐시가 오래돼서 갱신이 필요한지)"""
+    inst = factory()
+    cached = load_markets_cache(name)
+    if cached is not None:
+        ts, markets, currencies = cached
+        inst.set_markets(markets, currencies)
+        return inst, time.time() - ts > MARKETS_CACHE_TTL_SEC
+    _fetch_markets(name, inst)
+    return inst, False
+
+
+def refresh_markets(names=None):
+    """load_markets 로 다시 받아 인스턴스/캐시 갱신 (백그라운드용)"""
+    insts = {**ex, **ex_fut}
+    for name in names or list(insts):
+        inst = insts.get(name)
+        if inst is None:
+            continue
+        try:
+            _fetch_markets(name, inst)
+            print(f"[INIT] {name} markets refreshed")
+        except Exception as e:
+            print(f"[INIT] {name} markets refresh ERR {e}")
+
+
+def start_markets_refresher(stale):
+    """오래된 캐시는 즉시, 이후 MARKETS_CACHE_TTL_SEC 마다 전체 갱신"""
+    global _MARKETS_REFRESH_THREAD
+
+    def loop():
+        if stale:
+            refresh_markets(stale)
+        while True:
+            time.sleep(MARKETS_CACHE_TTL_SEC)
+            refresh_markets()
+
+    _MARKETS_REFRESH_THREAD = threading.Thread(target=loop, name="markets-refresh", daemon=True)
+    _MARKETS_REFRESH_THREAD.start()
+
 
 def init_exchanges():
     global ex, ex_fut
     ex, ex_fut = {}, {}
-
-    spot_cfg = [
-        ("binance", ccxt.binance, BINANCE_API, BINANCE_SECRET, None),
-        ("upbit", ccxt.upbit, UPBIT_API, UPBIT_SECRET, None),
-        ("bithumb", ccxt.bithumb, BITHUMB_API, BITHUMB_SECRET, None),
-        ("bybit", ccxt.bybit, BYBIT_API, BYBIT_SECRET, None),
-        ("okx", ccxt.okx, OKX_API, OKX_SECRET, OKX_PASSWORD),
-    ]
-    for name, cls, key, sec, pwd in spot_cfg:
+    t0 = time.time()
+    specs = exchange_specs()
+    # 요청 간격은 rate_limit() 토큰 버킷이 관리 (ccxt 인스턴스별 blocking sleep 사용 안 함)
+    with ThreadPoolExecutor(max_workers=len(specs), thread_name_prefix="init") as pool:
+        futures = [(name, kind, pool.submit(_init_exchange, name, factory)) for name, kind, factory in specs]
+    stale = []
+    for name, kind, fut in futures:
         try:
-            params = {"apiKey": key, "secret": sec, "enableRateLimit": True}
-            if name == "okx":
-                params["password"] = pwd
-            inst = cls(params)
-            inst.load_markets()
-            ex[name] = inst
-            print(f"[INIT] {name} spot 연결 성공")
+            inst, is_stale = fut.result()
         except Exception as e:
-            print(f"[INIT] {name} spot ERR {e}")
+            print(f"[INIT] {name} ERR {e}")
             record_exchange_error(name)
+            continue
+        (ex if kind == "spot" else ex_fut)[name] = inst
+        if is_stale:
+            stale.append(name)
+        print(f"[INIT] {name} 연결 성공 ({len(inst.markets)} markets{', stale cache' if is_stale else ''})")
+    print(f"[INIT] {len(ex) + len(ex_fut)}/{len(specs)} exchanges in {time.time() - t0:.2f}s")
+    start_markets_refresher(stale)
 
-    try:
-        bin_fut = ccxt.binanceusdm({
-            "apiKey": BINANCE_API,
-            "secret": BINANCE_SECRET,
-            "enableRateLimit": True,
-        })
-        bin_fut.load_markets()
-        ex_fut["binance_fut"] = bin_fut
-        print("[INIT] binance_fut 연결 성공")
-    except Exception as e:
-        print(f"[INIT] binance_fut ERR {e}")
-        record_exchange_error("binance_fut")
+###############################################################################
+# MARKET DATA RECORDER
+# - 테이블(ticker/book/funding/fx)별 고정 dtype numpy 청크에 한 줄씩 기록 (쓰기 = 배열 한 행 대입)
+# - 청크가 차거나 RECORDER_FLUSH_SEC 가 지나면 백그라운드 스레드가 .npy 로 저장 → np.load(mmap_mode="r")
+# - UTC 날짜별 디렉토리, 날짜가 바뀌면 지난 날짜는 테이블별 .npz 로 압축 (RECORDER_COMPRESS)
+# - venue/symbol 은 정수 코드, 코드표는 날짜 디렉토리의 meta.json
+###############################################################################
 
-    try:
-        bybit_fut = ccxt.bybit({
-            "apiKey": BYBIT_API,
-            "secret": BYBIT_SECRET,
-            "enableRateLimit": True,
-            "options": {"defaultType": "swap"},
-        })
-        bybit_fut.load_markets()
-        ex_fut["bybit_fut"] = bybit_fut
-        print("[INIT] bybit_fut 연결 성공")
-    except Exception as e:
-        print(f"[INIT] bybit_fut ERR {e}")
-        record_exchange_error("bybit_fut")
+RECORDER_TABLES = ("ticker", "book", "funding", "fx")
+
+
+def recorder_dtypes(depth: int = RECORDER_BOOK_DEPTH) -> dict:
+    return {
+        "ticker": np.dtype([("ts", "f8"), ("venue", "u1"), ("symbol", "u2"),
+                            ("bid", "f8"), ("ask", "f8"), ("last", "f8")]),
+        "book": np.dtype([("ts", "f8"), ("venue", "u1"), ("symbol", "u2"), ("n", "u1"),
+                          ("bid_px", "f8", (depth,)), ("bid_qty", "f8", (depth,)),
+                          ("ask_px", "f8", (depth,)), ("ask_qty", "f8", (depth,))]),
+        "funding": np.dtype([("ts", "f8"), ("venue", "u1"), ("symbol", "u2"), ("rate", "f8")]),
+        "fx": np.dtype([("ts", "f8"), ("venue", "u1"), ("rate", "f8")]),
+    }
+
+
+def _nan(x):
+    return float("nan") if x is None else float(x)
+
+
+class MarketRecorder:
+    def __init__(self, root: str = RECORDER_DIR, chunk_rows: int = RECORDER_CHUNK_ROWS,
+                 depth: int = RECORDER_BOOK_DEPTH, flush_sec: float = RECORDER_FLUSH_SEC,
+                 compress: bool = RECORDER_COMPRESS):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.depth = depth
+        self.flush_sec = flush_sec
+        self.compress = compress
+        self.dtypes = recorder_dtypes(depth)
+        self.lock = threading.Lock()
+        self.day = None
+        self.venues, self.symbols = {}, {}
+        self.buf, self.rows, self.chunk_ts, self.seq = {}, {}, {}, {}
+        self.jobs = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name="recorder", daemon=True)
+        self.writer.start()
+
+    # --- 코드표 / 날짜 ---
+    def _day_dir(self, day: str) -> str:
+        return os.path.join(self.root, day)
+
+    def _open_day(self, day: str):
+        self.day = day
+        d = self._day_dir(day)
+        os.makedirs(d, exist_ok=True)
+        meta_path = os.path.join(d, "meta.json")
+        if os.path.exists(meta_path):
+            # 같은 날 재시작: 기존 코드표 이어서 사용
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.venues = {v: i for i, v in enumerate(meta["venues"])}
+            self.symbols = {s: i for i, s in enumerate(meta["symbols"])}
+        self.jobs.put(("meta", d, (list(self.venues), list(self.symbols))))
+        existing = os.listdir(d)
+        for table in RECORDER_TABLES:
+            self.seq[table] = sum(1 for f in existing if f.startswith(table + ".") and f.endswith(".npy"))
+            self.buf[table] = np.zeros(self.chunk_rows, dtype=self.dtypes[table])
+            self.rows[table] = 0
+            self.chunk_ts[table] = None
+
+    def _code(self, table: dict, key: str) -> int:
+        code = table.get(key)
+        if code is None:
+            code = table[key] = len(table)
+            self.jobs.put(("meta", self._day_dir(self.day), (list(self.venues), list(self.symbols))))
+        return code
+
+    def _next_row(self, table: str, ts: float):
+        """lock 잡은 상태에서 호출. 날짜 변경/청크 가득 참/시간 초과 처리 후 (배열, 행 index)"""
+        day = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+        if day != self.day:
+            prev = self.day
+            if prev is not None:
+                for t in RECORDER_TABLES:
+                    self._hand_off(t)
+                if self.compress:
+                    self.jobs.put(("compress", self._day_dir(prev), None))
+            self._open_day(day)
+        n = self.rows[table]
+        if n >= self.chunk_rows or (n and ts - self.chunk_ts[table] >= self.flush_sec):
+            self._hand_off(table)
+            n = 0
+        if n == 0:
+            self.chunk_ts[table] = ts
+        self.rows[table] = n + 1
+        return self.buf[table], n
+
+    def _hand_off(self, table: str):
+        n = self.rows.get(table, 0)
+        if not n:
+            return
+        path = os.path.join(self._day_dir(self.day), f"{table}.{self.seq[table]:06d}.npy")
+        self.jobs.put(("save", path, self.buf[table][:n]))
+        self.seq[table] += 1
+        self.buf[table] = np.zeros(self.chunk_rows, dtype=self.dtypes[table])
+        self.rows[table] = 0
+
+    # --- hot path 기록 ---
+    def ticker(self, venue: str, symbol: str, bid, ask, last, ts: float = None):
+        ts = now_ts() if ts is None else ts
+        with self.lock:
+            arr, i = self._next_row("ticker", ts)
+            arr[i] = (ts, self._code(self.venues, venue), self._code(self.symbols, symbol),
+                      _nan(bid), _nan(ask), _nan(last))
+
+    def book(self, venue: str, symbol: str, bids, asks, ts: float = None):
+        ts = now_ts() if ts is None else ts
+        nb, na = min(len(bids), self.depth), min(len(asks), self.depth)
+        with self.lock:
+            arr, i = self._next_row("book", ts)
+            r = arr[i]
+            r["ts"] = ts
+            r["venue"] = self._code(self.venues, venue)
+            r["symbol"] = self._code(self.symbols, symbol)
+            r["n"] = min(nb, na)
+            r["bid_px"][:nb] = [b[0] for b in bids[:nb]]
+            r["bid_qty"][:nb] = [b[1] for b in bids[:nb]]
+            r["ask_px"][:na] = [a[0] for a in asks[:na]]
+            r["ask_qty"][:na] = [a[1] for a in asks[:na]]
+
+    def funding(self, venue: str, symbol: str, rate, ts: float = None):
+        ts = now_ts() if ts is None else ts
+        with self.lock:
+            arr, i = self._next_row("funding", ts)
+            arr[i] = (ts, self._code(self.venues, venue), self._code(self.symbols, symbol), _nan(rate))
+
+    def fx(self, venue: str, rate, ts: float = None):
+        ts = now_ts() if ts is None else ts
+        with self.lock:
+            arr, i = self._next_row("fx", ts)
+            arr[i] = (ts, self._code(self.venues, venue), _nan(rate))
+
+    def flush(self, wait: bool = True):
+        with self.lock:
+            if self.day is not None:
+                for t in RECORDER_TABLES:
+                    self._hand_off(t)
+        if wait:
+            self.jobs.join()
+
+    # --- 백그라운드 디스크 쓰기 ---
+    def _writer_loop(self):
+        while True:
+            kind, path, payload = self.jobs.get()
+            try:
+                if kind == "save":
+                    np.save(path, payload)
+                elif kind == "meta":
+                    tmp = os.path.join(path, "meta.json.tmp")
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump({"venues": payload[0], "symbols": payload[1]}, f)
+                    os.replace(tmp, os.path.join(path, "meta.json"))
+                elif kind == "compress":
+                    _compress_recorded_day(path)
+            except Exception as e:
+                print(f"[RECORDER] {kind} {path} ERR {e}")
+            finally:
+                self.jobs.task_done()
 
-    try:
-        okx_fut = ccxt.okx({
-            "apiKey": OKX_API,
-            "secret": OKX_SECRET,
-            "password": OKX_PASSWORD,
-            "enableRateLimit": True,
-            "options": {"defaultType": "swap"},
-        })
-        okx_fut.load_markets()
-        ex_fut["okx_fut"] = okx_fut
-        print("[INIT] okx_fut 연결 성공")
-    except Exception as e:
-        print(f"[INIT] okx_fut ERR {e}")
-        record_exchange_error("okx_fut")
+
+def _recorded_chunks(day_dir: str, table: str):
+    return sorted(
+        os.path.join(day_dir, f) for f in os.listdir(day_dir)
+        if f.startswith(table + ".") and f.endswith(".npy")
+    )
+
+
+def _compress_recorded_day(day_dir: str):
+    """지난 날짜 청크를 테이블별 {table}.npz (압축) 하나로 합치고 청크 삭제"""
+    for table in RECORDER_TABLES:
+        chunks = _recorded_chunks(day_dir, table)
+        if not chunks:
+            continue
+        data = np.concatenate([np.load(c) for c in chunks])
+        np.savez_compressed(os.path.join(day_dir, f"{table}.npz"), data=data)
+        for c in chunks:
+            os.remove(c)
+
+
+def load_recorded_table(day_dir: str, table: str, mmap: bool = True):
+    """
+    하루치 테이블 로드 → (structured array, meta).
+    압축 전(당일) 청크는 mmap 으로 열어서 이어붙이고, 압축된 날짜는 .npz 를 풀어서 리턴.
+    """
+    with open(os.path.join(day_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    npz = os.path.join(day_dir, f"{table}.npz")
+    parts = []
+    if os.path.exists(npz):
+        with np.load(npz) as z:
+            parts.append(z["data"])
+    parts += [np.load(c, mmap_mode="r" if mmap else None) for c in _recorded_chunks(day_dir, table)]
+    if not parts:
+        return None, meta
+    if len(parts) == 1:
+        return parts[0], meta
+    return np.concatenate(parts), meta
+
+
+def start_recorder():
+    global RECORDER
+    if np is None:
+        print("[RECORDER] numpy 없음 → 기록 안 함")
+        return None
+    if RECORDER is None:
+        RECORDER = MarketRecorder()
+        atexit.register(RECORDER.flush)
+        print(f"[RECORDER] recording to {RECORDER_DIR}/")
+    return RECORDER
 
 ###############################################################################
-# ARB LAYERS
+# MARKET DATA STREAM (웹소켓: 업비트/빗썸/바이낸스)
+# - 업비트/빗썸(v1 API)은 같은 포맷: 오더북 전체 스냅샷 + 체결 티커
+# - 바이낸스는 depth20@100ms 부분 오더북 + miniTicker
+# - 끊기거나 idle 이면 해당 거래소 데이터를 비우고 재연결 → 첫 스냅샷으로 재동기화
+# - calc_vwap / orderbook_imbalance 가 쓰는 {"bids": [[p, v]], "asks": [[p, v]]} 형태 유지
 ###############################################################################
 
 
-def run_spread_arbitrage(symbol: str, tier1_thr: float, base_ratio: float, trade_times):
-    global disable_trading
-    if disable_trading or not ENABLE_LAYER_SPREAD_ARB or STATE["spread_disabled_today"]:
-        print(f"[ARB] SPREAD skip {symbol}")
+def _ws_code(venue: str, symbol: str) -> str:
+    base, quote = symbol.split("/")
+    if venue == "binance":
+        return f"{base}{quote}".lower()
+    return f"{quote}-{base}"
+
+
+def stream_fresh(venue: str, symbol: str) -> bool:
+    ob = STREAM_BOOKS.get((venue, symbol))
+    return ob is not None and now_ts() - ob["recv_ts"] <= WS_MAX_AGE_SEC
+
+
+def stream_orderbook(venue: str, symbol: str, depth: int = 10):
+    ob = STREAM_BOOKS.get((venue, symbol))
+    if ob is None or now_ts() - ob["recv_ts"] > WS_MAX_AGE_SEC:
+        return None
+    return {**ob, "bids": ob["bids"][:depth], "asks": ob["asks"][:depth]}
+
+
+def stream_ticker(venue: str, symbol: str):
+    """스트림 오더북 최우선호가 + 최근 체결가. safe_ticker 와 같은 키(bid/ask/last)"""
+    ob = stream_orderbook(venue, symbol, depth=1)
+    t = STREAM_TICKERS.get((venue, symbol))
+    if ob is None or t is None or not ob["bids"] or not ob["asks"]:
+        return None
+    return {
+        "symbol": symbol,
+        "bid": ob["bids"][0][0],
+        "ask": ob["asks"][0][0],
+        "last": t["last"],
+        "timestamp": ob["timestamp"],
+        "recv_ts": ob["recv_ts"],
+    }
+
+
+def _on_stream_book(venue: str, symbol: str, bids, asks, ts):
+    prev = STREAM_BOOKS.get((venue, symbol))
+    if prev is not None and ts is not None and prev["timestamp"] is not None and ts < prev["timestamp"]:
+        return  # 순서 역전된 스냅샷은 버림
+    STREAM_BOOKS[(venue, symbol)] = {
+        "symbol": symbol,
+        "bids": bids[:WS_DEPTH],
+        "asks": asks[:WS_DEPTH],
+        "timestamp": ts,
+        "recv_ts": now_ts(),
+    }
+    observe_book(venue, symbol, bids, asks)
+
+
+def _on_stream_trade(venue: str, symbol: str, last: float):
+    STREAM_TICKERS[(venue, symbol)] = {"last": last, "recv_ts": now_ts()}
+    ob = STREAM_BOOKS.get((venue, symbol))
+    bid = ob["bids"][0][0] if ob and ob["bids"] else None
+    ask = ob["asks"][0][0] if ob and ob["asks"] else None
+    observe_ticker(venue, symbol, bid, ask, last)
+
+
+def _handle_krw_ws_message(venue: str, codes, msg: dict):
+    symbol = codes.get(msg.get("code"))
+    if symbol is None:
         return
-    if is_exchange_disabled("binance"):
-        print("[ARB] binance disabled, skip SPREAD")
+    if msg.get("type") == "orderbook":
+        units = msg.get("orderbook_units") or []
+        bids = [[float(u["bid_price"]), float(u["bid_size"])] for u in units]
+        asks = [[float(u["ask_price"]), float(u["ask_size"])] for u in units]
+        _on_stream_book(venue, symbol, bids, asks, msg.get("timestamp"))
+    elif msg.get("type") == "ticker":
+        _on_stream_trade(venue, symbol, float(msg["trade_price"]))
+
+
+def _handle_binance_ws_message(codes, msg: dict):
+    stream, data = msg.get("stream", ""), msg.get("data") or {}
+    symbol = codes.get(stream.split("@")[0])
+    if symbol is None:
+        return
+    if "@depth" in stream:
+        bids = [[float(p), float(v)] for p, v in data.get("bids", [])]
+        asks = [[float(p), float(v)] for p, v in data.get("asks", [])]
+        # depth20 부분 오더북엔 이벤트 시각이 없음 (lastUpdateId 는 시퀀스 번호) → 로컬 수신 시각(ms)
+        _on_stream_book("binance", symbol, bids, asks, data.get("E") or int(now_ts() * 1000))
+    elif "@miniTicker" in stream:
+        _on_stream_trade("binance", symbol, float(data["c"]))
+
+
+def _clear_stream_venue(venue: str):
+    for key in [k for k in STREAM_BOOKS if k[0] == venue]:
+        STREAM_BOOKS.pop(key, None)
+    for key in [k for k in STREAM_TICKERS if k[0] == venue]:
+        STREAM_TICKERS.pop(key, None)
+
+
+async def _stream_venue(venue: str, symbols, url: str):
+    codes = {_ws_code(venue, s): s for s in symbols}
+    if venue == "binance":
+        streams = "/".join(f"{c}@depth20@100ms/{c}@miniTicker" for c in codes)
+        url = f"{url}?streams={streams}"
+    backoff = 1.0
+    while True:
+        try:
+            async with websockets.connect(url, ping_interval=20, max_size=None) as ws:
+                if venue != "binance":
+                    await ws.send(json.dumps([
+                        {"ticket": f"kimchi-bot-{venue}"},
+                        {"type": "ticker", "codes": list(codes)},
+                        {"type": "orderbook", "codes": list(codes)},
+                        {"format": "DEFAULT"},
+                    ]))
+                STREAM_STATUS[venue] = "connected"
+                print(f"[WS] {venue} connected ({len(codes)} symbols)")
+                backoff = 1.0
+                while True:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=WS_IDLE_TIMEOUT_SEC)
+                    msg = json.loads(raw)
+                    if venue == "binance":
+                        _handle_binance_ws_message(codes, msg)
+                    else:
+                        _handle_krw_ws_message(venue, codes, msg)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WS] {venue} disconnected: {str(e)[:80]} → {backoff:.0f}s 후 재연결")
+        # 재동기화: 끊긴 동안의 데이터는 신뢰 불가 → 비우고 첫 스냅샷부터 다시
+        STREAM_STATUS[venue] = "down"
+        _clear_stream_venue(venue)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, WS_RECONNECT_MAX_SEC)
+
+
+def start_market_stream(symbols_by_venue, urls=None):
+    """
+    백그라운드 스레드에서 거래소별 웹소켓 스트림 시작.
+    urls 로 로컬 테스트 서버 주소를 넘길 수 있음 (기본값 WS_URLS).
+    """
+    global _STREAM_THREAD
+    if websockets is None:
+        print("[WS] websockets 패키지 없음 → REST polling 유지")
+        return None
+    if _STREAM_THREAD is not None and _STREAM_THREAD.is_alive():
+        return _STREAM_THREAD
+    urls = urls or WS_URLS
+
+    async def run_all():
+        await asyncio.gather(*[
+            _stream_venue(venue, symbols, urls[venue])
+            for venue, symbols in symbols_by_venue.items() if symbols
+        ])
+
+    _STREAM_THREAD = threading.Thread(target=lambda: asyncio.run(run_all()), name="ws-stream", daemon=True)
+    _STREAM_THREAD.start()
+    return _STREAM_THREAD
+
+###############################################################################
+# MARKET DATA WORKERS (거래소별 프로세스 → shared_memory)
+# - 거래소마다 별도 프로세스가 REST 조회 + JSON 파싱 → 고정 레이아웃 numpy 레코드(심볼당 1행)에 기록
+# - 전략 프로세스는 같은 shared_memory 를 numpy 로 바로 읽음 (GIL 경쟁 없음)
+# - seqlock: 쓰기 전 seq 홀수, 다 쓰면 짝수. 읽기는 seq 가 짝수이고 복사 전후로 같을 때만 채택 → torn read 방지
+#   (x86 저장 순서 보장 기준)
+# - 레이트리밋: 워커는 Pipe 로 부모에 토큰을 요청 → 부모의 거래소별 버킷 하나를 주문/조회와 함께 사용
+# - 부모의 md-watch 스레드가 새 레코드를 observe_book / observe_ticker 로 넘김 (트리거 / 레코더 / 자본 / 변동성)
+###############################################################################
+
+MD_WORKERS = {}  # venue -> {"proc", "shm", "arr", "tokens", "index": {symbol: row}}
+_MD_STOP = None
+_MD_WATCH = None
+MD_READ_RETRIES = 100
+_MD_SEEN = {}  # (venue, symbol) -> 관측 콜백까지 보낸 마지막 recv_ts
+_MD_SEEN_LOCK = threading.Lock()
+
+
+def md_dtype(depth: int = MP_BOOK_DEPTH):
+    return np.dtype([
+        ("seq", "u8"), ("recv_ts", "f8"), ("ts", "f8"),
+        ("bid", "f8"), ("ask", "f8"), ("last", "f8"),
+        ("n_bids", "u2"), ("n_asks", "u2"),
+        ("bid_px", "f8", (depth,)), ("bid_qty", "f8", (depth,)),
+        ("ask_px", "f8", (depth,)), ("ask_qty", "f8", (depth,)),
+    ])
+
+
+def _md_publish(arr, row: int, recv_ts: float, ob: dict, last, depth: int):
+    bids, asks = ob["bids"][:depth], ob["asks"][:depth]
+    seq = int(arr["seq"][row])
+    arr["seq"][row] = seq + 1  # 홀수: 쓰는 중
+    arr["recv_ts"][row] = recv_ts
+    arr["ts"][row] = (ob.get("timestamp") or recv_ts * 1000) / 1000
+    arr["bid"][row], arr["ask"][row] = bids[0][0], asks[0][0]
+    arr["last"][row] = last if last is not None else np.nan
+    arr["n_bids"][row], arr["n_asks"][row] = len(bids), len(asks)
+    for side, levels in (("bid", bids), ("ask", asks)):
+        lv = np.asarray([x[:2] for x in levels], dtype=float)
+        arr[side + "_px"][row, :len(levels)] = lv[:, 0]
+        arr[side + "_qty"][row, :len(levels)] = lv[:, 1]
+    arr["seq"][row] = seq + 2  # 짝수: 완료
+
+
+def _md_token(tokens, call: str):
+    """워커 → 부모에 토큰 요청 후 허가될 때까지 대기 (거래소별 버킷은 부모 하나만 존재)"""
+    if tokens is not None:
+        tokens.send(call)
+        tokens.recv()
+
+
+def _md_token_server(venue: str, conn):
+    """부모 스레드: 워커의 토큰 요청을 부모 버킷에서 market 등급으로 처리 → 주문/hedge 가 우선"""
+    while True:
+        try:
+            call = conn.recv()
+        except (EOFError, OSError):
+            return
+        rate_limit(venue, call, "market")
+        try:
+            conn.send(True)
+        except (BrokenPipeError, OSError):
+            return
+
+
+def _md_poll(venue: str, inst, symbols, rows: dict, arr, depth: int, tokens=None):
+    tickers, books = {}, {}
+    if inst.has.get("fetchTickers"):
+        _md_token(tokens, "tickers")
+        tickers = inst.fetch_tickers(symbols)
+    if inst.has.get("fetchOrderBooks"):
+        _md_token(tokens, "orderbook")
+        books = inst.fetch_order_books(symbols, depth)
+    else:
+        for symbol in symbols:
+            try:
+                _md_token(tokens, "orderbook")
+                books[symbol] = inst.fetch_order_book(symbol, depth)
+            except Exception as e:
+                print(f"[MD {venue}] {symbol} ERR {str(e)[:80]}")
+    now = time.time()
+    for symbol, row in rows.items():
+        ob = books.get(symbol)
+        if not ob or not ob["bids"] or not ob["asks"]:
+            continue
+        _md_publish(arr, row, now, ob, (tickers.get(symbol) or {}).get("last"), depth)
+
+
+def _md_worker_main(venue: str, shm_name: str, symbols, depth: int, poll_sec: float, stop, tokens=None):
+    """워커 프로세스 진입점 (spawn). tokens: 부모 레이트리밋 버킷에 토큰을 요청하는 Pipe"""
+    from multiprocessing import shared_memory
+    # spawn 자식은 부모의 resource tracker 를 같이 씀 → 정리(unlink)는 부모가 stop_md_workers 에서
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arr = np.ndarray((len(symbols),), dtype=md_dtype(depth), buffer=shm.buf)
+    inst = {name: factory for name, _, factory in exchange_specs()}[venue]()
+    cached = load_markets_cache(venue)
+    if cached is not None:
+        inst.set_markets(cached[1], cached[2])  # 없으면 첫 조회 때 ccxt 가 load_markets
+    rows = {s: i for i, s in enumerate(symbols)}
+    print(f"[MD {venue}] worker pid={os.getpid()} symbols={len(symbols)}")
+    while not stop.is_set():
+        t0 = time.time()
+        try:
+            _md_poll(venue, inst, symbols, rows, arr, depth, tokens)
+        except Exception as e:
+            print(f"[MD {venue}] ERR {str(e)[:120]}")
+        stop.wait(max(0.0, poll_sec - (time.time() - t0)))
+    del arr
+    shm.close()
+
+
+def _md_read(venue: str, symbol: str):
+    """seqlock 으로 레코드 한 행 복사 (쓰는 중이면 재시도). 한 번도 안 써졌으면 None"""
+    w = MD_WORKERS.get(venue)
+    if w is None:
+        return None
+    row = w["index"].get(symbol)
+    if row is None:
+        return None
+    arr = w["arr"]
+    if arr is None:  # stop_md_workers 진행 중
+        return None
+    for _ in range(MD_READ_RETRIES):
+        s1 = int(arr["seq"][row])
+        if s1 & 1:
+            continue
+        rec = arr[row:row + 1].copy()[0]
+        if int(arr["seq"][row]) == s1:
+            return rec if s1 else None
+    return None
+
+
+def _md_latest(venue: str, symbol: str):
+    """_md_read + 처음 보는 레코드(recv_ts 갱신)면 관측 콜백 한 번 (여러 번 읽어도 중복 없음)"""
+    rec = _md_read(venue, symbol)
+    if rec is None:
+        return None
+    recv_ts = float(rec["recv_ts"])
+    with _MD_SEEN_LOCK:
+        new = recv_ts > _MD_SEEN.get((venue, symbol), 0.0)
+        if new:
+            _MD_SEEN[(venue, symbol)] = recv_ts
+    if new:
+        # 웹소켓 스트림과 같은 관측자 (레코더 / 오더북 트리거 / 자본 마크 / 변동성)
+        bids, asks = _md_levels(rec, MP_BOOK_DEPTH)
+        observe_book(venue, symbol, bids, asks)
+        last = float(rec["last"]) if np.isfinite(rec["last"]) else None
+        observe_ticker(venue, symbol, float(rec["bid"]), float(rec["ask"]), last)
+    return rec
+
+
+def _md_levels(rec, depth: int):
+    nb, na = min(depth, int(rec["n_bids"])), min(depth, int(rec["n_asks"]))
+    bids = np.column_stack((rec["bid_px"][:nb], rec["bid_qty"][:nb])).tolist()
+    asks = np.column_stack((rec["ask_px"][:na], rec["ask_qty"][:na])).tolist()
+    return bids, asks
+
+
+def _md_watch():
+    """
+    부모 쪽 감시 스레드: 워커가 새로 쓴 레코드를 읽어 관측 콜백으로 넘김
+    → 레이어가 시세를 읽기 전에도 오더북 트리거 / 레코더가 웹소켓 스트림처럼 동작
+    """
+    while not _MD_STOP.is_set():
+        for venue, w in list(MD_WORKERS.items()):
+            for symbol in list(w["index"]):
+                try:
+                    _md_latest(venue, symbol)
+                except Exception as e:
+                    print(f"[MD] watch {venue} {symbol} ERR {str(e)[:80]}")
+        _MD_STOP.wait(MP_POLL_SEC / 4)
+
+
+def shm_fresh(venue: str, symbol: str) -> bool:
+    w = MD_WORKERS.get(venue)
+    if w is None or symbol not in w["index"]:
+        return False
+    rec = _md_latest(venue, symbol)
+    return rec is not None and now_ts() - rec["recv_ts"] <= MP_MAX_AGE_SEC
+
+
+def shm_orderbook(venue: str, symbol: str, depth: int = 10):
+    rec = _md_latest(venue, symbol)
+    if rec is None or now_ts() - rec["recv_ts"] > MP_MAX_AGE_SEC:
+        return None
+    bids, asks = _md_levels(rec, depth)
+    return {
+        "symbol": symbol,
+        "bids": bids,
+        "asks": asks,
+        "timestamp": int(rec["ts"] * 1000),
+        "recv_ts": float(rec["recv_ts"]),
+    }
+
+
+def shm_ticker(venue: str, symbol: str):
+    rec = _md_latest(venue, symbol)
+    if rec is None or now_ts() - rec["recv_ts"] > MP_MAX_AGE_SEC:
+        return None
+    last = float(rec["last"]) if np.isfinite(rec["last"]) else float(rec["bid"])
+    return {
+        "symbol": symbol,
+        "bid": float(rec["bid"]),
+        "ask": float(rec["ask"]),
+        "last": last,
+        "timestamp": int(rec["ts"] * 1000),
+        "recv_ts": float(rec["recv_ts"]),
+    }
+
+
+def live_fresh(venue: str, symbol: str) -> bool:
+    """웹소켓 스트림 또는 워커 프로세스가 최신 호가를 갖고 있으면 REST 불필요"""
+    return stream_fresh(venue, symbol) or shm_fresh(venue, symbol)
+
+
+def start_md_workers(symbols_by_venue):
+    global _MD_STOP, _MD_WATCH
+    if np is None:
+        print("[MD] numpy 없음 → 워커 프로세스 사용 안 함")
         return
+    import multiprocessing as mp
+    from multiprocessing import shared_memory
+    ctx = mp.get_context("spawn")
+    if _MD_STOP is None:
+        _MD_STOP = ctx.Event()
+        atexit.register(stop_md_workers)
+    dtype = md_dtype(MP_BOOK_DEPTH)
+    for venue, symbols in symbols_by_venue.items():
+        if not symbols or venue in MD_WORKERS:
+            continue
+        shm = shared_memory.SharedMemory(create=True, size=len(symbols) * dtype.itemsize)
+        arr = np.ndarray((len(symbols),), dtype=dtype, buffer=shm.buf)
+        arr[:] = np.zeros(len(symbols), dtype=dtype)
+        # 워커 요청도 부모의 같은 버킷에서 토큰을 받음 (프로세스마다 따로 세면 한도를 넘김)
+        tokens, child_tokens = ctx.Pipe()
+        proc = ctx.Process(
+            target=_md_worker_main,
+            args=(venue, shm.name, list(symbols), MP_BOOK_DEPTH, MP_POLL_SEC, _MD_STOP, child_tokens),
+            name=f"md-{venue}",
+            daemon=True,
+        )
+        proc.start()
+        child_tokens.close()
+        threading.Thread(target=_md_token_server, args=(venue, tokens), name=f"md-tokens-{venue}", daemon=True).start()
+        MD_WORKERS[venue] = {
+            "proc": proc, "shm": shm, "arr": arr, "tokens": tokens,
+            "index": {s: i for i, s in enumerate(symbols)},
+        }
+    if MD_WORKERS and _MD_WATCH is None:
+        _MD_WATCH = threading.Thread(target=_md_watch, name="md-watch", daemon=True)
+        _MD_WATCH.start()
+    print("[MD] workers: " + ", ".join(f"{v}({len(w['index'])})" for v, w in MD_WORKERS.items()))
+
+
+def stop_md_workers():
+    if _MD_STOP is not None:
+        _MD_STOP.set()
+    for venue, w in list(MD_WORKERS.items()):
+        w["proc"].join(timeout=3)
+        if w["proc"].is_alive():
+            w["proc"].terminate()
+        w["arr"] = None
+        w["tokens"].close()
+        MD_WORKERS.pop(venue, None)
+        try:
+            w["shm"].close()
+            w["shm"].unlink()
+        except Exception:
+            pass
+
+###############################################################################
+# SPREAD UNIVERSE
+# - 이미 로드된 markets 에서 국내 X/KRW ∩ 바이낸스 X/USDT 를 찾고 fetch_tickers 1회로 거래대금 필터
+# - 틱마다: ARB_SYMBOLS + 스트림 오더북이 살아있는 심볼 전부 + 나머지는 UNIVERSE_REST_BATCH 개씩 라운드로빈
+#   → REST 요청 수가 유니버스 크기와 무관하게 제한됨
+###############################################################################
+
+SPREAD_UNIVERSE = list(ARB_SYMBOLS)
+SPREAD_TICK_SYMBOLS = list(ARB_SYMBOLS)
+UNIVERSE_SYNC_TS = 0.0
+_UNIVERSE_CURSOR = 0
+
+
+def venue_lists(name: str, symbol: str) -> bool:
+    """해당 거래소에 심볼이 상장돼 있는지 (markets 가 없으면 True)"""
+    markets = getattr((ex.get(name) or ex_fut.get(name)), "markets", None)
+    return not markets or symbol in markets
+
+
+def _market_bases(inst, quote: str) -> set:
+    markets = getattr(inst, "markets", None) or {}
+    return {
+        m["base"] for m in markets.values()
+        if m.get("quote") == quote and m.get("spot", True) and m.get("active") is not False
+    }
+
+
+def _quote_volumes(inst, symbols) -> dict:
+    """fetch_tickers 한 번으로 심볼별 24h 거래대금 (quote 통화 기준)"""
+    if not symbols:
+        return {}
     try:
-        b = ex["binance"]
-        usdt_krw = get_usdt_krw()
-        base_pair = f"{symbol}/USDT"
-        t_base = safe_ticker(b, base_pair)
-        base_usdt = float(t_base["bid"])
-        ref_krw = base_usdt * usdt_krw
-        bal_b = b.fetch_balance()
-        free_usdt = float(bal_b.get("USDT", {}).get("free", 0) or 0)
-        free_sym = float(bal_b.get(symbol, {}).get("free", 0) or 0)
+        with venue_call(exchange_name(inst), "tickers", "equity"):
+            tickers = inst.fetch_tickers(symbols)
+    except Exception as e:
+        print(f"[UNIVERSE] {inst.id} fetch_tickers ERR {e}")
+        return {}
+    out = {}
+    for sym, t in tickers.items():
+        qv = t.get("quoteVolume")
+        if qv is None and t.get("baseVolume") and t.get("last"):
+            qv = t["baseVolume"] * t["last"]
+        out[sym] = float(qv or 0)
+    return out
+
+
+@request_priority("equity")
+def discover_spread_universe() -> list:
+    """국내 24h 거래대금 내림차순 심볼 목록 (ARB_SYMBOLS 는 항상 앞에 포함)"""
+    b = ex.get("binance")
+    domestic = [name for name in ["upbit", "bithumb"] if ex.get(name) and not is_exchange_disabled(name)]
+    if not b or not domestic:
+        return list(ARB_SYMBOLS)
+    krw_bases = set()
+    for name in domestic:
+        krw_bases |= _market_bases(ex[name], "KRW")
+    candidates = sorted((krw_bases & _market_bases(b, "USDT")) - {"USDT"} - set(ARB_SYMBOLS))
+    if not candidates:
+        return list(ARB_SYMBOLS)
+
+    vol_krw = {}
+    for name in domestic:
+        listed = [f"{s}/KRW" for s in candidates if f"{s}/KRW" in ex[name].markets]
+        for sym, qv in _quote_volumes(ex[name], listed).items():
+            base = sym.split("/")[0]
+            vol_krw[base] = max(vol_krw.get(base, 0.0), qv)
+    vol_usdt = _quote_volumes(b, [f"{s}/USDT" for s in candidates])
+
+    liquid = [
+        s for s in candidates
+        if vol_krw.get(s, 0.0) >= UNIVERSE_MIN_VOL_KRW
+        and (not vol_usdt or vol_usdt.get(f"{s}/USDT", 0.0) >= UNIVERSE_MIN_VOL_USDT)
+    ]
+    liquid.sort(key=lambda s: vol_krw[s], reverse=True)
+    return list(ARB_SYMBOLS) + liquid[:max(0, UNIVERSE_MAX_SYMBOLS - len(ARB_SYMBOLS))]
+
 
+def refresh_spread_universe(force: bool = False):
+    global SPREAD_UNIVERSE, UNIVERSE_SYNC_TS
+    if not UNIVERSE_AUTO:
+        return
+    if not force and now_ts() - UNIVERSE_SYNC_TS < UNIVERSE_REFRESH_SEC:
+        return
+    UNIVERSE_SYNC_TS = now_ts()
+    universe = discover_spread_universe()
+    added = [s for s in universe if s not in SPREAD_UNIVERSE]
+    removed = [s for s in SPREAD_UNIVERSE if s not in universe]
+    SPREAD_UNIVERSE = universe
+    print(f"[UNIVERSE] {len(universe)} symbols (+{len(added)} -{len(removed)}) {','.join(universe[:10])}{'...' if len(universe) > 10 else ''}")
+
+
+def select_spread_symbols() -> list:
+    """이번 틱에 평가할 스프레드 심볼"""
+    global _UNIVERSE_CURSOR
+    picked, rest = [], []
+    for sym in SPREAD_UNIVERSE:
+        streamed = live_fresh("binance", f"{sym}/USDT") and all(
+            live_fresh(v, f"{sym}/KRW") for v in ["upbit", "bithumb"] if v in ex and venue_lists(v, f"{sym}/KRW")
+        )
+        (picked if sym in ARB_SYMBOLS or streamed else rest).append(sym)
+    if rest:
+        n = min(UNIVERSE_REST_BATCH, len(rest))
+        start = _UNIVERSE_CURSOR % len(rest)
+        picked += [rest[(start + i) % len(rest)] for i in range(n)]
+        _UNIVERSE_CURSOR = start + n
+    return picked
+
+###############################################################################
+# MARKET DATA PREFETCH (레이어 실행 전 동시 fetch)
+###############################################################################
+
+
+def get_fetch_pool() -> ThreadPoolExecutor:
+    global _FETCH_POOL
+    if _FETCH_POOL is None:
+        _FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+    return _FETCH_POOL
+
+
+def market_data_jobs(layers=LAYER_NAMES):
+    """이번에 돌릴 레이어들이 필요로 하는 (inst, kind, symbol, arg) 목록"""
+    jobs = []
+    spread = ENABLE_LAYER_SPREAD_ARB and "spread" in layers
+    krw = ENABLE_LAYER_KRW_CROSS and "krw" in layers
+
+    def add(name, kind, symbol=None, arg=None, pool=None):
+        inst = (pool or ex).get(name)
+        if kind in ("ticker", "orderbook") and (live_fresh(name, symbol) or not venue_lists(name, symbol)):
+            return
+        if inst and not is_exchange_disabled(name):
+            jobs.append((inst, kind, symbol, arg))
+
+    if spread:
+        # 환율: get_usdt_krw 가 먼저 쓰는 거래소 하나만
+        for name in ["upbit", "bithumb"]:
+            if ex.get(name) and not is_exchange_disabled(name):
+                add(name, "ticker", "USDT/KRW")
+                break
+        # 변동성: 엔진 seed 전에만 1d OHLCV
+        if vol_needs_seed("BTC/USDT"):
+            add("binance", "ohlcv", "BTC/USDT", ("1d", VOL_SEED_DAYS + 1))
+
+    if spread or krw:
+        symbols = list(SPREAD_TICK_SYMBOLS) if spread else []
+        if krw:
+            symbols += [s for s in ARB_SYMBOLS if s not in symbols]
         for venue in ["upbit", "bithumb"]:
-            if venue not in ex or is_exchange_disabled(venue):
+            for sym in symbols:
+                add(venue, "ticker", f"{sym}/KRW")
+                if spread and sym in SPREAD_TICK_SYMBOLS:
+                    add(venue, "orderbook", f"{sym}/KRW", 10)
+        if spread:
+            for sym in SPREAD_TICK_SYMBOLS:
+                add("binance", "ticker", f"{sym}/USDT")
+
+    if ENABLE_LAYER_FUNDING_SIG and "funding" in layers:
+        for name in ["binance_fut", "bybit_fut", "okx_fut"]:
+            add(name, "funding", FUTURES_SYMBOL, pool=ex_fut)
+
+    if ENABLE_LAYER_TRI_MONITOR and "tri" in layers:
+        for name in TRI_MONITOR_VENUES:
+            for sym in ["BTC/USDT", "ETH/USDT", "ETH/BTC"]:
+                add(name, "ticker", sym)
+    return jobs
+
+
+def _run_fetch_job(inst, kind, symbol, arg):
+    if kind == "ticker":
+        return safe_ticker(inst, symbol)
+    if kind == "orderbook":
+        ob = safe_orderbook(inst, symbol, depth=arg)
+        if ob is None:
+            raise Exception(f"orderbook {inst.id} {symbol} unavailable")
+        return ob
+    if kind == "funding":
+        return cached_funding_rate(inst, symbol)
+    if kind == "ohlcv":
+        return cached_fetch(inst.id, "ohlcv", symbol, lambda: _fetch_ohlcv_raw(inst, symbol, arg[0], arg[1]))
+    if kind == "tickers":
+        return _fetch_tickers_bulk(inst, arg)
+    if kind == "fundings":
+        return _fetch_funding_rates_bulk(inst, arg)
+    raise ValueError(f"unknown fetch kind {kind}")
+
+
+# 개별 kind → (bulk kind, ccxt has 키)
+BULK_KINDS = {"ticker": ("tickers", "fetchTickers"), "funding": ("fundings", "fetchFundingRates")}
+
+
+def bulk_fetch_jobs(jobs):
+    """
+    거래소별로 BULK_MIN_SYMBOLS 개 이상 모인 ticker/funding 작업을 bulk 작업 1개로 합침.
+    캐시에 이미 신선한 심볼은 제외. → (bulk 작업, 남은 개별 작업, bulk 작업별 원래 개별 작업)
+    """
+    if not BULK_FETCH_ENABLED:
+        return [], jobs, []
+    groups = {}
+    for job in jobs:
+        inst, kind, symbol, _ = job
+        spec = BULK_KINDS.get(kind)
+        if spec and inst.has.get(spec[1]) and not cache_fresh(inst.id, kind, symbol):
+            groups.setdefault((id(inst), kind), []).append(job)
+    bulk, covered = [], []
+    for (_, kind), group in groups.items():
+        if len(group) < BULK_MIN_SYMBOLS:
+            continue
+        inst = group[0][0]
+        bulk.append((inst, BULK_KINDS[kind][0], None, [j[2] for j in group]))
+        covered.append(group)
+    skip = {id(j) for g in covered for j in g}
+    return bulk, [j for j in jobs if id(j) not in skip], covered
+
+
+_LAST_CACHE_TOTALS = {"hit": 0, "miss": 0, "coalesced": 0}
+
+
+def prefetch_market_data(layers=LAYER_NAMES):
+    """
+    루프에 필요한 티커/오더북/펀딩비를 스레드풀로 동시에 가져와 MARKET_CACHE 를 채움.
+    루프 wall time ≈ 가장 느린 요청 1개. 실패한 항목도 캐시에 남아
+    소비하는 쪽에서 기존과 같은 방식으로 처리한다.
+    """
+    jobs = market_data_jobs(layers)
+    if not jobs:
+        return
+    t0 = time.time()
+    pool = get_fetch_pool()
+    bulk, single, covered = bulk_fetch_jobs(jobs)
+    bulk_futs = [pool.submit(_run_fetch_job, *job) for job in bulk]
+    futures = [pool.submit(_run_fetch_job, *job) for job in single]
+    n_err = 0
+    # bulk 응답에 빠진 심볼만 개별 조회 (bulk 호출 자체 실패는 캐시에 저장된 예외로 대체)
+    for fut, group in zip(bulk_futs, covered):
+        try:
+            missing = set(fut.result())
+        except Exception:
+            n_err += 1
+            continue
+        futures += [pool.submit(_run_fetch_job, *job) for job in group if job[2] in missing]
+    for fut in futures:
+        try:
+            fut.result()
+        except Exception:
+            n_err += 1
+    print(f"[PREFETCH] {len(bulk) + len(futures)} requests ({len(bulk)} bulk) "
+          f"for {len(jobs)} items in {time.time() - t0:.2f}s (err={n_err})")
+
+
+def log_cache_stats():
+    """직전 호출 이후 캐시 hit/miss/coalesced 증가분 출력 (루프당 실제 요청 수 확인용)"""
+    global _LAST_CACHE_TOTALS
+    tot = cache_stats_totals()
+    d = {k: tot[k] - _LAST_CACHE_TOTALS[k] for k in tot}
+    _LAST_CACHE_TOTALS = tot
+    print(f"[CACHE] hit={d['hit']} miss={d['miss']} coalesced={d['coalesced']} (total miss={tot['miss']})")
+
+###############################################################################
+# SPREAD PREMIUM ENGINE
+# - spread_snapshot: 심볼 × 국내 거래소 오더북을 (S, V, depth) 배열로 모음 (I/O 는 여기서만, 대부분 캐시/스트림 hit)
+# - spread_premium_engine: VWAP/슬리피지/프리미엄/엣지/z-score/티어를 배열 연산 한 번으로 계산
+#   → 실행 가능한 기회 목록 (순엣지 큰 순)
+# - run_spread_arbitrage: 순위대로 실행 (잔고는 실행 시점 원장 기준)
+###############################################################################
+
+SPREAD_VENUES = ("upbit", "bithumb")
+SPREAD_BOOK_DEPTH = 10
+SPREAD_BIN_BOOK_DEPTH = 20  # 바이낸스 오더북은 실행할 기회에 대해서만 가져옴
+
+
+def spread_snapshot(symbols) -> dict:
+    """symbols 의 바이낸스 bid 와 국내 오더북을 고정 크기 배열로 (없는 칸은 nan / 0)"""
+    b = ex["binance"]
+    S, V, D = len(symbols), len(SPREAD_VENUES), SPREAD_BOOK_DEPTH
+    snap = {
+        "symbols": list(symbols),
+        "base_usdt": np.full(S, np.nan),
+        "amount": np.full((S, V), np.nan),
+        "bids_px": np.full((S, V, D), np.nan),
+        "bids_qty": np.zeros((S, V, D)),
+        "asks_px": np.full((S, V, D), np.nan),
+        "asks_qty": np.zeros((S, V, D)),
+    }
+    for i, symbol in enumerate(symbols):
+        try:
+            t_base = safe_ticker(b, f"{symbol}/USDT")
+            snap["base_usdt"][i] = float(t_base["bid"])
+            observe_quote_age("binance", "ticker", t_base)
+        except Exception as e:
+            print(f"[ARB] binance {symbol} ticker ERR {e}")
+            continue
+        for j, venue in enumerate(SPREAD_VENUES):
+            if venue not in ex or is_exchange_disabled(venue) or not venue_lists(venue, f"{symbol}/KRW"):
                 continue
             e = ex[venue]
             try:
                 t_krw = safe_ticker(e, f"{symbol}/KRW")
                 last_price = t_krw["last"]
-                record_price(venue, last_price)
+                record_price((venue, symbol), last_price)
             except Exception as e2:
                 print(f"[ARB] {venue} ticker ERR {e2}")
                 continue
-
-            test_amount = 0.01 if symbol == "BTC" else 0.05
-            ob = safe_orderbook(e, f"{symbol}/KRW", depth=10)
+            ob = safe_orderbook(e, f"{symbol}/KRW", depth=D)
             if not ob:
                 continue
+            observe_quote_age(venue, "orderbook", ob)
+            snap["amount"][i, j] = SPREAD_TEST_AMOUNT.get(symbol) or SPREAD_TEST_NOTIONAL_KRW / float(last_price or t_krw["bid"])
+            for side in ("bids", "asks"):
+                levels = ob[side][:D]
+                if levels:
+                    arr = np.asarray([lv[:2] for lv in levels], dtype=float)
+                    snap[side + "_px"][i, j, :len(levels)] = arr[:, 0]
+                    snap[side + "_qty"][i, j, :len(levels)] = arr[:, 1]
+    return snap
+
+
+def _book_vwap(px, qty, amount):
+    """(..., depth) 오더북을 amount 만큼 채울 때 VWAP (깊이가 모자라면 nan)"""
+    cum = np.cumsum(qty, axis=-1)
+    take = np.clip(amount[..., None] - (cum - qty), 0.0, qty)
+    cost = np.sum(take * np.nan_to_num(px), axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cum[..., -1] >= amount, cost / amount, np.nan)
+
+
+def spread_premium_engine(snap: dict, usdt_krw: float, tier1_thr: float, base_ratio: float) -> list:
+    """
+    스냅샷 전체에 대해 프리미엄 행렬 계산 → 엣지/z-score/티어 통과한 기회 목록.
+    각 기회: symbol, venue, side(SELL=김프 국내매도 / BUY=역프 국내매수), prem, vwap, tier, ratio, edge, base_usdt, usdt_krw
+    """
+    symbols = snap["symbols"]
+    base = snap["base_usdt"][:, None]
+    top_bid, top_ask = snap["bids_px"][..., 0], snap["asks_px"][..., 0]
+    vwap_sell = _book_vwap(snap["bids_px"], snap["bids_qty"], snap["amount"])
+    vwap_buy = _book_vwap(snap["asks_px"], snap["asks_qty"], snap["amount"])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sell_slip = np.abs(vwap_sell - top_bid) / top_bid
+        buy_slip = np.abs(vwap_buy - top_ask) / top_ask
+        sell_prem = np.where(sell_slip <= SLIPPAGE_LIMIT_PCT, (vwap_sell / usdt_krw / base - 1) * 100, np.nan)
+        buy_prem = np.where(buy_slip <= SLIPPAGE_LIMIT_PCT, (vwap_buy / usdt_krw / base - 1) * 100, np.nan)
+    n_slip = int(np.sum(sell_slip > SLIPPAGE_LIMIT_PCT) + np.sum(buy_slip > SLIPPAGE_LIMIT_PCT))
+    if n_slip:
+        print(f"[SLIP] {n_slip} vwap slippage too large, skip")
+
+    for i, symbol in enumerate(symbols):
+        if symbol not in ARB_SYMBOLS:
+            continue
+        for j, venue in enumerate(SPREAD_VENUES):
+            if np.isfinite(snap["amount"][i, j]):
+                sp, bp = sell_prem[i, j], buy_prem[i, j]
+                print(
+                    f"[REAL {symbol} {venue}] sell={None if np.isnan(sp) else float(sp)} "
+                    f"buy={None if np.isnan(bp) else float(bp)} thr={tier1_thr:.2f} base_ratio={base_ratio:.2f}"
+                )
 
-            # 슬리피지 제한 체크용 top price
-            top_bid = ob["bids"][0][0] if ob["bids"] else None
-            top_ask = ob["asks"][0][0] if ob["asks"] else None
+    # 프리미엄 히스토리 업데이트 (심볼당 O(1)) → 통계만 배열로 모아서 z-score
+    # 거래소 순서대로 그 거래소 프리미엄까지 넣은 직후의 통계로 판정 (기존 거래소별 루프와 같은 순서)
+    S, V = len(symbols), len(SPREAD_VENUES)
+    n_hist, mean, std = np.zeros((S, V)), np.zeros((S, V)), np.zeros((S, V))
+    for i, symbol in enumerate(symbols):
+        for j in range(V):
+            for prem in (sell_prem[i, j], buy_prem[i, j]):
+                if np.isfinite(prem):
+                    update_premium_history(SPREAD_PREM_HISTORY, symbol, float(prem))
+            arr = SPREAD_PREM_HISTORY.get(symbol)
+            if arr is not None:
+                n_hist[i, j], mean[i, j], std[i, j] = len(arr), arr.mean(), arr.std()
+
+    needed = EDGE_BUFFER_FEE_PCT + EDGE_BUFFER_SLIPPAGE_PCT + EDGE_MIN_NET_PCT
+    few, flat = n_hist < 10, std <= 1e-9
+
+    def z_ok(prem):
+        if not Z_SCORE_ENABLED:
+            return np.ones(prem.shape, dtype=bool)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = (prem - mean) / std
+        return few | (~flat & (np.abs(z) >= Z_SCORE_THR))
+
+    sell_tier = np.where(sell_prem >= tier1_thr, 1, np.where(sell_prem >= TIER2_THR, 2, 0))
+    buy_tier = np.where(buy_prem <= -tier1_thr, 1, np.where(buy_prem <= -TIER2_THR, 2, 0))
+
+    opps = []
+    for side, prem, vwap, tier in (("SELL", sell_prem, vwap_sell, sell_tier), ("BUY", buy_prem, vwap_buy, buy_tier)):
+        edge_ok = np.abs(prem) >= needed
+        passed = z_ok(prem)
+        for i, j in zip(*np.nonzero(edge_ok & ~passed)):
+            print(f"[Z] {symbols[i]} {SPREAD_VENUES[j]} {side} z-score 부족, skip")
+        for i, j in zip(*np.nonzero(edge_ok & passed & (tier > 0))):
+            t = int(tier[i, j])
+            w = health_weight(SPREAD_VENUES[j], "binance")
+            opps.append({
+                "symbol": symbols[i],
+                "venue": SPREAD_VENUES[j],
+                "side": side,
+                "prem": float(prem[i, j]),
+                "vwap": float(vwap[i, j]),
+                "tier": "TIER1" if t == 1 else "TIER2",
+                "ratio": (base_ratio if t == 1 else base_ratio * TIER2_RATIO_FACTOR) * w,
+                "edge": float(abs(prem[i, j]) - needed),
+                "weight": w,
+                "base_usdt": float(snap["base_usdt"][i]),
+                "usdt_krw": usdt_krw,
+            })
+    # 느리거나 에러가 잦은 거래소는 수량을 줄이고 순위도 뒤로
+    opps.sort(key=lambda o: o["edge"] * o["weight"], reverse=True)
+    return opps
+
+
+def execute_spread_opportunity(opp: dict, trade_times):
+    symbol, venue, side = opp["symbol"], opp["venue"], opp["side"]
+    trade_tier, trade_ratio, prem, vwap = opp["tier"], opp["ratio"], opp["prem"], opp["vwap"]
+    base_usdt = opp["base_usdt"]
+    ref_krw = base_usdt * opp["usdt_krw"]
+    b, e = ex["binance"], ex[venue]
+    base_pair = f"{symbol}/USDT"
 
-            vwap_sell_krw = calc_vwap(ob, test_amount, is_buy=False)
-            vwap_buy_krw = calc_vwap(ob, test_amount, is_buy=True)
+    try:
+        bal_b = ledger_balance("binance")
+        bal_k = ledger_balance(venue)
+    except Exception as e3:
+        print(f"[ARB] {symbol} balance ERR {e3}")
+        return
+    free_usdt = float(bal_b.get("USDT", {}).get("free", 0) or 0)
+    free_sym = float(bal_b.get(symbol, {}).get("free", 0) or 0)
+    ex_krw = float(bal_k.get("KRW", {}).get("free", 0) or 0)
+    ex_sym = float(bal_k.get(symbol, {}).get("free", 0) or 0)
+
+    if side == "SELL":
+        # 김프: 국내 SELL / 바이낸스 BUY
+        if ex_sym <= 0 or free_usdt <= 0:
+            return
+        amt = min(ex_sym * trade_ratio, (free_usdt * trade_ratio) / base_usdt)
+    else:
+        # 역프: 국내 BUY / 바이낸스 SELL
+        if ex_krw <= 0 or free_sym <= 0:
+            return
+        amt = min((ex_krw * trade_ratio) / vwap, free_sym * trade_ratio)
+    # 절대 노출 상한 (1순위)
+    amt = min(amt, MAX_NOTIONAL_PER_TRADE_KRW / vwap)
 
-            sell_prem = None
-            buy_prem = None
+    # 실제 거래 수량 기준 슬리피지/순엣지: 양쪽 호가 인덱스로 최대 수량 계산
+    ob_k = safe_orderbook(e, f"{symbol}/KRW", depth=SPREAD_BOOK_DEPTH)
+    if not ob_k:
+        return
+    ob_b = safe_orderbook(b, base_pair, depth=SPREAD_BIN_BOOK_DEPTH)
+    if not ob_b:
+        # 바이낸스 호가가 없으면 티커 가격에 충분한 물량이 있다고 보고 진행 (기존 동작)
+        ob_b = {"bids": [[base_usdt, 1e18]], "asks": [[base_usdt, 1e18]]}
+    dom_idx = BookIndex(ob_k["bids"] if side == "SELL" else ob_k["asks"], is_ask=(side == "BUY"))
+    bin_idx = BookIndex(ob_b["asks"] if side == "SELL" else ob_b["bids"], is_ask=(side == "SELL"))
+    slip_cap = min(dom_idx.size_for_slippage(SLIPPAGE_LIMIT_PCT), bin_idx.size_for_slippage(SLIPPAGE_LIMIT_PCT))
+    edge_cap = solve_spread_size(dom_idx, bin_idx, opp["usdt_krw"], side, EDGE_MIN_NET_PCT, min(amt, slip_cap))
+    if edge_cap < amt:
+        print(f"[SIZE] {symbol} {venue} {side} amt {amt:.6f} → {edge_cap:.6f} (slip_cap={slip_cap:.6f})")
+        amt = edge_cap
+    if amt <= 0:
+        return
+    vwap = dom_idx.vwap(amt)
+    base_usdt = bin_idx.vwap(amt)
+    ref_krw = base_usdt * opp["usdt_krw"]
+    if amt * vwap < MIN_NOTIONAL_KRW:
+        return
 
-            if vwap_sell_krw and top_bid:
-                # 슬리피지 체크 (2순위)
-                if abs(vwap_sell_krw - top_bid) / top_bid > SLIPPAGE_LIMIT_PCT:
-                    print(f"[SLIP] {symbol} {venue} SELL vwap slippage too large, skip")
-                else:
-                    sell_usdt = vwap_sell_krw / usdt_krw
-                    sell_prem = (sell_usdt / base_usdt - 1) * 100
+    if side == "SELL":
+        bin_filled, dom_filled = execute_two_legs(
+            (b, base_pair, "buy", amt, base_usdt),
+            (e, f"{symbol}/KRW", "sell", amt, vwap),
+        )
+    else:
+        dom_filled, bin_filled = execute_two_legs(
+            (e, f"{symbol}/KRW", "buy", amt, vwap),
+            (b, base_pair, "sell", amt, base_usdt),
+        )
+    effective_amt = min(bin_filled, dom_filled)
+    if effective_amt <= 0:
+        return
 
-            if vwap_buy_krw and top_ask:
-                if abs(vwap_buy_krw - top_ask) / top_ask > SLIPPAGE_LIMIT_PCT:
-                    print(f"[SLIP] {symbol} {venue} BUY vwap slippage too large, skip")
-                else:
-                    buy_usdt = vwap_buy_krw / usdt_krw
-                    buy_prem = (buy_usdt / base_usdt - 1) * 100
+    notional_krw_dom = effective_amt * vwap
+    notional_krw_bin = effective_amt * ref_krw
+    notional_krw = min(notional_krw_dom, notional_krw_bin)
+    total_fee = estimate_fee_krw(venue, notional_krw_dom) + estimate_fee_krw("binance", notional_krw_bin)
+    gross_pnl = (vwap - ref_krw) * effective_amt if side == "SELL" else (ref_krw - vwap) * effective_amt
+    net_pnl = gross_pnl - total_fee
+    print(f"[ARB {symbol}] {venue} {side} {trade_tier} amt={effective_amt} notional={int(notional_krw)} net_pnl={net_pnl:.0f}")
+    trade_times.append(now_ts())
+
+    log_trade(
+        layer="SPREAD_ARB",
+        symbol=symbol,
+        venue=venue,
+        side="KRW_SELL_BIN_BUY" if side == "SELL" else "KRW_BUY_BIN_SELL",
+        tier=trade_tier,
+        prem_pct=prem,
+        notional_krw=notional_krw,
+        amount=effective_amt,
+        gross_pnl_krw=gross_pnl,
+        fee_krw=total_fee,
+        net_pnl_krw=net_pnl,
+    )
 
-            print(f"[REAL {symbol} {venue}] sell={sell_prem} buy={buy_prem} thr={tier1_thr:.2f} base_ratio={base_ratio:.2f}")
+    update_pnl(f"{symbol}-{venue}-{side}-{trade_tier}", net_pnl, total_fee, layer="SPREAD")
+    send_telegram(f"[{symbol}] {venue} {side} {trade_tier} prem={prem:.2f}% amt={effective_amt:.6f} net_pnl={int(net_pnl)} DRY_RUN={DRY_RUN}")
 
-            # 프리미엄 히스토리 업데이트 (3순위 z-score)
-            if sell_prem is not None:
-                update_premium_history(SPREAD_PREM_HISTORY, symbol, sell_prem)
-            if buy_prem is not None:
-                update_premium_history(SPREAD_PREM_HISTORY, symbol, buy_prem)
+###############################################################################
+# ARB LAYERS
+###############################################################################
 
-            try:
-                bal_k = e.fetch_balance()
-            except AuthenticationError as ae:
-                print(f"[ARB] {venue} balance auth ERR {ae}")
-                record_exchange_error(venue)
-                continue
-            except Exception as e3:
-                print(f"[ARB] {venue} balance ERR {e3}")
-                record_exchange_error(venue)
-                continue
 
-            ex_krw = float(bal_k.get("KRW", {}).get("free", 0) or 0)
-            ex_sym = float(bal_k.get(symbol, {}).get("free", 0) or 0)
-
-            def net_edge_ok(prem: float) -> bool:
-                if prem is None:
-                    return False
-                gross = abs(prem)
-                needed = EDGE_BUFFER_FEE_PCT + EDGE_BUFFER_SLIPPAGE_PCT + EDGE_MIN_NET_PCT
-                return gross >= needed
-
-            # 김프: 국내 SELL / 바이낸스 BUY
-            if sell_prem is not None and can_trade_more(trade_times) and net_edge_ok(sell_prem):
-                # z-score 필터
-                if not z_score_filter(SPREAD_PREM_HISTORY, symbol, sell_prem):
-                    print(f"[Z] {symbol} {venue} SELL z-score 부족, skip")
-                else:
-                    trade_tier, trade_ratio = None, 0.0
-                    if sell_prem >= tier1_thr:
-                        trade_tier, trade_ratio = "TIER1", base_ratio
-                    elif sell_prem >= TIER2_THR:
-                        trade_tier, trade_ratio = "TIER2", base_ratio * TIER2_RATIO_FACTOR
-
-                    if trade_tier and ex_sym > 0 and free_usdt > 0:
-                        max_from_k = ex_sym * trade_ratio
-                        max_from_b = (free_usdt * trade_ratio) / base_usdt
-                        amt = min(max_from_k, max_from_b)
-                        # 절대 노출 상한 (1순위)
-                        vwap = vwap_sell_krw or t_krw["bid"]
-                        notional_krw_est = amt * vwap
-                        if notional_krw_est > MAX_NOTIONAL_PER_TRADE_KRW:
-                            amt = MAX_NOTIONAL_PER_TRADE_KRW / vwap
-                            notional_krw_est = MAX_NOTIONAL_PER_TRADE_KRW
-
-                        if notional_krw_est >= MIN_NOTIONAL_KRW and amt > 0:
-                            # 실제 진입
-                            bin_filled = place_market_order(b, base_pair, "buy", amt)
-                            dom_filled = place_market_order(e, f"{symbol}/KRW", "sell", amt)
-                            effective_amt = min(bin_filled, dom_filled)
-                            if effective_amt <= 0:
-                                continue
-
-                            notional_krw_sell = effective_amt * vwap
-                            notional_krw_buy = effective_amt * ref_krw
-                            notional_krw = min(notional_krw_sell, notional_krw_buy)
-
-                            fee_sell = estimate_fee_krw(venue, notional_krw_sell)
-                            fee_buy = estimate_fee_krw("binance", notional_krw_buy)
-                            gross_pnl = (vwap - ref_krw) * effective_amt
-                            total_fee = fee_sell + fee_buy
-                            net_pnl = gross_pnl - total_fee
-                            print(f"[ARB {symbol}] {venue} SELL {trade_tier} amt={effective_amt} notional={int(notional_krw)} net_pnl={net_pnl:.0f}")
-                            trade_times.append(now_ts())
-
-                            log_trade(
-                                layer="SPREAD_ARB",
-                                symbol=symbol,
-                                venue=venue,
-                                side="KRW_SELL_BIN_BUY",
-                                tier=trade_tier,
-                                prem_pct=sell_prem,
-                                notional_krw=notional_krw,
-                                amount=effective_amt,
-                                gross_pnl_krw=gross_pnl,
-                                fee_krw=total_fee,
-                                net_pnl_krw=net_pnl,
-                            )
-
-                            update_pnl(f"{symbol}-{venue}-SELL-{trade_tier}", net_pnl, total_fee, layer="SPREAD")
-                            send_telegram(f"[{symbol}] {venue} SELL {trade_tier} prem={sell_prem:.2f}% amt={effective_amt:.6f} net_pnl={int(net_pnl)} DRY_RUN={DRY_RUN}")
-
-            # 역프: 국내 BUY / 바이낸스 SELL
-            if buy_prem is not None and can_trade_more(trade_times) and net_edge_ok(buy_prem):
-                if not z_score_filter(SPREAD_PREM_HISTORY, symbol, buy_prem):
-                    print(f"[Z] {symbol} {venue} BUY z-score 부족, skip")
-                else:
-                    trade_tier, trade_ratio = None, 0.0
-                    if buy_prem <= -tier1_thr:
-                        trade_tier, trade_ratio = "TIER1", base_ratio
-                    elif buy_prem <= -TIER2_THR:
-                        trade_tier, trade_ratio = "TIER2", base_ratio * TIER2_RATIO_FACTOR
-
-                    if trade_tier and ex_krw > 0 and free_sym > 0:
-                        vwap = vwap_buy_krw or t_krw["ask"]
-                        max_from_krw = (ex_krw * trade_ratio) / vwap
-                        max_from_sym = free_sym * trade_ratio
-                        amt = min(max_from_krw, max_from_sym)
-                        notional_krw_est = amt * vwap
-                        if notional_krw_est > MAX_NOTIONAL_PER_TRADE_KRW:
-                            amt = MAX_NOTIONAL_PER_TRADE_KRW / vwap
-                            notional_krw_est = MAX_NOTIONAL_PER_TRADE_KRW
-
-                        if notional_krw_est >= MIN_NOTIONAL_KRW and amt > 0:
-                            dom_filled = place_market_order(e, f"{symbol}/KRW", "buy", amt)
-                            bin_filled = place_market_order(b, base_pair, "sell", amt)
-                            effective_amt = min(dom_filled, bin_filled)
-                            if effective_amt <= 0:
-                                continue
-
-                            notional_krw_buy = effective_amt * vwap
-                            notional_krw_sell = effective_amt * ref_krw
-                            notional_krw = min(notional_krw_buy, notional_krw_sell)
-
-                            fee_buy = estimate_fee_krw(venue, notional_krw_buy)
-                            fee_sell = estimate_fee_krw("binance", notional_krw_sell)
-                            gross_pnl = (ref_krw - vwap) * effective_amt
-                            total_fee = fee_buy + fee_sell
-                            net_pnl = gross_pnl - total_fee
-                            print(f"[ARB {symbol}] {venue} BUY {trade_tier} amt={effective_amt} notional={int(notional_krw)} net_pnl={net_pnl:.0f}")
-                            trade_times.append(now_ts())
-
-                            log_trade(
-                                layer="SPREAD_ARB",
-                                symbol=symbol,
-                                venue=venue,
-                                side="KRW_BUY_BIN_SELL",
-                                tier=trade_tier,
-                                prem_pct=buy_prem,
-                                notional_krw=notional_krw,
-                                amount=effective_amt,
-                                gross_pnl_krw=gross_pnl,
-                                fee_krw=total_fee,
-                                net_pnl_krw=net_pnl,
-                            )
-
-                            update_pnl(f"{symbol}-{venue}-BUY-{trade_tier}", net_pnl, total_fee, layer="SPREAD")
-                            send_telegram(f"[{symbol}] {venue} BUY {trade_tier} prem={buy_prem:.2f}% amt={effective_amt:.6f} net_pnl={int(net_pnl)} DRY_RUN={DRY_RUN}")
+def run_spread_arbitrage(symbols, tier1_thr: float, base_ratio: float, trade_times):
+    """symbols (심볼 하나 또는 목록) 전체를 한 번에 평가하고 순엣지 큰 기회부터 실행"""
+    global disable_trading
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if disable_trading or not ENABLE_LAYER_SPREAD_ARB or STATE["spread_disabled_today"]:
+        print(f"[ARB] SPREAD skip {','.join(symbols)}")
+        return
+    if is_exchange_disabled("binance"):
+        print("[ARB] binance disabled, skip SPREAD")
+        return
+    if np is None:
+        print("[ARB] numpy 없음, skip SPREAD")
+        return
+    try:
+        usdt_krw = get_usdt_krw()
+        snap = spread_snapshot(symbols)
+        update_premium_features(snap, usdt_krw)
+        t0 = time.perf_counter()
+        opps = spread_premium_engine(snap, usdt_krw, tier1_thr, base_ratio)
+        best = f" best={opps[0]['symbol']} {opps[0]['venue']} {opps[0]['side']} {opps[0]['prem']:.2f}%" if opps else ""
+        print(f"[PREM] {len(symbols)}x{len(SPREAD_VENUES)} in {(time.perf_counter() - t0) * 1000:.2f}ms opps={len(opps)}{best}")
     except Exception as e:
-        print(f"[ARB ERR] {symbol} {e}")
-        send_telegram(f"[ARB ERR] {symbol}: {e}")
+        print(f"[ARB ERR] {e}")
+        send_telegram(f"[ARB ERR] SPREAD: {e}")
+        return
+
+    for opp in opps:
+        if not can_trade_more(trade_times):
+            break
+        try:
+            execute_spread_opportunity(opp, trade_times)
+        except Exception as e:
+            print(f"[ARB ERR] {opp['symbol']} {e}")
+            send_telegram(f"[ARB ERR] {opp['symbol']}: {e}")
 
 
 def run_krw_cross_arb(symbol: str):
@@ -1096,6 +4147,8 @@ def run_krw_cross_arb(symbol: str):
         u, bth = ex["upbit"], ex["bithumb"]
         t_u = safe_ticker(u, f"{symbol}/KRW")
         t_b = safe_ticker(bth, f"{symbol}/KRW")
+        observe_quote_age("upbit", "ticker", t_u)
+        observe_quote_age("bithumb", "ticker", t_b)
         price_u, price_b = float(t_u["last"]), float(t_b["last"])
         diff, mid = price_u - price_b, (price_u + price_b) / 2
         prem = (diff / mid) * 100
@@ -1115,12 +4168,12 @@ def run_krw_cross_arb(symbol: str):
             print(f"[KRW-ARB {symbol}] prem={prem:.3f}% but net edge 부족(need {needed:.2f}%)")
             return
 
-        bal_u, bal_b = u.fetch_balance(), bth.fetch_balance()
+        bal_u, bal_b = ledger_balance("upbit"), ledger_balance("bithumb")
         free_u_sym = float(bal_u.get(symbol, {}).get("free", 0) or 0)
         free_b_sym = float(bal_b.get(symbol, {}).get("free", 0) or 0)
         free_u_krw = float(bal_u.get("KRW", {}).get("free", 0) or 0)
         free_b_krw = float(bal_b.get("KRW", {}).get("free", 0) or 0)
-        max_notional = KRW_ARB_RATIO * min(
+        max_notional = KRW_ARB_RATIO * health_weight("upbit", "bithumb") * min(
             free_u_sym * price_u + free_u_krw,
             free_b_sym * price_b + free_b_krw,
         )
@@ -1144,8 +4197,10 @@ def run_krw_cross_arb(symbol: str):
             net_pnl = gross_pnl - total_fee
             print(f"[KRW-ARB {symbol}] upbit SELL, bithumb BUY amt={amt} net_pnl={net_pnl:.0f}")
 
-            up_filled = place_market_order(u, f"{symbol}/KRW", "sell", amt)
-            bt_filled = place_market_order(bth, f"{symbol}/KRW", "buy", amt)
+            up_filled, bt_filled = execute_two_legs(
+                (u, f"{symbol}/KRW", "sell", amt, price_u),
+                (bth, f"{symbol}/KRW", "buy", amt, price_b),
+            )
             effective_amt = min(up_filled, bt_filled)
             if effective_amt <= 0:
                 return
@@ -1181,8 +4236,10 @@ def run_krw_cross_arb(symbol: str):
             net_pnl = gross_pnl - total_fee
             print(f"[KRW-ARB {symbol}] bithumb SELL, upbit BUY amt={amt} net_pnl={net_pnl:.0f}")
 
-            bt_filled = place_market_order(bth, f"{symbol}/KRW", "sell", amt)
-            up_filled = place_market_order(u, f"{symbol}/KRW", "buy", amt)
+            bt_filled, up_filled = execute_two_legs(
+                (bth, f"{symbol}/KRW", "sell", amt, price_b),
+                (u, f"{symbol}/KRW", "buy", amt, price_u),
+            )
             effective_amt = min(bt_filled, up_filled)
             if effective_amt <= 0:
                 return
@@ -1220,27 +4277,30 @@ def funding_arbitrage_signals():
         try:
             bin_fut = ex_fut.get("binance_fut")
             if bin_fut:
-                fr = bin_fut.fetch_funding_rate(FUTURES_SYMBOL)
+                fr = cached_funding_rate(bin_fut, FUTURES_SYMBOL)
+                observe_quote_age("binance_fut", "funding", fr)
                 rates["binance_fut"] = fr["fundingRate"]
         except Exception as e:
             print(f"[FUND] binance_fut ERR {e}")
-            record_exchange_error("binance_fut")
+            record_exchange_error("binance_fut", e)
         try:
             bybit_fut = ex_fut.get("bybit_fut")
             if bybit_fut:
-                fr = bybit_fut.fetch_funding_rate(FUTURES_SYMBOL)
+                fr = cached_funding_rate(bybit_fut, FUTURES_SYMBOL)
+                observe_quote_age("bybit_fut", "funding", fr)
                 rates["bybit_fut"] = fr["fundingRate"]
         except Exception as e:
             print(f"[FUND] bybit_fut ERR {e}")
-            record_exchange_error("bybit_fut")
+            record_exchange_error("bybit_fut", e)
         try:
             okx_fut = ex_fut.get("okx_fut")
             if okx_fut:
-                fr = okx_fut.fetch_funding_rate(FUTURES_SYMBOL)
+                fr = cached_funding_rate(okx_fut, FUTURES_SYMBOL)
+                observe_quote_age("okx_fut", "funding", fr)
                 rates["okx_fut"] = fr["fundingRate"]
         except Exception as e:
             print(f"[FUND] okx_fut ERR {e}")
-            record_exchange_error("okx_fut")
+            record_exchange_error("okx_fut", e)
 
         print(f"[FUND RATES] {rates}")
         if len(rates) < 2:
@@ -1270,8 +4330,39 @@ def funding_arbitrage_signals():
                     print("[FUND CLOSE] missing fut instance")
                     return
                 print(f"[FUND ARB CLOSE] reason={close_reason}, short={short_key}, long={long_key}, amt={amount:.4f}")
-                place_market_order(short_ex, symbol, "buy", amount)
-                place_market_order(long_ex, symbol, "sell", amount)
+                closed_short, closed_long = execute_two_legs(
+                    (short_ex, symbol, "buy", amount, None),
+                    (long_ex, symbol, "sell", amount, None),
+                )
+                closed = min(closed_short, closed_long)
+                if _legs_mismatch(closed_short, amount) or _legs_mismatch(closed_long, amount):
+                    # 일부/전부 미체결 → 포지션 유지, 실제로 닫힌 만큼만 차감
+                    remaining = max(0.0, amount - closed)
+                    if closed > 0:
+                        log_trade(
+                            layer="FUNDING_ARB",
+                            symbol=symbol,
+                            venue=f"{short_key}_{long_key}",
+                            side="CLOSE_PARTIAL",
+                            tier="NONE",
+                            prem_pct=spread * 100,
+                            notional_krw=None,
+                            amount=closed,
+                            gross_pnl_krw=None,
+                            fee_krw=None,
+                            net_pnl_krw=None,
+                        )
+                    FUNDING_POS["amount"] = remaining
+                    save_state()
+                    msg = (
+                        "[FUND ARB CLOSE FAIL]\n"
+                        f"- short: {short_key} closed={closed_short:.4f}\n- long : {long_key} closed={closed_long:.4f}\n"
+                        f"- 요청 amt={amount:.4f} → 남은 포지션 {remaining:.4f} BTC (계속 추적, 다음 루프 재시도)\n"
+                        f"- reason: {close_reason}\n- DRY_RUN={DRY_RUN}"
+                    )
+                    print(msg)
+                    send_telegram(msg)
+                    return
 
                 # 로그 (청산)
                 log_trade(
@@ -1304,6 +4395,7 @@ def funding_arbitrage_signals():
                     "open_spread": 0.0,
                     "open_time": 0.0,
                 })
+                save_state()
             return
 
         # 새 포지션 진입
@@ -1319,13 +4411,13 @@ def funding_arbitrage_signals():
             print("[FUND] missing fut instance for open")
             return
         symbol = FUTURES_SYMBOL
-        t_high = high_ex.fetch_ticker(symbol)
-        t_low = low_ex.fetch_ticker(symbol)
+        t_high = safe_ticker(high_ex, symbol)
+        t_low = safe_ticker(low_ex, symbol)
         price_high = float(t_high["last"] or t_high["bid"])
         price_low = float(t_low["last"] or t_low["bid"])
         mid_price = (price_high + price_low) / 2.0
 
-        bal_high, bal_low = high_ex.fetch_balance(), low_ex.fetch_balance()
+        bal_high, bal_low = ledger_balance(high_key), ledger_balance(low_key)
         free_high_usdt = float(bal_high.get("USDT", {}).get("free", 0) or 0)
         free_low_usdt = float(bal_low.get("USDT", {}).get("free", 0) or 0)
         max_usable_usdt = min(free_high_usdt, free_low_usdt) * FUNDING_ARB_RATIO
@@ -1337,8 +4429,13 @@ def funding_arbitrage_signals():
         if amount <= 0:
             return
         print(f"[FUND ARB OPEN] short {high_key}, long {low_key}, amt={amount:.4f}, notional≈{max_usable_usdt:.1f}, spread={spread:.5f}")
-        place_market_order(high_ex, symbol, "sell", amount)
-        place_market_order(low_ex, symbol, "buy", amount)
+        short_filled, long_filled = execute_two_legs(
+            (high_ex, symbol, "sell", amount, price_high),
+            (low_ex, symbol, "buy", amount, price_low),
+        )
+        amount = min(short_filled, long_filled)
+        if amount <= 0:
+            return
         FUNDING_POS.update({
             "active": True,
             "short_ex": high_key,
@@ -1348,6 +4445,7 @@ def funding_arbitrage_signals():
             "open_spread": float(spread),
             "open_time": now,
         })
+        save_state()
 
         # 로그 (오픈)
         log_trade(
@@ -1400,12 +4498,148 @@ def triangular_monitor(name: str):
 ###############################################################################
 
 
+def layer_interval(name: str) -> float:
+    return LAYER_SCHEDULE.get(name, {}).get("interval") or MAIN_LOOP_INTERVAL
+
+
+def layer_enabled(name: str) -> bool:
+    return {
+        "spread": ENABLE_LAYER_SPREAD_ARB,
+        "krw": ENABLE_LAYER_KRW_CROSS,
+        "funding": ENABLE_LAYER_FUNDING_SIG,
+        "tri": ENABLE_LAYER_TRI_MONITOR,
+    }[name]
+
+
+def check_book_trigger(venue: str, symbol: str, mid: float):
+    """관측된 mid 가 레이어 마지막 평가 시점 대비 trigger_pct 이상 움직이면 해당 레이어 깨움"""
+    fired = False
+    with _TRIGGER_LOCK:
+        LAST_MID[(venue, symbol)] = mid
+        for layer, venues in TRIGGER_VENUES.items():
+            thr = LAYER_SCHEDULE.get(layer, {}).get("trigger_pct")
+            if not thr or venue not in venues:
+                continue
+            ref = LAST_EVAL_MID.get((layer, venue, symbol))
+            if ref is None:
+                LAST_EVAL_MID[(layer, venue, symbol)] = mid
+                continue
+            # 이미 대기 중인 레이어면 이벤트를 다시 울리지 않음 (디바운스 동안 메시지마다 루프가 깨지 않게)
+            if layer not in PENDING_TRIGGERS and abs(mid - ref) / ref * 100 >= thr:
+                PENDING_TRIGGERS.add(layer)
+                fired = True
+    if fired:
+        MARKET_EVENT.set()
+
+
+def _mark_layer_evaluated(layer: str):
+    venues = TRIGGER_VENUES.get(layer)
+    if not venues:
+        return
+    with _TRIGGER_LOCK:
+        for (venue, symbol), mid in LAST_MID.items():
+            if venue in venues:
+                LAST_EVAL_MID[(layer, venue, symbol)] = mid
+
+
+def take_triggers(layers, now: float, next_due: dict, last_run: dict) -> set:
+    """
+    이번에 돌 레이어(타이머 도래 또는 디바운스 SCHEDULER_MIN_GAP_SEC 경과)의 트리거만 꺼냄.
+    나머지는 PENDING_TRIGGERS 에 그대로 둠 → 복사 / 비우기 / 되돌려 넣기 사이에 다른 스레드가 넣은 트리거가 사라지지 않음
+    """
+    with _TRIGGER_LOCK:
+        ready = {
+            n for n in PENDING_TRIGGERS
+            if n in layers and (now >= next_due[n] or now - last_run[n] >= SCHEDULER_MIN_GAP_SEC)
+        }
+        PENDING_TRIGGERS.difference_update(ready)
+    return ready
+
+
+def scheduler_wait(now: float, next_due: dict, last_run: dict) -> float:
+    """다음 타이머 또는 대기 중인 트리거의 디바운스 마감까지 남은 시간"""
+    deadlines = list(next_due.values())
+    with _TRIGGER_LOCK:
+        deadlines += [last_run[n] + SCHEDULER_MIN_GAP_SEC for n in PENDING_TRIGGERS if n in last_run]
+    return min(deadlines) - now if deadlines else MAIN_LOOP_INTERVAL
+
+
+def run_layers(due, trade_times):
+    """due 레이어들만 실행 (공통 준비 → 필요한 데이터만 prefetch → 레이어)"""
+    global SPREAD_TICK_SYMBOLS
+    rollover_daily_pnl()
+    reconcile_balances()
+    if "spread" in due:
+        refresh_spread_universe()
+        SPREAD_TICK_SYMBOLS = select_spread_symbols()
+    prefetch_market_data(due)
+    if disable_trading:
+        print("[LOOP] trading disabled – 매매 중단 상태")
+        return
+
+    if "spread" in due:
+        t0 = time.perf_counter()
+        vol = get_daily_volatility()
+        tier1_thr, base_ratio = auto_tier1_params(vol, trade_times)
+        trades_1h = len([t for t in trade_times if now_ts() - t <= 3600])
+        print(
+            f"\n[LOOP] vol={vol:.2f}% rv={get_realized_volatility():.2f}% tier1_thr={tier1_thr:.2f}% base_ratio={base_ratio:.2f} "
+            f"trades_1h={trades_1h} day_pnl={STATE['realized_pnl_krw_daily']:.0f} "
+            f"symbols={len(SPREAD_TICK_SYMBOLS)}/{len(SPREAD_UNIVERSE)}"
+        )
+        run_spread_arbitrage(SPREAD_TICK_SYMBOLS, tier1_thr, base_ratio, trade_times)
+        observe("layer", time.perf_counter() - t0, layer="spread")
+    if "krw" in due:
+        t0 = time.perf_counter()
+        for sym in ARB_SYMBOLS:
+            run_krw_cross_arb(sym)
+        observe("layer", time.perf_counter() - t0, layer="krw")
+    if "funding" in due:
+        t0 = time.perf_counter()
+        funding_arbitrage_signals()
+        observe("layer", time.perf_counter() - t0, layer="funding")
+    if "tri" in due:
+        t0 = time.perf_counter()
+        for name in TRI_MONITOR_VENUES:
+            triangular_monitor(name)
+        observe("layer", time.perf_counter() - t0, layer="tri")
+
+
+def market_symbols_by_venue() -> dict:
+    """실시간 시세(웹소켓/워커)로 받을 거래소별 심볼"""
+    out = {
+        venue: [f"{s}/KRW" for s in SPREAD_UNIVERSE if venue_lists(venue, f"{s}/KRW")] + ["USDT/KRW"]
+        for venue in ["upbit", "bithumb"]
+    }
+    out["binance"] = [f"{s}/USDT" for s in SPREAD_UNIVERSE]
+    for name in TRI_MONITOR_VENUES:
+        out.setdefault(name, []).extend(["BTC/USDT", "ETH/USDT", "ETH/BTC"])
+    return out
+
+
 def main():
     global disable_trading
     load_state()
     init_exchanges()
     init_trade_log()
+    reconcile_balances(force=True)
+    refresh_spread_universe(force=True)
+    if METRICS_ENABLED:
+        start_metrics_server()
+    if RECORDER_ENABLED:
+        start_recorder()
+    # 유니버스는 시작 시점 기준으로 구독 (이후 갱신으로 추가된 심볼은 REST 라운드로빈)
+    symbols_by_venue = market_symbols_by_venue()
+    if WS_ENABLED:
+        start_market_stream({v: syms for v, syms in symbols_by_venue.items() if v in WS_URLS})
+    if MP_WORKERS_ENABLED:
+        # 웹소켓이 맡은 거래소는 제외
+        start_md_workers({
+            v: syms for v, syms in symbols_by_venue.items()
+            if v in ex and not (WS_ENABLED and websockets is not None and v in WS_URLS)
+        })
     equity_krw = estimate_total_equity_krw()
+    start_equity_service()
     msg = (
         f"김프봇 안정형 성장 시작 (DRY_RUN={DRY_RUN})\n"
         f"- 추정 자본: 약 {int(equity_krw):,} KRW\n"
@@ -1416,40 +4650,33 @@ def main():
     send_telegram(msg)
 
     trade_times = []
+    layers = [name for name in LAYER_NAMES if layer_enabled(name)]
+    next_due = {name: 0.0 for name in layers}
+    last_run = {name: 0.0 for name in layers}
 
+    # 레이어별 cadence(타이머) 또는 오더북 변화 트리거로 깨어나고, 그 사이에는 Event 대기 (idle)
     while True:
-        loop_start = now_ts()
-        try:
-            rollover_daily_pnl()
-            vol = get_daily_volatility()
-            tier1_thr, base_ratio = auto_tier1_params(vol, trade_times)
-            trades_1h = len([t for t in trade_times if now_ts() - t <= 3600])
-            print(
-                f"\n[LOOP] vol={vol:.2f}% tier1_thr={tier1_thr:.2f}% base_ratio={base_ratio:.2f} "
-                f"trades_1h={trades_1h} day_pnl={STATE['realized_pnl_krw_daily']:.0f}"
-            )
-
-            if not disable_trading:
-                if ENABLE_LAYER_SPREAD_ARB:
-                    run_spread_arbitrage("BTC", tier1_thr, base_ratio, trade_times)
-                    run_spread_arbitrage("ETH", tier1_thr, base_ratio, trade_times)
-                if ENABLE_LAYER_KRW_CROSS:
-                    run_krw_cross_arb("BTC")
-                    run_krw_cross_arb("ETH")
-                if ENABLE_LAYER_FUNDING_SIG:
-                    funding_arbitrage_signals()
-                if ENABLE_LAYER_TRI_MONITOR:
-                    for name in ["bybit", "okx"]:
-                        triangular_monitor(name)
-            else:
-                print("[LOOP] trading disabled – 매매 중단 상태")
-        except Exception as e:
-            print(f"[MAIN ERR] {e}")
-            send_telegram(f"[MAIN ERR] {e}")
-        elapsed = now_ts() - loop_start
-        sleep_time = max(5, MAIN_LOOP_INTERVAL - elapsed)
-        print(f"[LOOP] sleep {sleep_time:.1f}s")
-        time.sleep(sleep_time)
+        now = now_ts()
+        triggered = take_triggers(layers, now, next_due, last_run)
+        due = [name for name in layers if now >= next_due[name] or name in triggered]
+        if due:
+            loop_start = now_ts()
+            try:
+                run_layers(due, trade_times)
+            except Exception as e:
+                print(f"[MAIN ERR] {e}")
+                send_telegram(f"[MAIN ERR] {e}")
+            for name in due:
+                last_run[name] = loop_start
+                next_due[name] = loop_start + layer_interval(name)
+                _mark_layer_evaluated(name)
+            log_cache_stats()
+            flush_trade_log()
+            trig = [n for n in due if n in triggered]
+            print(f"[SCHED] ran {','.join(due)}{' (trigger ' + ','.join(trig) + ')' if trig else ''} in {now_ts() - loop_start:.2f}s")
+        # 새 트리거가 들어오면 (check_book_trigger 가 set) 바로 깨고, 아니면 다음 마감까지 잠
+        MARKET_EVENT.wait(timeout=max(0.05, scheduler_wait(now_ts(), next_due, last_run)))
+        MARKET_EVENT.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import os
+import sys
+
+# bot.py 는 import 시 API 키 환경변수를 요구 → 테스트는 거래소에 붙지 않으므로 더미값
+for _k in [
+    "BINANCE_API_KEY", "BINANCE_SECRET", "UPBIT_API_KEY", "UPBIT_SECRET",
+    "BITHUMB_API_KEY", "BITHUMB_SECRET", "BYBIT_API_KEY", "BYBIT_SECRET",
+    "OKX_API_KEY", "OKX_SECRET", "OKX_PASSWORD", "TELEGRAM_TOKEN", "CHAT_ID",
+]:
+    os.environ.setdefault(_k, "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import bot
+
+
+@pytest.fixture(autouse=True)
+def quiet_bot(monkeypatch, tmp_path):
+    """텔레그램/상태 저장/레이트리밋을 끄고 파일은 tmp_path 로"""
+    sent = []
+    monkeypatch.setattr(bot, "send_telegram", sent.append)
+    monkeypatch.setattr(bot, "STATE_DB_FILE", str(tmp_path / "state.db"))
+    monkeypatch.setattr(bot, "store_put", lambda key, value: None)
+    monkeypatch.setattr(bot, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(bot, "HEALTH_ENABLED", False)
+    monkeypatch.setattr(bot, "DISABLED_UNTIL", {})
+    monkeypatch.setattr(bot, "ERROR_COUNT", {})
+    return sent
@@ -0,0 +1,50 @@
+import pytest
+
+import backtest
+import bot
+
+
+@pytest.fixture
+def restore(monkeypatch):
+    """apply_overrides 가 바꾸는 전역값을 테스트 끝에 되돌림"""
+    def keep(*keys):
+        for k in keys:
+            monkeypatch.setitem(bot.CONFIG, k, bot.CONFIG[k])
+            monkeypatch.setattr(bot, k, getattr(bot, k))
+    monkeypatch.setattr(bot, "FUNDING_MAX_HOURS_HOLD", bot.FUNDING_MAX_HOURS_HOLD)
+    monkeypatch.setattr(bot, "PREMIUM_MODEL", bot.PREMIUM_MODEL)
+    for name in ("VOL_ENGINES", "price_history", "SPREAD_PREM_HISTORY", "KRW_PREM_HISTORY"):
+        monkeypatch.setattr(bot, name, {})
+    return keep
+
+
+def test_overrides_reach_objects_built_from_config(restore):
+    restore("VOL_BAR_SEC", "VOL_RV_BARS", "Z_SCORE_WINDOW", "PRED_LEARNING_RATE", "FUNDING_TARGET_PAYMENTS")
+    bot.vol_observe(bot.VOL_VENUE, "BTC/USDT", 100.0)
+    bot.update_premium_history(bot.SPREAD_PREM_HISTORY, "BTC", 1.0)
+
+    backtest.apply_overrides({
+        "VOL_BAR_SEC": 120, "VOL_RV_BARS": 7, "Z_SCORE_WINDOW": 5,
+        "PRED_LEARNING_RATE": 0.5, "FUNDING_TARGET_PAYMENTS": 2,
+    })
+    assert bot.FUNDING_MAX_HOURS_HOLD == 2 * bot.FUNDING_INTERVAL_HOURS
+    assert bot.PREMIUM_MODEL.lr == 0.5
+
+    # 오버라이드 전에 만들어진 창/엔진은 버려지고 새 크기로 다시 생성
+    bot.vol_observe(bot.VOL_VENUE, "BTC/USDT", 100.0)
+    eng = bot.VOL_ENGINES["BTC/USDT"]
+    assert eng.bar_sec == 120.0 and eng.rv.maxlen == 7
+    for i in range(10):
+        bot.update_premium_history(bot.SPREAD_PREM_HISTORY, "BTC", float(i))
+    assert len(bot.SPREAD_PREM_HISTORY["BTC"]) == 5
+
+
+@pytest.mark.parametrize("key", ["RATE_LIMITS", "HEALTH_WINDOW", "WS_MAX_AGE_SEC", "DRY_RUN", "MP_BOOK_DEPTH"])
+def test_overrides_without_effect_are_rejected(restore, key):
+    with pytest.raises(SystemExit, match="no effect"):
+        backtest.apply_overrides({key: bot.CONFIG[key]})
+
+
+def test_unknown_override_rejected(restore):
+    with pytest.raises(SystemExit, match="unknown"):
+        backtest.apply_overrides({"NOT_A_KEY": 1})
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+import bot
+
+
+def linear_vwap(levels, amount: float):
+    """기존 calc_vwap 의 호가 순회 그대로 (깊이 부족이면 None)"""
+    remain, cost = amount, 0.0
+    for price, vol in levels:
+        use = min(vol, remain)
+        cost += price * use
+        remain -= use
+        if remain <= 0:
+            break
+    if remain > 0:
+        return None
+    return cost / amount
+
+
+def synth_side(rng, top: float, depth: int, is_ask: bool, tick: float = 0.0005):
+    sign = 1 if is_ask else -1
+    levels = [[top * (1 + sign * tick * k), rng.choice([0.0, rng.uniform(0.01, 2.0)])] for k in range(depth)]
+    levels[0][1] = rng.uniform(0.01, 2.0)
+    return levels
+
+
+def books(seed: int, n: int = 30):
+    rng = random.Random(seed)
+    for _ in range(n):
+        depth = rng.randint(1, 20)
+        yield rng, synth_side(rng, 95_000_000.0, depth, True), synth_side(rng, 94_990_000.0, depth, False)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vwap_matches_linear_walk(seed):
+    for rng, asks, bids in books(seed):
+        for levels, is_ask in ((asks, True), (bids, False)):
+            idx = bot.BookIndex(levels, is_ask)
+            total = sum(q for _, q in levels)
+            cum = 0.0
+            amounts = [rng.uniform(0, total * 1.2) for _ in range(20)]
+            for _, q in levels:  # 호가 경계 정확히
+                cum += q
+                amounts.append(cum)
+            for a in amounts:
+                if a <= 0:
+                    continue
+                ref = linear_vwap(levels, a)
+                got = idx.vwap(a)
+                if ref is None:
+                    assert got is None or a <= total * (1 + 1e-12)
+                else:
+                    assert got == pytest.approx(ref, rel=1e-12)
+                ob = {"asks": asks, "bids": bids}
+                assert bot.calc_vwap(ob, a, is_ask) == ref
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_size_for_slippage_matches_brute_force(seed):
+    for rng, asks, bids in books(seed):
+        for levels, is_ask in ((asks, True), (bids, False)):
+            idx = bot.BookIndex(levels, is_ask)
+            top, sign = levels[0][0], 1 if is_ask else -1
+            for slip in (0.0, 0.0002, 0.001, 0.005):
+                got = idx.size_for_slippage(slip)
+                limit = top * (1 + sign * slip)
+                total = sum(q for _, q in levels)
+                # 찾은 수량은 한도 안 (호가 전부면 순회 반올림 때문에 아주 조금 덜 먹은 지점에서 확인)
+                if got > 0:
+                    assert sign * (linear_vwap(levels, got * (1 - 1e-12)) - limit) <= abs(limit) * 1e-12
+                # 조금만 더 사면 한도 초과 (또는 호가 전부)
+                grid = [total * i / 500 for i in range(1, 500)]
+                ok = [a for a in grid if sign * (linear_vwap(levels, a) - limit) <= abs(limit) * 1e-12]
+                best = max(ok) if ok else 0.0
+                assert best <= got + total / 500 + 1e-12
+                assert got <= total + 1e-12
+
+
+def brute_spread_size(dom, bin_, usdt_krw, side, min_net_pct, max_amount, steps=1500):
+    hi = min(sum(q for _, q in dom), sum(q for _, q in bin_), max_amount)
+    best = 0.0
+    for i in range(1, steps + 1):
+        a = hi * i / steps * (1 - 1e-12)  # 호가 끝까지 먹는 지점은 순회 반올림으로 깊이 부족이 될 수 있음
+        prem = (linear_vwap(dom, a) / usdt_krw / linear_vwap(bin_, a) - 1) * 100
+        net = (prem if side == "SELL" else -prem) - bot.EDGE_BUFFER_FEE_PCT
+        if net >= min_net_pct:
+            best = a
+    return best, hi / steps
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("side", ["SELL", "BUY"])
+def test_solve_spread_size_matches_brute_force(seed, side):
+    rng = random.Random(seed)
+    usdt_krw = 1400.0
+    for _ in range(15):
+        depth = rng.randint(1, 15)
+        prem = rng.uniform(0.3, 3.0)
+        if side == "SELL":  # 국내 bids 에 팔고 바이낸스 asks 에서 삼
+            dom = synth_side(rng, 70000.0 * usdt_krw * (1 + prem / 100), depth, False, tick=0.001)
+            bin_ = synth_side(rng, 70000.0, depth, True, tick=0.001)
+        else:
+            dom = synth_side(rng, 70000.0 * usdt_krw * (1 - prem / 100), depth, True, tick=0.001)
+            bin_ = synth_side(rng, 70000.0, depth, False, tick=0.001)
+        max_amount = rng.uniform(0.1, 10.0)
+        got = bot.solve_spread_size(
+            bot.BookIndex(dom, side == "BUY"), bot.BookIndex(bin_, side == "SELL"), usdt_krw, side, 0.2, max_amount,
+        )
+        best, step = brute_spread_size(dom, bin_, usdt_krw, side, 0.2, max_amount)
+        assert got == pytest.approx(best, abs=step + 1e-9)
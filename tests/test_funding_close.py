@@ -0,0 +1,49 @@
+import pytest
+
+import bot
+
+
+class FutStub:
+    def __init__(self, ex_id, rate):
+        self.id = ex_id
+        self.rate = rate
+
+
+@pytest.fixture
+def open_position(monkeypatch, quiet_bot):
+    futs = {"binance_fut": FutStub("binanceusdm", 0.0001), "bybit_fut": FutStub("bybit", 0.0)}
+    monkeypatch.setattr(bot, "ex_fut", futs)
+    monkeypatch.setattr(bot, "cached_funding_rate", lambda e, symbol: {"fundingRate": e.rate, "recv_ts": bot.now_ts()})
+    monkeypatch.setattr(bot, "FUNDING_POS", {
+        "active": True, "short_ex": "binance_fut", "long_ex": "bybit_fut", "symbol": bot.FUTURES_SYMBOL,
+        "amount": 0.01, "open_spread": 0.009, "open_time": bot.now_ts() - 3600,
+    })
+    trades = []
+    monkeypatch.setattr(bot, "log_trade", lambda **kw: trades.append(kw))
+    monkeypatch.setattr(bot, "save_state", lambda: None)
+    return trades
+
+
+def test_close_both_legs_filled_resets_position(monkeypatch, open_position, quiet_bot):
+    monkeypatch.setattr(bot, "execute_two_legs", lambda a, b: (a[3], b[3]))
+    bot.funding_arbitrage_signals()
+    assert bot.FUNDING_POS["active"] is False
+    assert bot.FUNDING_POS["amount"] == 0.0
+    assert [t["side"] for t in open_position] == ["CLOSE"]
+
+
+def test_close_both_legs_failed_keeps_position(monkeypatch, open_position, quiet_bot):
+    monkeypatch.setattr(bot, "execute_two_legs", lambda a, b: (0.0, 0.0))
+    bot.funding_arbitrage_signals()
+    assert bot.FUNDING_POS["active"] is True
+    assert bot.FUNDING_POS["amount"] == pytest.approx(0.01)
+    assert open_position == []
+    assert any("CLOSE FAIL" in m for m in quiet_bot)
+
+
+def test_close_partial_fill_reduces_amount(monkeypatch, open_position, quiet_bot):
+    monkeypatch.setattr(bot, "execute_two_legs", lambda a, b: (0.004, 0.004))
+    bot.funding_arbitrage_signals()
+    assert bot.FUNDING_POS["active"] is True
+    assert bot.FUNDING_POS["amount"] == pytest.approx(0.006)
+    assert [(t["side"], t["amount"]) for t in open_position] == [("CLOSE_PARTIAL", 0.004)]
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def health(monkeypatch):
+    monkeypatch.setattr(bot, "HEALTH_ENABLED", True)
+    monkeypatch.setattr(bot, "HEALTH", {})
+    monkeypatch.setattr(bot, "DEADLINE_COUNT", {})
+    monkeypatch.setattr(bot, "_HEDGE_POOLS", {})
+
+
+def seed_latency(venue, call, dt, n=50):
+    for _ in range(n):
+        bot.health_observe(venue, call, dt, True)
+
+
+def test_token_wait_not_counted_against_deadline(monkeypatch, health):
+    """버킷이 막혀 토큰을 오래 기다려도 네트워크 호출이 빠르면 hedge/타임아웃 없음"""
+    seed_latency("upbit", "ticker", 0.01)
+    monkeypatch.setattr(bot, "rate_limit", lambda name, call, priority=None: time.sleep(0.8))
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.02)
+        return {"last": 1.0}
+
+    assert bot.hedged_read("upbit", "ticker", fetch) == {"last": 1.0}
+    assert len(calls) == 1
+    assert bot.HEALTH["upbit"]["ticker"].hedges == 0
+
+
+def test_no_hedge_without_free_token(monkeypatch, health):
+    seed_latency("upbit", "ticker", 0.01)
+    monkeypatch.setattr(bot, "try_rate_limit", lambda name, call, priority=None: False)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.15)
+        return 1
+
+    assert bot.hedged_read("upbit", "ticker", fetch) == 1
+    assert len(calls) == 1
+
+
+def test_hedge_returns_first_success(monkeypatch, health):
+    seed_latency("upbit", "ticker", 0.01)
+    gate = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            gate.wait(2)  # 첫 요청은 꼬리 지연
+            return "slow"
+        return "fast"
+
+    assert bot.hedged_read("upbit", "ticker", fetch) == "fast"
+    gate.set()
+    assert len(calls) == 2
+
+
+def test_local_deadline_does_not_disable_venue(monkeypatch, health):
+    seed_latency("bithumb", "ticker", 0.01)
+    monkeypatch.setattr(bot, "HEDGE_MAX_RATIO", 0.0)
+    monkeypatch.setattr(bot, "HEALTH_TIMEOUT_MIN_SEC", 0.1)
+
+    class Slow:
+        id = "bithumb"
+
+        def fetch_ticker(self, symbol):
+            time.sleep(0.5)
+            return {"bid": 1, "ask": 1}
+
+    monkeypatch.setattr(bot, "ex", {"bithumb": Slow()})
+    for _ in range(bot.ERROR_THRESHOLD + 1):
+        with pytest.raises(bot.ReadDeadlineExceeded):
+            bot._fetch_ticker_raw(bot.ex["bithumb"], "BTC/KRW")
+    assert not bot.is_exchange_disabled("bithumb")
+    assert bot.ERROR_COUNT.get("bithumb", 0) == 0
+    assert bot.DEADLINE_COUNT["bithumb"] == bot.ERROR_THRESHOLD + 1
+
+
+@pytest.fixture
+def hung_venue(monkeypatch, health):
+    """bithumb 조회가 응답 없이 멈춰서 거래소 풀 (2 스레드) 을 다 차지한 상태"""
+    monkeypatch.setattr(bot, "HEDGE_VENUE_WORKERS", 2)
+    monkeypatch.setattr(bot, "HEALTH_TIMEOUT_MIN_SEC", 0.1)
+    seed_latency("bithumb", "ticker", 0.01)
+    seed_latency("upbit", "ticker", 0.01)
+    gate = threading.Event()
+    for _ in range(2):
+        with pytest.raises(bot.ReadDeadlineExceeded):
+            bot.hedged_read("bithumb", "ticker", lambda: gate.wait(5))
+    yield gate
+    gate.set()
+    deadline = time.monotonic() + 2
+    while bot._HEDGE_POOLS["bithumb"].inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_hung_venue_does_not_starve_other_venues(hung_venue):
+    t0 = time.monotonic()
+    assert bot.hedged_read("upbit", "ticker", lambda: "ok") == "ok"
+    assert time.monotonic() - t0 < 0.1
+
+
+def test_pool_wait_counts_against_deadline(hung_venue):
+    calls = []
+    t0 = time.monotonic()
+    with pytest.raises(bot.ReadDeadlineExceeded, match="no free worker"):
+        bot.hedged_read("bithumb", "ticker", lambda: calls.append(1))
+    # 풀 스레드가 안 나면 call_timeout (0.1s) 안에 포기하고, 대기열에 남겨두지 않음
+    assert time.monotonic() - t0 < 0.5
+    assert bot._HEDGE_POOLS["bithumb"].inflight == 2
+    hung_venue.set()
+    time.sleep(0.05)
+    assert calls == []
+
+
+def test_no_hedge_without_free_worker(monkeypatch, health):
+    """재요청은 거래소 풀에 빈 스레드가 있을 때만 (멈춘 요청 뒤에 줄 세우지 않음)"""
+    monkeypatch.setattr(bot, "HEDGE_VENUE_WORKERS", 1)
+    seed_latency("upbit", "ticker", 0.01)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.15)
+        return 1
+
+    assert bot.hedged_read("upbit", "ticker", fetch) == 1
+    assert len(calls) == 1
+    assert bot.HEALTH["upbit"]["ticker"].hedges == 0
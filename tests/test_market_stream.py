@@ -0,0 +1,210 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import bot
+
+websockets = pytest.importorskip("websockets")
+from websockets.asyncio.server import serve
+
+
+class WsServer:
+    """로컬 웹소켓 서버. 접속 경로/구독 메시지를 기록하고 접속마다 script(path) 메시지를 보냄"""
+
+    def __init__(self, script):
+        self.script = script
+        self.paths, self.subs, self.conns = [], [], []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = self.run(self.start())
+        self.url = f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def start(self):
+        return await serve(self.handler, "127.0.0.1", 0)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(5)
+
+    async def handler(self, ws):
+        path = ws.request.path
+        self.paths.append(path)
+        self.conns.append(ws)
+        if "streams=" not in path:
+            self.subs.append(json.loads(await ws.recv()))
+        for msg in self.script(path):
+            await ws.send(json.dumps(msg))
+        await ws.wait_closed()
+
+    def drop(self):
+        """열린 접속 전부 끊기 (서버는 계속 listen)"""
+        async def close_all():
+            for ws in self.conns:
+                await ws.close()
+        self.run(close_all())
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.server.close()
+        self.run(self.server.wait_closed())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+class StreamClient:
+    """_stream_venue 를 별도 이벤트 루프에서 돌리고 테스트 끝에 취소"""
+
+    def __init__(self, venue, symbols, url):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.fut = asyncio.run_coroutine_threadsafe(bot._stream_venue(venue, symbols, url), self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.fut.cancel)
+        time.sleep(0.05)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+def wait_until(cond, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def upbit_script(path):
+    return [
+        {"type": "orderbook", "code": "KRW-BTC", "timestamp": 1_700_000_000_000,
+         "orderbook_units": [{"bid_price": 100.0, "bid_size": 1.0, "ask_price": 101.0, "ask_size": 2.0}]},
+        {"type": "ticker", "code": "KRW-BTC", "trade_price": 100.5},
+    ]
+
+
+def binance_script(path):
+    # lastUpdateId 가 줄어드는 스냅샷도 버려지면 안 됨 (시퀀스 번호지 시각이 아님)
+    return [
+        {"stream": "btcusdt@depth20@100ms", "data": {"lastUpdateId": 500, "bids": [["10.0", "1"]], "asks": [["10.1", "1"]]}},
+        {"stream": "btcusdt@depth20@100ms", "data": {"lastUpdateId": 7, "bids": [["11.0", "1"]], "asks": [["11.1", "1"]]}},
+        {"stream": "btcusdt@miniTicker", "data": {"c": "11.05"}},
+    ]
+
+
+@pytest.fixture
+def stream_state(monkeypatch):
+    monkeypatch.setattr(bot, "STREAM_BOOKS", {})
+    monkeypatch.setattr(bot, "STREAM_TICKERS", {})
+    monkeypatch.setattr(bot, "STREAM_STATUS", {})
+    monkeypatch.setattr(bot, "VOL_ENGINES", {})
+    monkeypatch.setattr(bot, "TRIGGER_VENUES", {})
+    monkeypatch.setattr(bot, "RECORDER", None)
+
+
+@pytest.fixture
+def ws_server(request, stream_state):
+    script = getattr(request, "param", upbit_script)
+    srv = WsServer(script)
+    yield srv
+    srv.close()
+
+
+@pytest.fixture
+def stream_client():
+    clients = []
+
+    def start(venue, symbols, url):
+        c = StreamClient(venue, symbols, url)
+        clients.append(c)
+        return c
+
+    yield start
+    for c in clients:
+        c.stop()
+
+
+def test_krw_stream_resubscribes_after_drop(ws_server, stream_client):
+    stream_client("upbit", ["BTC/KRW"], ws_server.url)
+    assert wait_until(lambda: bot.stream_ticker("upbit", "BTC/KRW") is not None)
+    t = bot.stream_ticker("upbit", "BTC/KRW")
+    assert (t["bid"], t["ask"], t["last"]) == (100.0, 101.0, 100.5)
+
+    ws_server.drop()
+    # 끊기면 해당 거래소 데이터를 비우고, 재접속 후 같은 구독을 다시 보내 첫 스냅샷으로 재동기화
+    assert wait_until(lambda: bot.STREAM_STATUS.get("upbit") == "down")
+    assert wait_until(lambda: len(ws_server.subs) == 2)
+    assert ws_server.subs[1] == ws_server.subs[0]
+    assert {"type": "orderbook", "codes": ["KRW-BTC"]} in ws_server.subs[1]
+    assert wait_until(lambda: bot.stream_ticker("upbit", "BTC/KRW") is not None)
+    assert bot.STREAM_STATUS["upbit"] == "connected"
+
+
+@pytest.mark.parametrize("ws_server", [binance_script], indirect=True)
+def test_binance_stream_uses_receive_time(ws_server, stream_client):
+    before_ms = time.time() * 1000
+    stream_client("binance", ["BTC/USDT"], ws_server.url)
+    assert wait_until(lambda: bot.stream_ticker("binance", "BTC/USDT") is not None)
+    assert "streams=btcusdt@depth20@100ms/btcusdt@miniTicker" in ws_server.paths[0]
+
+    t = bot.stream_ticker("binance", "BTC/USDT")
+    assert (t["bid"], t["ask"], t["last"]) == (11.0, 11.1, 11.05)
+    assert before_ms <= t["timestamp"] <= time.time() * 1000
+
+    ws_server.drop()
+    assert wait_until(lambda: len(ws_server.paths) == 2)
+    assert ws_server.paths[1] == ws_server.paths[0]
+    assert wait_until(lambda: bot.stream_ticker("binance", "BTC/USDT") is not None)
+
+
+class RestStub:
+    id = "upbit"
+
+    def __init__(self):
+        self.calls = []
+
+    def fetch_ticker(self, symbol):
+        self.calls.append("ticker")
+        return {"symbol": symbol, "bid": 90.0, "ask": 91.0, "last": 90.5}
+
+    def fetch_order_book(self, symbol, depth):
+        self.calls.append("orderbook")
+        return {"symbol": symbol, "bids": [[90.0, 3.0]], "asks": [[91.0, 4.0]], "timestamp": None}
+
+
+def test_rest_fallback_when_stream_down(monkeypatch, ws_server, stream_client):
+    monkeypatch.setattr(bot, "MARKET_CACHE", {})
+    rest = RestStub()
+    stream_client("upbit", ["BTC/KRW"], ws_server.url)
+    assert wait_until(lambda: bot.stream_ticker("upbit", "BTC/KRW") is not None)
+
+    # 스트림이 살아 있으면 REST 호출 없음
+    assert bot.safe_ticker(rest, "BTC/KRW")["last"] == 100.5
+    assert bot.safe_orderbook(rest, "BTC/KRW")["bids"] == [[100.0, 1.0]]
+    assert rest.calls == []
+
+    # 서버가 죽으면 스트림 데이터가 비워지고 재접속도 실패 → REST
+    ws_server.drop()
+    ws_server.close()
+    assert wait_until(lambda: bot.STREAM_STATUS.get("upbit") == "down")
+    assert bot.safe_ticker(rest, "BTC/KRW")["last"] == 90.5
+    assert bot.safe_orderbook(rest, "BTC/KRW")["bids"] == [[90.0, 3.0]]
+    assert rest.calls == ["ticker", "orderbook"]
+
+
+def test_stale_stream_falls_back_to_rest(monkeypatch, stream_state):
+    monkeypatch.setattr(bot, "MARKET_CACHE", {})
+    rest = RestStub()
+    bot._on_stream_book("upbit", "BTC/KRW", [[100.0, 1.0]], [[101.0, 2.0]], 1)
+    bot._on_stream_trade("upbit", "BTC/KRW", 100.5)
+    assert bot.safe_ticker(rest, "BTC/KRW")["last"] == 100.5
+
+    bot.STREAM_BOOKS[("upbit", "BTC/KRW")]["recv_ts"] -= bot.WS_MAX_AGE_SEC + 1
+    monkeypatch.setattr(bot, "MARKET_CACHE", {})
+    assert bot.safe_ticker(rest, "BTC/KRW")["last"] == 90.5
+    assert rest.calls == ["ticker"]
@@ -0,0 +1,166 @@
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+import bot
+
+np = pytest.importorskip("numpy")
+
+
+class PollStub:
+    has = {"fetchTickers": True}
+
+    def __init__(self):
+        self.calls = []
+
+    def fetch_tickers(self, symbols):
+        self.calls.append("tickers")
+        return {s: {"last": 100.0} for s in symbols}
+
+    def fetch_order_book(self, symbol, depth):
+        self.calls.append("orderbook")
+        return {"bids": [[99.0, 1.0]], "asks": [[101.0, 1.0]]}
+
+
+def test_worker_requests_draw_from_parent_bucket(monkeypatch):
+    """워커의 조회가 부모 버킷 토큰을 소모하는지 (별도 예산 아님)"""
+    monkeypatch.setattr(bot, "RATE_LIMIT_ENABLED", True)
+    bucket = bot.VenueBucket(1000, 1000, bot.RATE_LIMIT_RESERVE)
+    monkeypatch.setattr(bot, "_RL_BUCKETS", {"upbit": bucket})
+    parent, child = mp.Pipe()
+    server = threading.Thread(target=bot._md_token_server, args=("upbit", parent), daemon=True)
+    server.start()
+
+    symbols = ["BTC/KRW", "ETH/KRW"]
+    arr = np.zeros(len(symbols), dtype=bot.md_dtype(5))
+    inst = PollStub()
+    bot._md_poll("upbit", inst, symbols, {s: i for i, s in enumerate(symbols)}, arr, 5, child)
+
+    assert inst.calls == ["tickers", "orderbook", "orderbook"]
+    expected = sum(bot._call_weight("upbit", c) for c in inst.calls)
+    assert bucket.tokens == pytest.approx(1000 - expected, abs=1.0)
+    assert (arr["seq"] % 2 == 0).all() and (arr["seq"] > 0).all()
+
+    child.close()
+    server.join(timeout=2)
+    assert not server.is_alive()
+
+
+class Clock:
+    def __init__(self, t):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def shm_venue(monkeypatch):
+    """부모 쪽 MD_WORKERS 항목만 흉내 (프로세스 없이 배열에 직접 publish)"""
+    symbols = {"binance": ["BTC/USDT"], "upbit": ["USDT/KRW"]}
+    workers = {
+        v: {"arr": np.zeros(len(syms), dtype=bot.md_dtype(5)), "index": {s: i for i, s in enumerate(syms)}}
+        for v, syms in symbols.items()
+    }
+    clock = Clock(1_700_000_000.0)
+    monkeypatch.setattr(bot, "now_ts", clock)
+    monkeypatch.setattr(bot, "MD_WORKERS", workers)
+    monkeypatch.setattr(bot, "_MD_SEEN", {})
+    monkeypatch.setattr(bot, "VOL_ENGINES", {})
+
+    def publish(venue, symbol, bid, ask, last=None):
+        w = workers[venue]
+        ob = {"bids": [[bid, 1.0]], "asks": [[ask, 1.0]], "timestamp": int(clock.t * 1000)}
+        bot._md_publish(w["arr"], w["index"][symbol], clock.t, ob, last, 5)
+
+    return clock, publish
+
+
+def test_shm_quotes_feed_vol_engine(shm_venue):
+    clock, publish = shm_venue
+    prices = [60000.0, 60300.0, 59900.0, 60600.0, 60100.0]
+    for px in prices:
+        publish("binance", "BTC/USDT", px - 1, px + 1, px)
+        assert bot.shm_ticker("binance", "BTC/USDT")["last"] == px
+        bot.shm_ticker("binance", "BTC/USDT")  # 같은 레코드 재조회는 샘플 아님
+        clock.t += bot.VOL_BAR_SEC
+    eng = bot.VOL_ENGINES["BTC/USDT"]
+    assert eng.bar_close == prices[-1]
+    assert len(eng.rv) == len(prices) - 2
+    assert bot.get_realized_volatility() > 0
+
+
+def test_shm_quotes_mark_equity(monkeypatch, shm_venue):
+    clock, publish = shm_venue
+    units = {"KRW": 1_000_000.0, "USDT": 100.0, "BTC": 0.01, "ETH": 0.0}
+    marks = {"KRW": 1.0, "USDT": 1400.0, "BTC": 60000.0, "ETH": 3000.0}
+    monkeypatch.setattr(bot, "EQUITY", {"units": None, "marks": {}, "mark_ts": {}, "usd": 0.0, "value": 0.0})
+    bot.equity_reset(units, marks)
+    clock.t += 30
+
+    publish("binance", "BTC/USDT", 61999.0, 62001.0, 62000.0)
+    bot.shm_ticker("binance", "BTC/USDT")
+    assert bot.EQUITY["marks"]["BTC"] == 62000.0
+    # USDT 는 bid 로 마크 (get_usdt_krw 와 같은 기준)
+    publish("upbit", "USDT/KRW", 1410.0, 1411.0, 1410.5)
+    bot.shm_orderbook("upbit", "USDT/KRW")
+    assert bot.EQUITY["marks"]["USDT"] == 1410.0
+
+    value, age = bot.equity_snapshot()
+    assert value == pytest.approx(bot.equity_value(units, {**marks, "BTC": 62000.0, "USDT": 1410.0}))
+    assert bot.EQUITY["mark_ts"]["BTC"] == bot.EQUITY["mark_ts"]["USDT"] == clock.t
+
+
+class RecorderStub:
+    def __init__(self):
+        self.rows = []
+
+    def ticker(self, venue, symbol, bid, ask, last, ts=None):
+        self.rows.append(("ticker", venue, symbol, bid))
+
+    def book(self, venue, symbol, bids, asks, ts=None):
+        self.rows.append(("book", venue, symbol, bids[0][0]))
+
+    def fx(self, venue, rate, ts=None):
+        self.rows.append(("fx", venue, rate))
+
+
+def test_watcher_feeds_recorder_and_book_trigger(monkeypatch, shm_venue):
+    """워커 레코드도 웹소켓 스냅샷처럼 레코더 / 오더북 트리거로 (레이어가 읽기 전에)"""
+    clock, publish = shm_venue
+    rec = RecorderStub()
+    monkeypatch.setattr(bot, "RECORDER", rec)
+    monkeypatch.setattr(bot, "PENDING_TRIGGERS", set())
+    monkeypatch.setattr(bot, "LAST_EVAL_MID", {})
+    monkeypatch.setattr(bot, "MARKET_EVENT", threading.Event())
+    stop = threading.Event()
+    monkeypatch.setattr(bot, "_MD_STOP", stop)
+    monkeypatch.setattr(bot, "MP_POLL_SEC", 0.04)
+    watcher = threading.Thread(target=bot._md_watch, daemon=True)
+    watcher.start()
+    try:
+        publish("binance", "BTC/USDT", 59999.0, 60001.0, 60000.0)
+        assert bot.MARKET_EVENT.wait(0.05) is False
+        deadline = time.time() + 2
+        while ("book", "binance", "BTC/USDT", 59999.0) not in rec.rows and time.time() < deadline:
+            time.sleep(0.01)
+        assert ("ticker", "binance", "BTC/USDT", 59999.0) in rec.rows
+        assert not bot.PENDING_TRIGGERS  # 첫 mid 는 기준값
+
+        clock.t += 1
+        publish("binance", "BTC/USDT", 60199.0, 60201.0, 60200.0)  # +0.33%
+        assert bot.MARKET_EVENT.wait(2)
+        assert bot.PENDING_TRIGGERS == {"spread"}
+        publish("upbit", "USDT/KRW", 1410.0, 1411.0)
+        deadline = time.time() + 2
+        while ("fx", "upbit", 1410.0) not in rec.rows and time.time() < deadline:
+            time.sleep(0.01)
+        assert ("fx", "upbit", 1410.0) in rec.rows
+    finally:
+        stop.set()
+        watcher.join(2)
+    assert not watcher.is_alive()
+    # 같은 레코드는 한 번만 기록
+    assert sum(r[0] == "book" and r[1] == "binance" for r in rec.rows) == 2
@@ -0,0 +1,87 @@
+import math
+import random
+
+import pytest
+
+import bot
+
+
+# 기존(list) 구현 그대로 — RollingWindow 가 같은 값을 내는지 비교용
+def baseline_update(arr: list, prem: float, window: int):
+    arr.append(prem)
+    if len(arr) > window:
+        arr.pop(0)
+
+
+def baseline_z(arr: list, prem: float):
+    mean = sum(arr) / len(arr)
+    var = sum((x - mean) ** 2 for x in arr) / len(arr)
+    std = var ** 0.5
+    if std <= 1e-9:
+        return None
+    return (prem - mean) / std
+
+
+def baseline_speed(ph: list) -> float:
+    if len(ph) < 3:
+        return 0.0
+    return (ph[-1] - ph[0]) / (abs(ph[0]) + 1e-9)
+
+
+@pytest.mark.parametrize("window", [1, 3, 10, 100])
+@pytest.mark.parametrize("scale,noise", [(0.0, 1.5), (1.2, 0.05), (95_000_000.0, 20_000.0)])
+def test_matches_list_implementation(window, scale, noise):
+    """프리미엄(%) / 원화 가격 크기 모두에서 평균·표준편차·z 가 기존 list 계산과 일치"""
+    rng = random.Random(window * 31 + int(scale))
+    rw, ref = bot.RollingWindow(window), []
+    for i in range(window * 7 + 5):
+        x = scale + rng.gauss(0.0, noise)
+        rw.append(x)
+        baseline_update(ref, x, window)
+        assert len(rw) == len(ref)
+        assert rw.first() == ref[0] and rw.last() == ref[-1]
+        mean = sum(ref) / len(ref)
+        assert rw.mean() == pytest.approx(mean, rel=1e-12, abs=1e-12)
+        std = math.sqrt(sum((v - mean) ** 2 for v in ref) / len(ref))
+        assert rw.std() == pytest.approx(std, rel=1e-6, abs=noise * 1e-6)
+        probe = scale + rng.gauss(0.0, noise * 2)
+        z_ref = baseline_z(ref, probe)
+        if z_ref is not None and std > noise * 1e-3:
+            assert rw.zscore(probe) == pytest.approx(z_ref, rel=1e-6)
+
+
+def test_constant_window_has_no_zscore():
+    rw = bot.RollingWindow(20)
+    for _ in range(50):
+        rw.append(1.25)
+    assert rw.std() == 0.0
+    assert rw.zscore(1.3) is None
+
+
+def test_z_score_filter_and_price_speed_match_baseline(monkeypatch):
+    monkeypatch.setattr(bot, "Z_SCORE_ENABLED", True)
+    monkeypatch.setattr(bot, "price_history", {})
+    rng = random.Random(5)
+    hist, ref = {}, []
+    ph_ref = []
+    decided = 0
+    for i in range(2000):
+        prem = 1.0 + rng.gauss(0.0, 0.3) + (2.0 if i % 97 == 0 else 0.0)
+        # 최소 샘플 수(10) 이전엔 둘 다 통과
+        z_ref = baseline_z(ref, prem) if len(ref) >= 10 else None
+        got = bot.z_score_filter(hist, "BTC", prem)
+        if len(ref) < 10:
+            assert got is True
+        elif z_ref is None:
+            assert got is False
+        elif abs(abs(z_ref) - bot.Z_SCORE_THR) > 1e-9:
+            assert got == (abs(z_ref) >= bot.Z_SCORE_THR)
+            decided += 1
+        bot.update_premium_history(hist, "BTC", prem)
+        baseline_update(ref, prem, bot.Z_SCORE_WINDOW)
+
+        px = 95_000_000.0 + rng.gauss(0.0, 50_000.0)
+        bot.record_price("upbit", px)
+        baseline_update(ph_ref, px, bot.PRICE_HISTORY_LEN)
+        assert bot.price_speed("upbit") == pytest.approx(baseline_speed(ph_ref), rel=1e-12, abs=1e-15)
+    assert decided > 1500
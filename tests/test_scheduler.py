@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import bot
+
+
+class VenueStub:
+    def __init__(self, ex_id, mids):
+        self.id = ex_id
+        self.mids = list(mids)
+
+    def fetch_order_book(self, symbol, depth):
+        mid = self.mids.pop(0)
+        return {"bids": [[mid - 1.0, 1.0]], "asks": [[mid + 1.0, 1.0]]}
+
+
+@pytest.fixture
+def triggers(monkeypatch):
+    monkeypatch.setattr(bot, "PENDING_TRIGGERS", set())
+    monkeypatch.setattr(bot, "LAST_EVAL_MID", {})
+    monkeypatch.setattr(bot, "LAST_MID", {})
+    monkeypatch.setattr(bot, "MARKET_EVENT", threading.Event())
+    monkeypatch.setattr(bot, "RECORDER", None)
+
+
+def test_rest_orderbook_fill_fires_trigger(triggers):
+    """웹소켓이 꺼져 있어도 REST 오더북 조회가 트리거를 깨움"""
+    e = VenueStub("upbit", [95_000_000.0, 95_010_000.0, 95_100_000.0])
+    bot._fetch_orderbook_raw(e, "BTC/KRW", 5)
+    assert not bot.PENDING_TRIGGERS  # 첫 mid 는 기준값
+    bot._fetch_orderbook_raw(e, "BTC/KRW", 5)  # +0.01% → 임계값 미만
+    assert not bot.MARKET_EVENT.is_set()
+    bot._fetch_orderbook_raw(e, "BTC/KRW", 5)  # +0.1%
+    assert bot.PENDING_TRIGGERS == {"spread", "krw"}
+    assert bot.MARKET_EVENT.is_set()
+
+
+def test_ticker_quote_fires_trigger(monkeypatch, triggers):
+    monkeypatch.setattr(bot, "equity_mark", lambda *a: None)
+    monkeypatch.setattr(bot, "vol_observe", lambda *a: None)
+    bot.observe_ticker("binance", "BTC/USDT", 59999.0, 60001.0, 60000.0)
+    bot.observe_ticker("binance", "BTC/USDT", None, None, 61000.0)  # 호가 없는 시세는 무시
+    bot.observe_ticker("binance", "BTC/USDT", 60009.0, 60011.0, 60010.0)
+    assert not bot.PENDING_TRIGGERS
+    bot.observe_ticker("binance", "BTC/USDT", 60099.0, 60101.0, 60100.0)
+    assert bot.PENDING_TRIGGERS == {"spread"}  # 바이낸스는 krw 레이어 대상 아님
+
+
+def test_mark_evaluated_uses_latest_mid_from_any_source(triggers):
+    e = VenueStub("upbit", [95_000_000.0, 95_100_000.0])
+    bot._fetch_orderbook_raw(e, "BTC/KRW", 5)
+    bot._fetch_orderbook_raw(e, "BTC/KRW", 5)
+    assert bot.LAST_EVAL_MID[("krw", "upbit", "BTC/KRW")] == 95_000_000.0
+    bot._mark_layer_evaluated("krw")
+    # 평가한 레이어만 기준값 갱신
+    assert bot.LAST_EVAL_MID[("krw", "upbit", "BTC/KRW")] == 95_100_000.0
+    assert bot.LAST_EVAL_MID[("spread", "upbit", "BTC/KRW")] == 95_000_000.0
+
+
+def test_take_triggers_keeps_debounced(triggers):
+    bot.PENDING_TRIGGERS.update({"spread", "krw"})
+    last_run = {"spread": 99.0, "krw": 90.0, "funding": 0.0}
+    next_due = {"spread": 200.0, "krw": 200.0, "funding": 300.0}
+    assert bot.take_triggers(["spread", "krw", "funding"], 100.0, next_due, last_run) == {"krw"}
+    assert bot.PENDING_TRIGGERS == {"spread"}
+    # 타이머가 돌아온 레이어는 디바운스 중이어도 같이 꺼냄 (어차피 이번에 평가)
+    next_due["spread"] = 100.0
+    assert bot.take_triggers(["spread", "krw", "funding"], 100.0, next_due, last_run) == {"spread"}
+    assert not bot.PENDING_TRIGGERS
+
+
+class RacySet(set):
+    """메인 루프가 PENDING_TRIGGERS 를 훑는 도중 스트림 스레드가 트리거를 넣는 상황 재현"""
+    producer = None
+
+    def __iter__(self):
+        if self.producer is None:
+            self.producer = threading.Thread(target=bot.check_book_trigger, args=("binance", "BTC/USDT", 60100.0))
+            self.producer.start()
+            self.producer.join(0.1)
+        return super().__iter__()
+
+
+def test_trigger_added_while_taking_is_not_lost(monkeypatch, triggers):
+    pending = RacySet({"krw"})
+    monkeypatch.setattr(bot, "PENDING_TRIGGERS", pending)
+    bot.LAST_EVAL_MID[("spread", "binance", "BTC/USDT")] = 60000.0
+    taken = bot.take_triggers(["spread", "krw"], 100.0, {"spread": 200.0, "krw": 200.0}, {"spread": 0.0, "krw": 0.0})
+    pending.producer.join(2)
+    assert taken == {"krw"}
+    assert set(pending) == {"spread"}
+    assert bot.MARKET_EVENT.is_set()
+
+
+def test_event_only_on_new_trigger(triggers):
+    """디바운스로 대기 중인 동안 계속 움직이는 시세가 이벤트를 다시 울리지 않음"""
+    bot.check_book_trigger("binance", "BTC/USDT", 60000.0)
+    bot.check_book_trigger("binance", "BTC/USDT", 60100.0)
+    assert bot.MARKET_EVENT.is_set()
+    bot.MARKET_EVENT.clear()
+    for i in range(20):
+        bot.check_book_trigger("binance", "BTC/USDT", 60200.0 + i * 50)
+    assert not bot.MARKET_EVENT.is_set()
+    assert bot.PENDING_TRIGGERS == {"spread"}
+    # 꺼낸 뒤의 움직임은 새 트리거
+    bot.take_triggers(["spread"], 100.0, {"spread": 200.0}, {"spread": 0.0})
+    bot.check_book_trigger("binance", "BTC/USDT", 61500.0)
+    assert bot.MARKET_EVENT.is_set()
+
+
+def test_wait_until_debounce_deadline(triggers):
+    next_due = {"spread": 130.0, "funding": 400.0}
+    last_run = {"spread": 99.5, "funding": 100.0}
+    assert bot.scheduler_wait(100.0, next_due, last_run) == pytest.approx(30.0)
+    bot.PENDING_TRIGGERS.add("spread")
+    assert bot.scheduler_wait(100.0, next_due, last_run) == pytest.approx(99.5 + bot.SCHEDULER_MIN_GAP_SEC - 100.0)
+    bot.PENDING_TRIGGERS.add("tri")  # 꺼진 레이어 트리거는 무시
+    assert bot.scheduler_wait(100.0, next_due, last_run) == pytest.approx(1.5)
@@ -0,0 +1,170 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+import bot
+
+np = pytest.importorskip("numpy")
+
+
+# 기존 심볼별/거래소별 루프 (run_spread_arbitrage 의 판정 부분) 그대로 — 벡터화 엔진과 비교용
+def baseline_calc_vwap(levels, amount):
+    remain, cost = amount, 0.0
+    for price, vol in levels:
+        use = min(vol, remain)
+        cost += price * use
+        remain -= use
+        if remain <= 0:
+            break
+    if remain > 0:
+        return None
+    return cost / amount
+
+
+def baseline_z_pass(arr, prem):
+    if len(arr) < 10:
+        return True
+    mean = sum(arr) / len(arr)
+    var = sum((x - mean) ** 2 for x in arr) / len(arr)
+    std = var ** 0.5
+    if std <= 1e-9:
+        return False
+    return abs((prem - mean) / std) >= bot.Z_SCORE_THR
+
+
+def baseline_symbol(symbol, books, base_usdt, usdt_krw, amount, tier1_thr, base_ratio, hist):
+    out = []
+    for venue in bot.SPREAD_VENUES:
+        ob = books.get(venue)
+        if not ob:
+            continue
+        top_bid, top_ask = ob["bids"][0][0], ob["asks"][0][0]
+        vwap_sell = baseline_calc_vwap(ob["bids"], amount)
+        vwap_buy = baseline_calc_vwap(ob["asks"], amount)
+        sell_prem = buy_prem = None
+        if vwap_sell and abs(vwap_sell - top_bid) / top_bid <= bot.SLIPPAGE_LIMIT_PCT:
+            sell_prem = (vwap_sell / usdt_krw / base_usdt - 1) * 100
+        if vwap_buy and abs(vwap_buy - top_ask) / top_ask <= bot.SLIPPAGE_LIMIT_PCT:
+            buy_prem = (vwap_buy / usdt_krw / base_usdt - 1) * 100
+        for prem in (sell_prem, buy_prem):
+            if prem is not None:
+                hist[symbol].append(prem)
+                if len(hist[symbol]) > bot.Z_SCORE_WINDOW:
+                    hist[symbol].pop(0)
+        needed = bot.EDGE_BUFFER_FEE_PCT + bot.EDGE_BUFFER_SLIPPAGE_PCT + bot.EDGE_MIN_NET_PCT
+        for side, prem, vwap in (("SELL", sell_prem, vwap_sell), ("BUY", buy_prem, vwap_buy)):
+            if prem is None or abs(prem) < needed or not baseline_z_pass(hist[symbol], prem):
+                continue
+            p = prem if side == "SELL" else -prem
+            if p >= tier1_thr:
+                out.append((symbol, venue, side, "TIER1", base_ratio, prem, vwap))
+            elif p >= bot.TIER2_THR:
+                out.append((symbol, venue, side, "TIER2", base_ratio * bot.TIER2_RATIO_FACTOR, prem, vwap))
+    return out
+
+
+def synth_book(rng, mid, depth, tick):
+    bids = [[mid * (1 - tick * (k + 0.5)), rng.uniform(0.001, 0.02)] for k in range(depth)]
+    asks = [[mid * (1 + tick * (k + 0.5)), rng.uniform(0.001, 0.02)] for k in range(depth)]
+    return {"bids": bids, "asks": asks}
+
+
+def make_round(rng, symbols, usdt_krw):
+    """심볼별 바이낸스 가격 + 거래소별 오더북 (가끔 없음 / 얇음 / 슬리피지 큼)"""
+    rows = {}
+    for symbol in symbols:
+        base = rng.uniform(10.0, 60000.0)
+        books = {}
+        for venue in bot.SPREAD_VENUES:
+            if rng.random() < 0.1:
+                continue
+            prem = rng.gauss(0.0, 1.2) + (rng.choice([-3.0, 3.0]) if rng.random() < 0.05 else 0.0)
+            depth = rng.randint(1, bot.SPREAD_BOOK_DEPTH)
+            tick = rng.choice([0.00005, 0.0002, 0.001])
+            books[venue] = synth_book(rng, base * usdt_krw * (1 + prem / 100), depth, tick)
+        rows[symbol] = (base, books)
+    return rows
+
+
+def to_snapshot(rows, symbols, amount):
+    S, V, D = len(symbols), len(bot.SPREAD_VENUES), bot.SPREAD_BOOK_DEPTH
+    snap = {
+        "symbols": list(symbols),
+        "base_usdt": np.array([rows[s][0] for s in symbols]),
+        "amount": np.full((S, V), np.nan),
+        "bids_px": np.full((S, V, D), np.nan),
+        "bids_qty": np.zeros((S, V, D)),
+        "asks_px": np.full((S, V, D), np.nan),
+        "asks_qty": np.zeros((S, V, D)),
+    }
+    for i, s in enumerate(symbols):
+        for j, venue in enumerate(bot.SPREAD_VENUES):
+            ob = rows[s][1].get(venue)
+            if ob is None:
+                continue
+            snap["amount"][i, j] = amount
+            for side in ("bids", "asks"):
+                arr = np.asarray(ob[side], dtype=float)
+                snap[side + "_px"][i, j, :len(arr)] = arr[:, 0]
+                snap[side + "_qty"][i, j, :len(arr)] = arr[:, 1]
+    return snap
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engine_matches_per_symbol_loop(monkeypatch, capsys, seed):
+    monkeypatch.setattr(bot, "SPREAD_PREM_HISTORY", {})
+    monkeypatch.setattr(bot, "Z_SCORE_ENABLED", True)
+    rng = random.Random(seed)
+    symbols = ["BTC", "ETH", "XRP", "SOL", "DOGE", "ADA"]
+    usdt_krw, tier1_thr, base_ratio, amount = 1400.0, 1.0, 0.3, 0.01
+    hist = defaultdict(list)
+    n_opps = 0
+    for _ in range(150):
+        rows = make_round(rng, symbols, usdt_krw)
+        expected = []
+        for s in symbols:
+            base, books = rows[s]
+            expected += baseline_symbol(s, books, base, usdt_krw, amount, tier1_thr, base_ratio, hist)
+        got = bot.spread_premium_engine(to_snapshot(rows, symbols, amount), usdt_krw, tier1_thr, base_ratio)
+        got_keys = sorted((o["symbol"], o["venue"], o["side"], o["tier"]) for o in got)
+        assert got_keys == sorted(e[:4] for e in expected)
+        by_key = {(o["symbol"], o["venue"], o["side"]): o for o in got}
+        for symbol, venue, side, tier, ratio, prem, vwap in expected:
+            o = by_key[(symbol, venue, side)]
+            assert o["ratio"] == pytest.approx(ratio)
+            assert o["prem"] == pytest.approx(prem, rel=1e-9, abs=1e-9)
+            assert o["vwap"] == pytest.approx(vwap, rel=1e-12)
+        # 엔진 순위: 엣지 큰 순
+        edges = [o["edge"] for o in got]
+        assert edges == sorted(edges, reverse=True)
+        n_opps += len(got)
+        capsys.readouterr()
+    assert n_opps > 20
+    for s in symbols:
+        assert list(bot.SPREAD_PREM_HISTORY[s].buf) == pytest.approx(hist[s])
+
+
+@pytest.mark.parametrize("missing", ["binance", "upbit"])
+def test_missing_ledger_balance_skips_opportunity(monkeypatch, quiet_bot, missing):
+    """원장 잔고가 아직 없으면 (어느 쪽이든) 기회만 건너뜀 — 주문 / 에러 알림 없음"""
+    seeded = {"binance": {"USDT": {"free": 1000.0, "total": 1000.0}}, "upbit": {"KRW": {"free": 1e7, "total": 1e7}}}
+    seeded.pop(missing)
+    monkeypatch.setattr(bot, "BALANCE_LEDGER", seeded)
+    monkeypatch.setattr(bot, "LEDGER_DIRTY", set())
+    monkeypatch.setattr(bot, "ex", {"binance": object(), "upbit": object()})
+    monkeypatch.setattr(bot, "execute_two_legs", lambda *legs: pytest.fail("order placed"))
+    opp = {
+        "symbol": "BTC", "venue": "upbit", "side": "SELL", "tier": "TIER1", "ratio": 0.3,
+        "prem": 2.0, "vwap": 95_000_000.0, "base_usdt": 68_000.0, "usdt_krw": 1370.0,
+        "edge": 1.0, "weight": 1.0,
+    }
+    monkeypatch.setattr(bot, "spread_snapshot", lambda symbols: {})
+    monkeypatch.setattr(bot, "update_premium_features", lambda snap, usdt_krw: None)
+    monkeypatch.setattr(bot, "spread_premium_engine", lambda *a: [opp])
+    monkeypatch.setattr(bot, "get_usdt_krw", lambda: 1370.0)
+    monkeypatch.setattr(bot, "disable_trading", False)
+    monkeypatch.setattr(bot, "ENABLE_LAYER_SPREAD_ARB", True)
+    bot.run_spread_arbitrage(["BTC"], 1.0, 0.3, [])
+    assert quiet_bot == []
+    assert bot.LEDGER_DIRTY == {missing}  # 다음 reconcile 때 다시 받아옴
@@ -0,0 +1,52 @@
+import queue
+
+import pytest
+
+import bot
+
+# conftest 가 bot.send_telegram 을 바꾸기 전 (수집 시점) 의 실제 함수
+send_telegram = bot.send_telegram
+
+
+class WorkerStub:
+    def is_alive(self):
+        return True
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    q = queue.Queue()
+    monkeypatch.setattr(bot, "_TG_QUEUE", q)
+    monkeypatch.setattr(bot, "_TG_LAST_SENT", {})
+    monkeypatch.setattr(bot, "_TG_SUPPRESSED", {})
+    monkeypatch.setattr(bot, "_TG_THREAD", WorkerStub())  # 실제 전송 스레드는 띄우지 않음
+    return lambda: [q.get_nowait() for _ in range(q.qsize())]
+
+
+def test_identical_trade_lines_are_all_sent(outbox):
+    msg = "[BTC] upbit SELL TIER1 prem=1.20% amt=0.010000 net_pnl=1500 DRY_RUN=True"
+    for _ in range(3):
+        send_telegram(msg)
+    send_telegram("[LEG] unwind binance sell 0.01 → fills 0.01/0.0")
+    send_telegram("[LEG] unwind binance sell 0.01 → fills 0.01/0.0")
+    assert outbox() == [msg] * 3 + ["[LEG] unwind binance sell 0.01 → fills 0.01/0.0"] * 2
+
+
+def test_repeated_alerts_are_suppressed_and_counted(outbox, capsys):
+    for _ in range(4):
+        send_telegram("[MAIN ERR] timeout")
+    send_telegram("[RISK] upbit 에러 5회 이상 → 300s 동안 비활성화")
+    assert outbox() == ["[MAIN ERR] timeout", "[RISK] upbit 에러 5회 이상 → 300s 동안 비활성화"]
+    assert bot._TG_SUPPRESSED == {"[MAIN ERR] timeout": 3}
+    assert "duplicate suppressed (x3): [MAIN ERR] timeout" in capsys.readouterr().out
+
+
+def test_alert_sent_again_after_dedup_window(monkeypatch, outbox):
+    clock = {"t": 1000.0}
+    monkeypatch.setattr(bot.time, "time", lambda: clock["t"])
+    send_telegram("[ARB ERR] SPREAD: boom")
+    clock["t"] += bot.TELEGRAM_DEDUP_SEC - 1
+    send_telegram("[ARB ERR] SPREAD: boom")
+    clock["t"] += 2
+    send_telegram("[ARB ERR] SPREAD: boom")
+    assert outbox() == ["[ARB ERR] SPREAD: boom"] * 2
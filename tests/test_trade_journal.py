@@ -0,0 +1,71 @@
+import csv
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import bot
+
+np = pytest.importorskip("numpy")
+
+MIDNIGHT = datetime(2026, 3, 2, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def journal(monkeypatch, tmp_path):
+    clock = {"t": MIDNIGHT - 3600}
+    monkeypatch.setattr(bot, "now_ts", lambda: clock["t"])
+    monkeypatch.setattr(bot, "TRADE_LOG_FLUSH_ROWS", 1000)
+    monkeypatch.setattr(bot, "TRADE_LOG_FLUSH_SEC", 1e9)
+    monkeypatch.setattr(bot, "TRADE_LOG_NPY_CHUNK_ROWS", 5)
+    j = bot.TradeJournal(str(tmp_path / "trades.csv"), str(tmp_path / "npy"))
+    monkeypatch.setattr(bot, "TRADE_JOURNAL", j)
+    yield clock, j, tmp_path
+    j.close()
+
+
+def trade(clock, dt=1.0, pnl=100.0):
+    clock["t"] += dt
+    bot.log_trade("spread", "BTC", "upbit", "SELL", "TIER1", 1.2, 1_000_000, 0.01, pnl, 10.0, pnl - 10.0)
+
+
+def npy_files(tmp_path, day):
+    d = tmp_path / "npy" / day
+    return sorted(os.listdir(d)) if d.exists() else []
+
+
+def csv_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))[1:]
+
+
+def test_flush_per_pass_does_not_write_tiny_npy_files(journal):
+    clock, j, tmp_path = journal
+    for _ in range(12):
+        trade(clock)
+        bot.flush_trade_log()  # 메인 루프가 매 스케줄러 패스마다 부름
+    assert len(csv_rows(tmp_path / "trades.csv")) == 12  # CSV 는 flush 마다 디스크로
+    assert npy_files(tmp_path, "2026-03-01") == ["trades.000000.npy", "trades.000001.npy"]
+    j.close()
+    files = npy_files(tmp_path, "2026-03-01")
+    assert len(files) == 3
+    arr = np.concatenate([np.load(tmp_path / "npy" / "2026-03-01" / f) for f in files])
+    assert len(arr) == 12 and list(arr["ts"]) == sorted(arr["ts"])
+
+
+def test_batch_spanning_midnight_is_split_by_day(journal):
+    clock, j, tmp_path = journal
+    clock["t"] = MIDNIGHT - 2.0
+    trade(clock, pnl=1.0)  # 23:59:59
+    trade(clock, pnl=2.0)  # 00:00:00
+    trade(clock, pnl=3.0)
+    bot.flush_trade_log()
+    old = csv_rows(tmp_path / "trades.2026-03-01.csv")
+    assert [r[10] for r in old] == ["1"]
+    assert [r[10] for r in csv_rows(tmp_path / "trades.csv")] == ["2", "3"]
+    # 지난 날짜 청크는 날짜가 바뀌는 즉시, 새 날짜는 close 때
+    assert npy_files(tmp_path, "2026-03-01") == ["trades.000000.npy"]
+    assert np.load(tmp_path / "npy" / "2026-03-01" / "trades.000000.npy")["gross_pnl_krw"].tolist() == [1.0]
+    assert npy_files(tmp_path, "2026-03-02") == []
+    j.close()
+    assert np.load(tmp_path / "npy" / "2026-03-02" / "trades.000000.npy")["gross_pnl_krw"].tolist() == [2.0, 3.0]
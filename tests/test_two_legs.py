@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+import bot
+
+
+class VenueStub:
+    def __init__(self, ex_id):
+        self.id = ex_id
+
+
+@pytest.fixture
+def orders(monkeypatch):
+    """
+    place_market_order 대체. script[(거래소, side)] 에 응답을 순서대로 넣어 둠
+    (숫자 = 체결 수량, Exception = 주문 실패). 비어 있으면 요청 수량 전부 체결.
+    """
+    calls, script, lock = [], {}, threading.Lock()
+
+    def place(inst, symbol, side, amount, price=None, priority="order"):
+        with lock:
+            calls.append((inst.id, side, round(amount, 12), priority))
+            queue = script.get((inst.id, side))
+            res = queue.pop(0) if queue else amount
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    monkeypatch.setattr(bot, "place_market_order", place)
+    return calls, script
+
+
+KRW = VenueStub("upbit")
+BIN = VenueStub("binance")
+LEG_KRW = (KRW, "BTC/KRW", "sell", 0.01, 95_000_000.0)
+LEG_BIN = (BIN, "BTC/USDT", "buy", 0.01, 68_000.0)
+
+
+def test_both_filled_no_extra_orders(orders):
+    calls, script = orders
+    assert bot.execute_two_legs(LEG_KRW, LEG_BIN) == (0.01, 0.01)
+    assert sorted(calls) == [("binance", "buy", 0.01, "order"), ("upbit", "sell", 0.01, "order")]
+
+
+def test_both_legs_fail_returns_zero_without_hedging(orders, quiet_bot):
+    calls, script = orders
+    script[("upbit", "sell")] = [Exception("insufficient funds")]
+    script[("binance", "buy")] = [Exception("timeout")]
+    # 두 레그 모두 0 → 불일치 아님: top-up / unwind 주문 없이 (0, 0), 호출부는 effective_amt 0 으로 스킵
+    assert bot.execute_two_legs(LEG_KRW, LEG_BIN) == (0.0, 0.0)
+    assert len(calls) == 2
+    assert quiet_bot == []
+
+
+def test_one_leg_fails_top_up_fills(orders, quiet_bot):
+    calls, script = orders
+    script[("upbit", "sell")] = [Exception("rejected"), 0.01]
+    assert bot.execute_two_legs(LEG_KRW, LEG_BIN) == (0.01, 0.01)
+    assert calls[2:] == [("upbit", "sell", 0.01, "hedge")]
+    assert quiet_bot == []
+
+
+def test_one_leg_fails_and_top_up_fails_unwinds_other_leg(orders, quiet_bot):
+    calls, script = orders
+    script[("upbit", "sell")] = [Exception("rejected"), Exception("rejected again")]
+    fa, fb = bot.execute_two_legs(LEG_KRW, LEG_BIN)
+    # 바이낸스에서 산 0.01 을 되팔아서 노출 0
+    assert (fa, fb) == (0.0, 0.0)
+    assert calls[2:] == [("upbit", "sell", 0.01, "hedge"), ("binance", "sell", 0.01, "hedge")]
+    assert any("unwind" in m for m in quiet_bot)
+
+
+def test_unwind_fails_reports_mismatch(orders, quiet_bot):
+    calls, script = orders
+    script[("binance", "buy")] = [Exception("rejected"), Exception("rejected")]
+    script[("upbit", "buy")] = [Exception("rejected")]
+    fa, fb = bot.execute_two_legs(LEG_KRW, LEG_BIN)
+    # 정리도 실패하면 실제 체결 그대로 리턴 → 호출부 min() = 0, 남은 노출은 텔레그램으로 알림
+    assert (fa, fb) == (0.01, 0.0)
+    assert min(fa, fb) == 0.0
+    assert calls[2:] == [("binance", "buy", 0.01, "hedge"), ("upbit", "buy", 0.01, "hedge")]
+    assert any("unwind" in m and "0.01/0.0" in m for m in quiet_bot)
+
+
+def test_partial_fill_tops_up_difference(orders):
+    calls, script = orders
+    script[("binance", "buy")] = [0.006]
+    assert bot.execute_two_legs(LEG_KRW, LEG_BIN) == (0.01, pytest.approx(0.01))
+    assert calls[2:] == [("binance", "buy", 0.004, "hedge")]